@@ -0,0 +1,249 @@
+#!/bin/python3
+"""
+Measures what a seccomp filter costs per syscall. The static part counts the
+BPF instructions every syscall of an Electron sized allowlist runs through,
+for the decision tree sandbox-manager emits and for a plain compare chain.
+The runtime part times syscall heavy workloads under bwrap without a filter
+and with both layouts, and reports the added nanoseconds per syscall.
+
+    python3 benchmarks/seccomp.py [--runtime] [--direct]
+
+With --direct the filter is installed with prctl instead of bwrap, for
+machines where bwrap cannot create a sandbox.
+"""
+
+import argparse, ctypes, json, os, statistics, struct, subprocess, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src import BWRAP
+from src.seccomp import (compile_policy, machine, BPF_LD_W_ABS, BPF_JMP_JA,
+                         BPF_JMP_JEQ_K, BPF_JMP_JGT_K, BPF_JMP_JGE_K,
+                         BPF_JMP_JSET_K, BPF_RET_K, HOT_SYSCALLS)
+from src.syscalls import AUDIT_ARCH, SYSCALLS
+
+# What an Electron application typically uses, in the order a generated
+# policy lists them
+ELECTRON_SYSCALLS = """
+read write open close stat fstat lstat poll lseek mmap mprotect munmap brk
+rt_sigaction rt_sigprocmask rt_sigreturn ioctl pread64 pwrite64 readv writev
+access pipe select sched_yield mremap msync mincore madvise shmget shmat
+shmctl dup dup2 nanosleep getitimer setitimer getpid sendfile socket connect
+accept sendto recvfrom sendmsg recvmsg shutdown bind listen getsockname
+getpeername socketpair setsockopt getsockopt clone fork vfork execve exit
+wait4 kill uname semget fcntl flock fsync fdatasync truncate ftruncate
+getdents getcwd chdir fchdir rename mkdir rmdir creat link unlink symlink
+readlink chmod fchmod chown fchown umask gettimeofday getrlimit getrusage
+sysinfo times getuid getgid setuid setgid geteuid getegid setpgid getppid
+getpgrp setsid getgroups setresuid getresuid setresgid getresgid getpgid
+getsid capget capset sigaltstack statfs fstatfs getpriority setpriority
+sched_setparam sched_getparam sched_setscheduler sched_getscheduler
+sched_get_priority_max sched_get_priority_min mlock munlock prctl arch_prctl
+setrlimit sync gettid readahead setxattr getxattr fgetxattr listxattr tkill
+time futex sched_setaffinity sched_getaffinity set_tid_address fadvise64
+timer_create clock_gettime clock_getres clock_nanosleep exit_group
+epoll_wait epoll_ctl tgkill waitid inotify_init inotify_add_watch
+inotify_rm_watch openat mkdirat fchownat newfstatat unlinkat renameat
+readlinkat fchmodat faccessat pselect6 ppoll unshare set_robust_list
+get_robust_list splice tee sync_file_range utimensat epoll_pwait signalfd
+timerfd_create eventfd fallocate timerfd_settime timerfd_gettime accept4
+signalfd4 eventfd2 epoll_create1 dup3 pipe2 inotify_init1 preadv pwritev
+recvmmsg prlimit64 sendmmsg getcpu process_vm_readv sched_setattr
+sched_getattr getrandom memfd_create membarrier statx rseq clone3
+close_range faccessat2 epoll_pwait2
+""".split()
+
+LAYOUTS = ["linear", "tree"]
+
+# Loops of a hot and of a rarely used syscall
+WORKLOADS = {
+    "read+write": (["dd", "if=/dev/zero", "of=/dev/null", "bs=1"], 2),
+    "getppid": ([
+        sys.executable, "-c",
+        "import os, sys\nfor _ in range(int(sys.argv[1])): os.getppid()"
+    ], 1),
+}
+
+PR_SET_NO_NEW_PRIVS = 38
+PR_SET_SECCOMP = 22
+SECCOMP_MODE_FILTER = 2
+
+
+def policy(names: list) -> str:
+    return "".join(f"{name}: 1\n" for name in names)
+
+
+def run_filter(program: bytes, nr: int, arch: int) -> tuple:
+    data = struct.pack("=IIQ6Q", nr, arch, 0, *[0] * 6)
+    pc = steps = accumulator = 0
+
+    while True:
+        code, jt, jf, k = struct.unpack_from("=HBBI", program, pc * 8)
+        pc += 1
+        steps += 1
+
+        if code == BPF_LD_W_ABS:
+            accumulator = struct.unpack_from("=I", data, k)[0]
+        elif code == BPF_JMP_JA:
+            pc += k
+        elif code == BPF_RET_K:
+            return k, steps
+        else:
+            taken = {
+                BPF_JMP_JEQ_K: accumulator == k,
+                BPF_JMP_JGT_K: accumulator > k,
+                BPF_JMP_JGE_K: accumulator >= k,
+                BPF_JMP_JSET_K: accumulator & k,
+            }[code]
+            pc += jt if taken else jf
+
+
+def static(arch: str) -> dict:
+    syscalls = SYSCALLS[arch]
+    programs = {
+        layout: compile_policy(policy(ELECTRON_SYSCALLS), arch, layout=layout)
+        for layout in LAYOUTS
+    }
+
+    # Both layouts have to agree on every syscall, x32 ones included
+    numbers = list(range(max(syscalls.values()) + 64))
+    numbers += [0x40000000 | nr for nr in (0, 1, 202)] + [0xffffffff]
+
+    for nr in numbers:
+        actions = {
+            run_filter(program, nr, AUDIT_ARCH[arch])[0]
+            for program in programs.values()
+        }
+        if len(actions) != 1:
+            sys.exit(f"layouts disagree on syscall {nr}")
+
+    allowed = [syscalls[name] for name in ELECTRON_SYSCALLS]
+    hot = [syscalls[name] for name in HOT_SYSCALLS if name in syscalls]
+    denied = [nr for nr in syscalls.values() if nr not in allowed]
+    results = {"allowed_syscalls": len(allowed)}
+
+    for layout, program in programs.items():
+        steps = lambda numbers: [
+            run_filter(program, nr, AUDIT_ARCH[arch])[1] for nr in numbers
+        ]
+
+        results[layout] = {
+            "instructions": len(program) // 8,
+            "hot_mean": round(statistics.mean(steps(hot)), 2),
+            "allowed_mean": round(statistics.mean(steps(allowed)), 2),
+            "allowed_max": max(steps(allowed)),
+            "denied_mean": round(statistics.mean(steps(denied)), 2),
+        }
+
+    return results
+
+
+def install_filter(program: bytes) -> None:
+
+    class SockFprog(ctypes.Structure):
+        _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.c_char_p)]
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    fprog = SockFprog(len(program) // 8, program)
+
+    if libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) or \
+            libc.prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER,
+                       ctypes.byref(fprog), 0, 0):
+        os._exit(127)
+
+
+def measure(command: list, program: bytes, direct: bool) -> float:
+    pass_fds = []
+    preexec_fn = None
+
+    if direct:
+        preexec_fn = (lambda: install_filter(program)) if program else None
+    else:
+        sandbox = [BWRAP, "--ro-bind", "/", "/", "--dev", "/dev"]
+
+        if program:
+            fd = os.memfd_create("seccomp", 0)
+            os.write(fd, program)
+            os.lseek(fd, 0, os.SEEK_SET)
+            sandbox += ["--seccomp", str(fd)]
+            pass_fds.append(fd)
+
+        command = sandbox + ["--"] + command
+
+    start = time.perf_counter()
+    subprocess.run(command,
+                   check=True,
+                   pass_fds=pass_fds,
+                   preexec_fn=preexec_fn,
+                   stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+
+    for fd in pass_fds:
+        os.close(fd)
+
+    return elapsed
+
+
+def runtime(arch: str, runs: int, count: int, direct: bool) -> dict:
+    # Everything the workloads need is allowed, listed the way a generated
+    # policy would, so a compare chain reaches getppid only after 90 others
+    names = ELECTRON_SYSCALLS + [
+        name for name in SYSCALLS[arch] if name not in ELECTRON_SYSCALLS
+    ]
+    programs = {"none": b""}
+    programs.update({
+        layout: compile_policy(policy(names), arch, layout=layout)
+        for layout in LAYOUTS
+    })
+
+    results = {"runs": runs, "iterations": count}
+
+    for workload, (command, syscalls) in WORKLOADS.items():
+        if command[0] == "dd":
+            command = command + [f"count={count}"]
+        else:
+            command = command + [str(count)]
+
+        timings = {
+            name: statistics.median(
+                measure(command, program, direct) for _ in range(runs))
+            for name, program in programs.items()
+        }
+
+        results[workload] = {
+            f"{name}_ns_per_syscall":
+            round((timings[name] - timings["none"]) * 1e9 /
+                  (count * syscalls), 2)
+            for name in LAYOUTS
+        }
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='seccomp filter overhead')
+
+    parser.add_argument('--runtime',
+                        action='store_true',
+                        help="Also time workloads with the filters loaded")
+    parser.add_argument('--direct',
+                        action='store_true',
+                        help="Load the filters with prctl instead of bwrap")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=1000000)
+    args = parser.parse_args()
+
+    arch = machine()
+    results = {"arch": arch, "static": static(arch)}
+
+    if args.runtime:
+        results["runtime"] = runtime(arch, args.runs, args.iterations,
+                                     args.direct)
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/bin/python3
+"""
+Measures how long sandbox-launch takes from interpreter start until bwrap is
+executed. bwrap is replaced with a stub that exits immediately, and the time
+to run the stub on its own is subtracted from every sample.
+
+    python3 benchmarks/startup.py [--bundle /usr/bin/sandbox-launch]
+"""
+
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = "Benchmark"
+
+STUB = """#!/bin/sh
+exit 0
+"""
+
+
+def write_stub(directory: str) -> str:
+    stub = os.path.join(directory, "bwrap")
+
+    with open(stub, "w") as fp:
+        fp.write(STUB)
+
+    os.chmod(stub, 0o755)
+    return stub
+
+
+def create_app(home: str) -> None:
+    # The sandbox paths are resolved from $HOME at import time
+    os.environ["HOME"] = home
+    sys.path.insert(0, ROOT)
+
+    from src import create_directories
+    from src.config import ConfigBuilder
+    from src.desktop import DesktopEntry
+    from src.permissions import PermissionBuilder, DBusPermissionBuilder
+
+    create_directories()
+
+    entry = DesktopEntry(filename="/usr/share/applications/bench.desktop",
+                         name="Benchmark",
+                         exec="/opt/bench/bench",
+                         type="Application",
+                         icon="bench",
+                         terminal=None,
+                         generic_name=None,
+                         start_notify=None,
+                         wm_class=None,
+                         mime_type=None,
+                         categories=None,
+                         actions=None,
+                         keywords=None,
+                         comment=None)
+
+    ConfigBuilder(app=APP,
+                  path="/opt/bench",
+                  entry=entry,
+                  permissions=PermissionBuilder().dri().build(),
+                  dbus_permissions=DBusPermissionBuilder().build()).build()
+
+
+def measure(command: list, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def summarize(samples: list, baseline: float) -> dict:
+    from src.trace import percentile
+
+    samples = sorted((sample - baseline) * 1000 for sample in samples)
+
+    return {
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='sandbox-launch startup')
+
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--bundle',
+                        help="Also measure a zipapp built by install.sh")
+    parser.add_argument('--max-ms',
+                        type=float,
+                        help="Exit with an error if a warm median is slower")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        home = os.path.join(tmp, "home")
+        os.mkdir(home)
+        create_app(home)
+
+        env = dict(os.environ,
+                   HOME=home,
+                   USER="benchmark",
+                   XDG_RUNTIME_DIR=tmp,
+                   XDG_DATA_DIRS="/usr/share",
+                   SANDBOX_MANAGER_BWRAP=write_stub(tmp))
+
+        baseline = statistics.median(
+            measure([env["SANDBOX_MANAGER_BWRAP"]], env)
+            for _ in range(args.runs))
+
+        launchers = {
+            "source": [sys.executable,
+                       os.path.join(ROOT, "launch.py"), "--app", APP]
+        }
+        if args.bundle:
+            launchers["bundle"] = [args.bundle, "--app", APP]
+
+        results = {"runs": args.runs, "stub_ms": round(baseline * 1000, 3)}
+
+        for name, command in launchers.items():
+            plans = os.path.join(home, ".sandbox_manager", "plans")
+
+            cold = []
+            for _ in range(args.runs):
+                for plan in os.listdir(plans):
+                    os.unlink(os.path.join(plans, plan))
+                cold.append(measure(command, env))
+
+            warm = [measure(command, env) for _ in range(args.runs)]
+
+            results[name] = {
+                "cold": summarize(cold, baseline),
+                "warm": summarize(warm, baseline),
+            }
+
+    print(json.dumps(results, indent=4))
+
+    if args.max_ms:
+        for name in launchers:
+            if results[name]["warm"]["median_ms"] > args.max_ms:
+                sys.exit(f"{name}: warm launch slower than {args.max_ms}ms")
+
+
+if __name__ == "__main__":
+    main()
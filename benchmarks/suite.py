@@ -0,0 +1,342 @@
+#!/bin/python3
+"""
+Measures the paths every sandbox-* command goes through with 1, 100 and 1000
+configured apps: loading a config, building the bwrap arguments, parsing
+desktop entries, refreshing the catalog, sandbox-create and sandbox-launch.
+Everything runs in a temporary $HOME against stand-ins for bwrap, which exits
+immediately, and xdg-dbus-proxy, which only reports its socket as ready.
+
+    python3 benchmarks/suite.py --output results.json
+    python3 benchmarks/suite.py --baseline results.json --tolerance 1.25
+"""
+
+import argparse, json, os, random, statistics, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = "1,100,1000"
+
+BWRAP_STUB = """#!/bin/sh
+exit 0
+"""
+
+# Lives as long as a sandbox holds the read end of the --fd FIFO, like the
+# real proxy
+PROXY_STUB = f"""#!{sys.executable}
+import os, sys, select
+
+fd = next(int(arg[5:]) for arg in sys.argv if arg.startswith("--fd="))
+socket = [arg for arg in sys.argv[1:] if not arg.startswith("--")][-1]
+
+open(socket, "w").close()
+os.write(fd, b"x")
+
+poll = select.poll()
+poll.register(fd, select.POLLERR)
+poll.poll()
+
+os.unlink(socket)
+"""
+
+DESKTOP_ENTRY = """[Desktop Entry]
+Type=Application
+Name=Bench {index}
+Name[de]=Bank {index}
+Name[fr]=Banc {index}
+GenericName=Benchmark
+Comment=Benchmark application {index}
+Comment[de]=Benchmark Anwendung {index}
+Exec=/opt/bench{index}/bench %U
+Icon=bench
+Terminal=false
+StartupNotify=true
+StartupWMClass=bench{index}
+MimeType=text/plain;text/html;
+Categories=Utility;Development;
+Keywords=bench;benchmark;
+Actions=new-window;private-window;
+
+[Desktop Action new-window]
+Name=New Window
+Name[de]=Neues Fenster
+Exec=/opt/bench{index}/bench --new-window
+
+[Desktop Action private-window]
+Name=Private Window
+Exec=/opt/bench{index}/bench --private-window
+"""
+
+
+def write_stub(filename: str, content: str) -> str:
+    with open(filename, "w") as fp:
+        fp.write(content)
+
+    os.chmod(filename, 0o755)
+    return filename
+
+
+def environment(tmp: str) -> dict:
+    env = {
+        "HOME": os.path.join(tmp, "home"),
+        "USER": "benchmark",
+        "XDG_RUNTIME_DIR": os.path.join(tmp, "run"),
+        "XDG_DATA_DIRS": os.path.join(tmp, "share"),
+        "WAYLAND_DISPLAY": "wayland-0",
+        "DBUS_SESSION_BUS_ADDRESS": f"unix:path={tmp}/bus",
+        "SANDBOX_MANAGER_BWRAP": write_stub(os.path.join(tmp, "bwrap"),
+                                            BWRAP_STUB),
+        "SANDBOX_MANAGER_XDG_DBUS_PROXY": write_stub(
+            os.path.join(tmp, "xdg-dbus-proxy"), PROXY_STUB),
+    }
+
+    # sandbox-create writes the sandboxed entries to the user's applications
+    for directory in (os.path.join(env["HOME"], ".local", "share",
+                                   "applications"), env["XDG_RUNTIME_DIR"],
+                      os.path.join(env["XDG_DATA_DIRS"], "applications")):
+        os.makedirs(directory)
+
+    # The sandbox paths are resolved from the environment at import time
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+
+    return dict(os.environ)
+
+
+def desktop_filename(index: int) -> str:
+    return os.path.join(os.environ["XDG_DATA_DIRS"], "applications",
+                        f"bench{index}.desktop")
+
+
+def add_apps(start: int, stop: int) -> None:
+    from src.config import ConfigBuilder
+    from src.desktop import DesktopEntry
+    from src.permissions import PermissionBuilder, DBusPermissionBuilder
+
+    for index in range(start, stop):
+        with open(desktop_filename(index), "w") as fp:
+            fp.write(DESKTOP_ENTRY.format(index=index))
+
+        # Every other app talks to D-Bus through the proxy
+        permissions = PermissionBuilder().dri()
+        if index % 2:
+            permissions.dbus()
+
+        ConfigBuilder(app=f"Bench{index}",
+                      path=f"/opt/bench{index}",
+                      entry=DesktopEntry.from_desktop_entry(
+                          desktop_filename(index)),
+                      permissions=permissions.build(),
+                      dbus_app=f"org.bench.App{index}",
+                      dbus_permissions=DBusPermissionBuilder().notifications().
+                      build()).build()
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run(command: list, env: dict) -> None:
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def summarize(samples: list, baseline: float = 0.0) -> dict:
+    from src.trace import percentile
+
+    samples = sorted((sample - baseline) * 1000 for sample in samples)
+
+    return {
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def measure_api(size: int, runs: int, tmp: str) -> dict:
+    from src.catalog import Catalog
+    from src.config import Config
+    from src.desktop import DesktopEntry, _read_desktop_entry
+    from src.launcher import SandboxLauncher
+    from src.store import ConfigStore, config_store
+
+    apps = [f"Bench{random.randrange(size)}" for _ in range(runs)]
+
+    def load_config(app: str) -> Config:
+        # A fresh connection each time, the way every launcher process
+        # starts out
+        store = ConfigStore()
+        config = Config.from_dict(store.get(app))
+        store.close()
+
+        return config
+
+    def build_argv(config: Config) -> None:
+        SandboxLauncher(binary_cmd=config.cmd,
+                        args=[],
+                        app=config.app,
+                        path=config.path,
+                        permissions=config.permissions,
+                        seccomp_filter=config.seccomp_filter,
+                        dbus_app=config.dbus_app,
+                        dbus_permissions=config.dbus_permissions,
+                        single_instance=config.single_instance,
+                        limits=config.limits).build()
+
+    def parse_entry(index: int) -> None:
+        _read_desktop_entry.cache_clear()
+        DesktopEntry.from_desktop_entry(desktop_filename(index))
+
+    catalog_file = os.path.join(tmp, "catalog.json")
+
+    def refresh_catalog(cold: bool) -> None:
+        if cold and os.path.exists(catalog_file):
+            os.unlink(catalog_file)
+
+        catalog = Catalog(catalog_file)
+        catalog.refresh()
+        catalog.save()
+
+    configs = [load_config(app) for app in apps]
+
+    return {
+        "config_load": summarize([timed(load_config, app) for app in apps]),
+        "config_list": summarize(
+            [timed(config_store().items) for _ in range(runs)]),
+        "argv_build": summarize(
+            [timed(build_argv, config) for config in configs]),
+        "desktop_parse": summarize([
+            timed(parse_entry, int(app[len("Bench"):])) for app in apps
+        ]),
+        "catalog_refresh_cold": summarize(
+            [timed(refresh_catalog, True) for _ in range(runs)]),
+        "catalog_refresh_warm": summarize(
+            [timed(refresh_catalog, False) for _ in range(runs)]),
+    }
+
+
+def measure_commands(size: int, runs: int, env: dict,
+                     baseline: float) -> dict:
+    from src import PLAN_DIRECTORY
+    from src.sandbox import sandbox_delete_app
+
+    def create() -> float:
+        command = [
+            sys.executable,
+            os.path.join(ROOT, "create.py"), "--app", "BenchCreate", "--path",
+            "/opt/bench0", "--entry", "bench0", "--dri"
+        ]
+
+        sample = timed(run, command, env)
+        sandbox_delete_app("BenchCreate")
+
+        return sample
+
+    def launch(app: str, cold: bool) -> float:
+        if cold:
+            for plan in os.listdir(PLAN_DIRECTORY):
+                os.unlink(os.path.join(PLAN_DIRECTORY, plan))
+
+        return timed(
+            run, [sys.executable,
+                  os.path.join(ROOT, "launch.py"), "--app", app], env)
+
+    # The proxy stand-in runs Python, which a real proxy does not
+    results = {
+        "sandbox_create": summarize([create() for _ in range(runs)],
+                                    baseline),
+        "launch_cold": summarize([launch("Bench0", True) for _ in range(runs)],
+                                 baseline),
+        "launch_warm": summarize(
+            [launch("Bench0", False) for _ in range(runs)], baseline),
+    }
+
+    if size > 1:
+        results["launch_dbus"] = summarize(
+            [launch("Bench1", False) for _ in range(runs)], baseline)
+
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    slower = []
+
+    for size, metrics in results["sizes"].items():
+        for name, stats in metrics.items():
+            before = baseline.get("sizes", {}).get(size, {}).get(name)
+
+            if before and stats["median_ms"] > before["median_ms"] * tolerance:
+                slower.append(f"{name} with {size} apps: "
+                              f"{before['median_ms']}ms -> "
+                              f"{stats['median_ms']}ms")
+
+    return slower
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='sandbox-manager benchmarks')
+
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--sizes',
+                        default=SIZES,
+                        help="Numbers of configured apps to measure with")
+    parser.add_argument('--output', help="Also write the results to a file")
+    parser.add_argument('--baseline',
+                        help="Results of an earlier run to compare against")
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=1.25,
+        help="Slowdown of a median over the baseline that counts as a "
+        "regression")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = environment(tmp)
+
+        from src import create_directories
+        create_directories()
+
+        stub = statistics.median(
+            timed(run, [env["SANDBOX_MANAGER_BWRAP"]], env)
+            for _ in range(args.runs))
+
+        results = {
+            "runs": args.runs,
+            "python": sys.version.split()[0],
+            "stub_ms": round(stub * 1000, 3),
+            "sizes": {}
+        }
+
+        configured = 0
+
+        # Apps are only ever added, each size builds on the previous one
+        for size in sizes:
+            add_apps(configured, size)
+            configured = size
+
+            results["sizes"][str(size)] = dict(
+                measure_api(size, args.runs, tmp),
+                **measure_commands(size, args.runs, env, stub))
+
+            print(f"Measured {size} apps", file=sys.stderr)
+
+    output = json.dumps(results, indent=4)
+    print(output)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as fp:
+            slower = regressions(results, json.load(fp), args.tolerance)
+
+        if slower:
+            sys.exit("Slower than the baseline:\n" + "\n".join(slower))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,24 @@
 #!/bin/python3
 
-import argparse, os
-from src.sandbox import sandbox_app_factory
+import argparse, sys
+from src import create_directories
+from src.sandbox import sandbox_app_factory, check_args
+from src.config import POOL_IDLE
 
 parser = argparse.ArgumentParser(description='Sandbox tool creation')
 
-parser.add_argument('--app', required=True)
-parser.add_argument('--path', required=True)
-parser.add_argument('--entry', required=True)
+parser.add_argument('--app')
+parser.add_argument('--path')
+parser.add_argument('--entry')
 parser.add_argument('--seccomp')
 
+parser.add_argument(
+    '--manifest',
+    help="Create or update every app described in a TOML or JSON manifest")
+parser.add_argument('--jobs',
+                    type=int,
+                    help="Apps a manifest applies in parallel")
+
 parser.add_argument('--dri',
                     action='store_true',
                     help="Enable video acceleration with DRI")
@@ -28,6 +37,44 @@ parser.add_argument('--pulseaudio',
 parser.add_argument('--pipewire',
                     action='store_true',
                     help="Allow application to send audio with Pipewire")
+parser.add_argument(
+    '--single-instance',
+    action='store_true',
+    help="Hand further launches to the running sandbox instead of a new one")
+parser.add_argument('--pool-size',
+                    type=int,
+                    default=0,
+                    help="Pre-warmed sandboxes sandbox-pool keeps ready")
+parser.add_argument(
+    '--pool-idle',
+    type=int,
+    default=POOL_IDLE,
+    help="Seconds without a launch before the pre-warmed sandboxes expire")
+"""
+Resource limits, applied with cgroup v2
+"""
+
+parser.add_argument('--cpu-weight',
+                    help="Share of CPU time under contention, 1 to 10000")
+parser.add_argument('--cpu-max',
+                    help="CPU time cap, like 200%% for two CPUs")
+parser.add_argument('--memory-high',
+                    help="Memory use above which the app is throttled")
+parser.add_argument('--memory-max',
+                    help="Memory use above which the app is OOM killed")
+parser.add_argument('--io-weight',
+                    help="Share of disk bandwidth, 1 to 10000")
+parser.add_argument('--pids-max', help="Most processes and threads")
+parser.add_argument(
+    '--idle-freeze',
+    type=int,
+    default=0,
+    help="Minutes without input after which sandbox-freeze --idle freezes it")
+parser.add_argument(
+    '--minimal-root',
+    action='store_true',
+    help="Bind only the libraries the app links against instead of all of /usr"
+)
 """
 Dbus permissions
 """
@@ -53,19 +100,19 @@ parser.add_argument(
 
 args = parser.parse_args()
 
-if args.seccomp and not os.path.exists(args.seccomp):
-    parser.error("--seccomp requires a valid path to a BPF filter")
+create_directories()
+
+if args.manifest:
+    from src.manifest import ManifestRunner
+
+    sys.exit(0 if ManifestRunner(args.manifest, args.jobs).run() else 1)
 
-if args.dbus:
-    if not args.dbus_app:
-        parser.error(
-            "--dbus-app is required if dbus is enabled. Example: --dbus-app org.signal.Signal"
-        )
+if not (args.app and args.path and args.entry):
+    parser.error("--app, --path and --entry are required without --manifest")
 
-if not args.dbus:
-    if args.screencast or args.screenshot or args.vfs:
-        parser.error(
-            "Cannot enable screencasting/screenshotting/vfs without DBus access."
-        )
+try:
+    check_args(args)
+except ValueError as error:
+    parser.error(str(error))
 
 sandbox_app_factory(args)
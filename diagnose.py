@@ -0,0 +1,86 @@
+#!/bin/python3
+
+import argparse, json, shutil, subprocess, sys
+from src.config import Config
+from src.hwaccel import (ACCELERATION_CHECKS, CHECK_TIMEOUT, hwaccel_profile,
+                         acceleration_verdict)
+from src.launcher import run_plan
+from src.permissions import PermissionList
+from src.sandbox import config_launcher
+
+parser = argparse.ArgumentParser(
+    description='Check whether hardware acceleration works in a sandbox')
+
+parser.add_argument('--app', required=True)
+parser.add_argument('--json', action='store_true', help="Print JSON")
+
+args = parser.parse_args()
+
+try:
+    config = Config.from_app(args.app)
+except KeyError as error:
+    sys.exit(error.args[0])
+
+profile = hwaccel_profile()
+tools = {api: shutil.which(argv[0]) for api, argv in ACCELERATION_CHECKS}
+
+# The app's own sandbox, with the check programs added in a minimal root
+plan = config_launcher(
+    config, extra_binaries=[tool for tool in tools.values() if tool]).build()
+
+checks = []
+
+for api, argv in ACCELERATION_CHECKS:
+    if not tools[api]:
+        checks.append({
+            "api": api,
+            "status": "not installed",
+            "detail": f"{argv[0]} is not installed on the host"
+        })
+        continue
+
+    try:
+        result = run_plan(plan, [tools[api]] + argv[1:], CHECK_TIMEOUT)
+        status, detail = acceleration_verdict(api, result.returncode,
+                                              result.stdout, result.stderr)
+    except subprocess.TimeoutExpired:
+        status, detail = "failed", f"no answer in {CHECK_TIMEOUT}s"
+
+    checks.append({"api": api, "status": status, "detail": detail})
+
+dri = config.permissions.has_permission(PermissionList.Dri)
+working = any(check["status"] == "hardware" for check in checks)
+
+if args.json:
+    print(
+        json.dumps(
+            {
+                "app": args.app,
+                "dri": dri,
+                "devices": [device.as_dict() for device in profile.devices],
+                "env": profile.env,
+                "checks": checks
+            },
+            indent=4))
+    sys.exit(0 if working else 1)
+
+print(f"DRI permission: {'yes' if dri else 'no, create the app with --dri'}")
+print("------------------")
+
+for device in profile.devices:
+    print(f"{device.render:22} {device.driver or 'no driver':10} "
+          f"{device.pci_id or '':10} {'primary' if device.primary else ''}")
+
+if not profile.devices:
+    print("No GPU render nodes found")
+
+if dri:
+    for env, value in profile.env.items():
+        print(f"{env}={value}")
+
+print("------------------")
+
+for check in checks:
+    print(f"{check['api']:8} {check['status']:14} {check['detail']}")
+
+sys.exit(0 if working else 1)
@@ -0,0 +1,44 @@
+#!/bin/python3
+
+import argparse, signal, sys
+from src.freezer import freeze_app, thaw_app, running_sandboxes
+from src.idle import IdleFreezer
+
+parser = argparse.ArgumentParser(
+    description='Freeze sandboxed applications with the cgroup v2 freezer')
+
+parser.add_argument('--app')
+parser.add_argument('--thaw',
+                    action='store_true',
+                    help="Let the app's frozen sandboxes run again")
+parser.add_argument(
+    '--idle',
+    action='store_true',
+    help="Keep freezing apps created with --idle-freeze once they go idle")
+
+args = parser.parse_args()
+
+if args.idle:
+    freezer = IdleFreezer()
+
+    signal.signal(signal.SIGTERM, freezer.stop)
+    signal.signal(signal.SIGINT, freezer.stop)
+
+    freezer.serve()
+    sys.exit()
+
+if not args.app:
+    parser.error("--app is required without --idle")
+
+if args.thaw:
+    count = thaw_app(args.app)
+    print(f"Thawed {count} sandboxes of '\x1b[92m{args.app}\x1b[0m'")
+    sys.exit()
+
+if not freeze_app(args.app):
+    sys.exit(f"'{args.app}' has no running sandbox that can be frozen")
+
+print(f"Froze '\x1b[94m{args.app}\x1b[0m'")
+print("------------------")
+for sandbox in running_sandboxes(args.app):
+    print(f"{sandbox.pid:8} {sandbox.state()}")
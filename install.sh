@@ -3,7 +3,8 @@
 mkdir -pv /etc/SandboxManager
 
 cp -r src /etc/SandboxManager
-cp -r remove.py create.py launch.py /etc/SandboxManager
+cp -r remove.py create.py launch.py logs.py pool.py list.py seccomp.py freeze.py \
+    traces.py stats.py diagnose.py /etc/SandboxManager
 
 cat > "/usr/bin/sandbox-create" << EOF
 #!/bin/bash
@@ -11,16 +12,83 @@ cat > "/usr/bin/sandbox-create" << EOF
 python3 /etc/SandboxManager/create.py "\$@"
 EOF
 
-cat > "/usr/bin/sandbox-launch" << EOF
+cat > "/usr/bin/sandbox-remove" << EOF
 #!/bin/bash
 
-python3 /etc/SandboxManager/launch.py "\$@"
+python3 /etc/SandboxManager/remove.py "\$@"
 EOF
 
-cat > "/usr/bin/sandbox-remove" << EOF
+cat > "/usr/bin/sandbox-logs" << EOF
 #!/bin/bash
 
-python3 /etc/SandboxManager/remove.py "\$@"
+python3 /etc/SandboxManager/logs.py "\$@"
+EOF
+
+cat > "/usr/bin/sandbox-pool" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/pool.py "\$@"
+EOF
+
+cat > "/usr/bin/sandbox-list" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/list.py "\$@"
+EOF
+
+cat > "/usr/bin/sandbox-seccomp" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/seccomp.py "\$@"
+EOF
+
+cat > "/usr/bin/sandbox-freeze" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/freeze.py "\$@"
 EOF
 
-chmod 755 /usr/bin/sandbox-create /usr/bin/sandbox-launch /usr/bin/sandbox-remove
+cat > "/usr/bin/sandbox-thaw" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/freeze.py --thaw "\$@"
+EOF
+
+cat > "/usr/bin/sandbox-trace" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/traces.py "\$@"
+EOF
+
+cat > "/usr/bin/sandbox-stats" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/stats.py "\$@"
+EOF
+
+cat > "/usr/bin/sandbox-diagnose" << EOF
+#!/bin/bash
+
+python3 /etc/SandboxManager/diagnose.py "\$@"
+EOF
+
+# sandbox-launch is shipped as a single precompiled zipapp so a launch does
+# not pay for a shell wrapper, site initialisation or compiling sources
+BUNDLE=$(mktemp -d)
+
+cp -r src launch.py "$BUNDLE"
+find "$BUNDLE" -name __pycache__ -prune -exec rm -rf {} \;
+python3 -m compileall -q -b "$BUNDLE"
+find "$BUNDLE" -name "*.py" -delete
+
+python3 -m zipapp "$BUNDLE" \
+    -m "launch:main" \
+    -p "/usr/bin/python3 -IS" \
+    -o /usr/bin/sandbox-launch
+
+rm -rf "$BUNDLE"
+
+chmod 755 /usr/bin/sandbox-create /usr/bin/sandbox-launch /usr/bin/sandbox-remove \
+    /usr/bin/sandbox-logs /usr/bin/sandbox-pool /usr/bin/sandbox-list \
+    /usr/bin/sandbox-seccomp /usr/bin/sandbox-freeze /usr/bin/sandbox-thaw \
+    /usr/bin/sandbox-trace /usr/bin/sandbox-stats /usr/bin/sandbox-diagnose
@@ -1,16 +1,106 @@
 #!/bin/python3
 
-import argparse
-from src.sandbox import sandbox_launcher
+import argparse, os, sys
+from typing import List, Optional
 
-parser = argparse.ArgumentParser(description='Sandbox tool launching')
+# Only the plan loader is imported up front; the full sandbox stack is
+# pulled in when there is no valid cached plan to execute.
+from src import RUNTIME_DIRECTORY, SANDBOXES_DIRECTORY, POOL_SOCKET
+from src.plan import LaunchPlan
+from src.trace import phase, start_trace, finish_trace
 
-parser.add_argument('--app', required=True)
-parser.add_argument('args',
-                    nargs=argparse.REMAINDER,
-                    help='Rest of the arguments')
 
-args = parser.parse_args()
-argstr = ' '.join(args.args)
+def launch(app: str,
+           args: List[str],
+           replace: bool,
+           ready_fd: Optional[int] = None) -> None:
+    # Launching an app wakes its sandboxes if they were frozen
+    if os.path.isdir(SANDBOXES_DIRECTORY):
+        with phase("thaw"):
+            from src.freezer import thaw_app
+            thaw_app(app)
 
-sandbox_launcher(args, argstr)
+    # A running single-instance sandbox takes the arguments itself
+    if os.path.exists(os.path.join(RUNTIME_DIRECTORY, f"{app}.sock")):
+        with phase("forward"):
+            from src.instance import forward_launch
+            forwarded = forward_launch(app, args)
+
+        if forwarded:
+            ready(ready_fd)
+            return
+
+    # sandbox-pool hands out an already set up sandbox if it has one ready
+    if os.path.exists(POOL_SOCKET):
+        with phase("pool"):
+            from src.pool import pool_launch
+            pooled = pool_launch(app, args)
+
+        if pooled:
+            ready(ready_fd)
+            return
+
+    with phase("plan.load"):
+        plan = LaunchPlan.load(app=app)
+
+    if not plan:
+        with phase("plan.build"):
+            from src.sandbox import sandbox_launch_plan
+            plan = sandbox_launch_plan(app, args)
+
+    plan.execute(args, replace=replace, ready_fd=ready_fd)
+
+
+def ready(ready_fd: Optional[int]) -> None:
+    # Sandboxes that already run were set up long ago
+    if ready_fd is not None:
+        from src.lifecycle import report_ready
+        report_ready(ready_fd, None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Sandbox tool launching')
+
+    parser.add_argument('--app', required=True)
+    parser.add_argument(
+        '--exec',
+        action='store_true',
+        help="Replace the launcher with bwrap instead of waiting for it")
+    parser.add_argument(
+        '--ready-fd',
+        type=int,
+        help="Write the sandboxed pid as JSON to this descriptor once the "
+        "sandbox is set up")
+    parser.add_argument(
+        '--trace',
+        action='store_true',
+        help="Time every phase of the launch into a Chrome trace file")
+    parser.add_argument('args',
+                        nargs=argparse.REMAINDER,
+                        help='Rest of the arguments, after -- if they start '
+                        'with a dash')
+
+    # Everything after "--" goes to the app as it is, options included
+    argv = sys.argv[1:]
+    app_args = []
+
+    if "--" in argv:
+        index = argv.index("--")
+        argv, app_args = argv[:index], argv[index + 1:]
+
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        start_trace(args.app)
+
+    try:
+        launch(args.app, args.args + app_args, args.exec, args.ready_fd)
+    finally:
+        filename = finish_trace()
+
+        if filename:
+            print(f"Trace written to {filename}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
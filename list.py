@@ -0,0 +1,79 @@
+#!/bin/python3
+
+import argparse, json
+from src.catalog import Catalog, CatalogWatcher
+from src.freezer import running_sandboxes
+from src.store import config_store
+
+parser = argparse.ArgumentParser(
+    description='List installed applications that can be sandboxed')
+
+parser.add_argument('query',
+                    nargs='?',
+                    help="Only show entries whose ID, name or Exec match")
+parser.add_argument('--all',
+                    action='store_true',
+                    help="Include entries hidden from menus")
+parser.add_argument('--json', action='store_true', help="Print JSON")
+parser.add_argument(
+    '--watch',
+    action='store_true',
+    help="Keep the index up to date with inotify until interrupted")
+
+args = parser.parse_args()
+catalog = Catalog()
+
+if catalog.refresh():
+    catalog.save()
+
+if args.watch:
+    try:
+        CatalogWatcher(catalog).watch(
+            lambda: print(f"Updated index, {len(catalog.entries())} entries"))
+    except KeyboardInterrupt:
+        pass
+
+    raise SystemExit
+
+# Sandboxed apps by the desktop entry they were created from
+sandboxes = {}
+for app, data in config_store().items().items():
+    sandboxes.setdefault(data.get("entry"), []).append(app)
+
+# States of the running sandboxes of each app
+states = {}
+for sandbox in running_sandboxes():
+    states.setdefault(sandbox.app, []).append(sandbox.state())
+
+entries = {}
+query = (args.query or "").lower()
+
+for desktop_id, entry in catalog.entries().items():
+    if entry["no_display"] and not args.all:
+        continue
+
+    if query and not any(query in (value or "").lower()
+                         for value in (desktop_id, entry["name"],
+                                       entry["exec"])):
+        continue
+
+    apps = sandboxes.get(desktop_id, [])
+    entries[desktop_id] = dict(entry,
+                               sandboxes=apps,
+                               running={app: states[app]
+                                        for app in apps if app in states})
+
+if args.json:
+    print(json.dumps(entries, indent=4))
+    raise SystemExit
+
+width = max((len(desktop_id) for desktop_id in entries), default=0)
+
+for desktop_id, entry in entries.items():
+    sandboxed = ",".join(
+        f"{app}[{'/'.join(entry['running'][app])}]" if app in
+        entry["running"] else app for app in entry["sandboxes"])
+    sandboxed = f"\x1b[92m{sandboxed}\x1b[0m " if sandboxed else ""
+
+    print(f"{desktop_id:{width}}  {sandboxed}{entry['name'] or ''} "
+          f"({entry['binary'] or entry['exec'] or '-'})")
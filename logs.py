@@ -0,0 +1,61 @@
+#!/bin/python3
+
+import argparse, collections, os, sys, time
+from src.logs import log_filename, LOG_BACKUPS
+
+parser = argparse.ArgumentParser(description='Sandbox tool logs')
+
+parser.add_argument('--app', required=True)
+parser.add_argument('-n',
+                    '--lines',
+                    type=int,
+                    default=50,
+                    help="Number of lines to show")
+parser.add_argument('-f',
+                    '--follow',
+                    action='store_true',
+                    help="Keep printing output as the application writes it")
+
+args = parser.parse_args()
+filename = log_filename(args.app)
+
+# Oldest rotated file first so the last lines come out in order
+tail = collections.deque(maxlen=args.lines)
+for path in [f"{filename}.{i}" for i in range(LOG_BACKUPS, 0, -1)] + [filename]:
+    if os.path.exists(path):
+        with open(path, "rb") as fp:
+            tail.extend(fp)
+
+if not tail and not os.path.exists(filename):
+    sys.exit(f"No logs for application '{args.app}'")
+
+sys.stdout.buffer.writelines(tail)
+sys.stdout.flush()
+
+if not args.follow:
+    sys.exit(0)
+
+fp = open(filename, "rb")
+fp.seek(0, os.SEEK_END)
+
+try:
+    while True:
+        data = fp.read()
+
+        if data:
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+            continue
+
+        # The launcher rotated the log, continue with the new file
+        try:
+            if os.stat(filename).st_ino != os.fstat(fp.fileno()).st_ino:
+                fp.close()
+                fp = open(filename, "rb")
+                continue
+        except FileNotFoundError:
+            pass
+
+        time.sleep(0.25)
+except KeyboardInterrupt:
+    pass
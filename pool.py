@@ -0,0 +1,10 @@
+#!/bin/python3
+
+import argparse
+from src.pool import SandboxPool
+
+parser = argparse.ArgumentParser(
+    description='Keep pre-warmed sandboxes ready for apps with a pool size')
+parser.parse_args()
+
+SandboxPool().serve()
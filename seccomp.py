@@ -0,0 +1,151 @@
+#!/bin/python3
+
+import argparse, os, sys, time
+from src.seccomp import compile_policy, compiled_filter, machine
+
+parser = argparse.ArgumentParser(description='Sandbox tool seccomp policies')
+commands = parser.add_subparsers(dest='command', required=True)
+
+compile_parser = commands.add_parser(
+    'compile', help="Compile a policy file to a seccomp BPF filter")
+compile_parser.add_argument('policy')
+compile_parser.add_argument(
+    '-o',
+    '--output',
+    help="Write the filter here instead of the compiled filter cache")
+compile_parser.add_argument('--arch', default=machine())
+
+learn_parser = commands.add_parser(
+    'learn', help="Build an app's policy from strace -f -e raw=all output")
+learn_parser.add_argument('--app', required=True)
+learn_parser.add_argument('traces', nargs='+')
+learn_parser.add_argument('--jobs',
+                          type=int,
+                          help="Processes that parse large traces")
+learn_parser.add_argument('--reset',
+                          action='store_true',
+                          help="Forget what earlier traces of the app used")
+
+watch_parser = commands.add_parser(
+    'watch', help="Collect an app's seccomp denials from the audit log")
+watch_parser.add_argument('--app', required=True)
+watch_parser.add_argument('--log', help="Audit log to read")
+watch_parser.add_argument('-f',
+                          '--follow',
+                          action='store_true',
+                          help="Keep printing denials as they are logged")
+watch_parser.add_argument(
+    '--apply',
+    action='store_true',
+    help="Allow the denied syscalls in the app's policy without asking")
+
+args = parser.parse_args()
+
+if args.command == 'compile':
+    try:
+        if args.output:
+            with open(args.policy) as fp:
+                program = compile_policy(fp.read(), args.arch, args.policy)
+
+            with open(args.output, "wb") as fp:
+                fp.write(program)
+
+            print(f"{args.output}: {len(program) // 8} instructions")
+        else:
+            print(compiled_filter(args.policy, args.arch))
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+
+if args.command == 'learn':
+    from src.learn import (SyscallProfile, learn_traces, load_app_profile,
+                           save_app_profile)
+    from src.store import config_store
+
+    if config_store().get(args.app) is None:
+        sys.exit(f"No sandboxed application '{args.app}'")
+
+    profile = SyscallProfile() if args.reset else load_app_profile(args.app)
+    learned = learn_traces(args.traces, args.jobs)
+    profile.merge(learned)
+
+    try:
+        policy = save_app_profile(args.app, profile)
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+
+    filtered = [
+        name for name, values in profile.values.items() if values is not None
+    ]
+
+    print(f"{sum(learned.counts.values())} syscalls traced, "
+          f"{len(profile.counts)} allowed, "
+          f"{len(filtered)} with argument filters")
+    if learned.unknown:
+        print(f"Ignored unknown syscalls: {', '.join(sorted(learned.unknown))}")
+    print("------------------")
+    print(policy)
+
+if args.command == 'watch':
+    from src.audit import AUDIT_LOG, AuditLogTail, SeccompDenials
+    from src.config import Config
+    from src.learn import app_seccomp_directory, allow_syscalls
+
+    try:
+        config = Config.from_app(args.app)
+    except KeyError as error:
+        sys.exit(error.args[0])
+
+    # Only the part of the log written since the last run is read
+    tail = AuditLogTail(
+        args.log or AUDIT_LOG,
+        os.path.join(app_seccomp_directory(args.app), "audit.json"))
+    denials = SeccompDenials(args.app, config)
+
+    def collect() -> None:
+        for line in tail.lines():
+            name = denials.denial(line)
+
+            if name:
+                tail.pending[name] = tail.pending.get(name, 0) + 1
+                if args.follow:
+                    print(f"Denied {name}")
+
+        tail.save()
+
+    try:
+        collect()
+
+        while args.follow:
+            time.sleep(1)
+            collect()
+    except KeyboardInterrupt:
+        pass
+    except PermissionError as error:
+        sys.exit(f"{error}, reading the audit log usually needs root")
+
+    if not tail.pending:
+        print(f"No seccomp denials for '{args.app}'")
+        sys.exit()
+
+    print("------------------")
+    for name, count in sorted(tail.pending.items(), key=lambda item: -item[1]):
+        print(f"{count:8} {name}")
+    print("------------------")
+
+    if not args.apply:
+        if not sys.stdin.isatty() or input(
+                "Allow these syscalls and recompile the policy? [y/N] "
+        ).lower() != "y":
+            sys.exit()
+
+    try:
+        review = allow_syscalls(args.app, config.seccomp_filter, tail.pending)
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+
+    if review:
+        print(f"Review the rules of: {', '.join(review)}")
+
+    tail.pending = {}
+    tail.save()
+    print(config.seccomp_filter)
@@ -4,26 +4,27 @@ HOME_DIR = os.path.expanduser("~")
 DIRECTORY = os.path.join(HOME_DIR, ".sandbox_manager")
 
 APP_DIRECTORY = os.path.join(DIRECTORY, "appdata")
+CONFIG_DATABASE = os.path.join(DIRECTORY, "config.db")
+# Where configs were kept as JSON files before the database
 CONFIG_DIRECTORY = os.path.join(DIRECTORY, "config")
 SECCOMP_DIRECTORY = os.path.join(DIRECTORY, "seccomp")
+PLAN_DIRECTORY = os.path.join(DIRECTORY, "plans")
+LOG_DIRECTORY = os.path.join(DIRECTORY, "logs")
 
-try:
-    os.mkdir(DIRECTORY)
+RUNTIME_DIRECTORY = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"),
+                                 "sandbox-manager")
+# One record per running sandbox, named after its cgroup
+SANDBOXES_DIRECTORY = os.path.join(RUNTIME_DIRECTORY, "sandboxes")
+# sandbox-pool's control socket. Sockets of single-instance apps and proxies
+# end in .sock, this one cannot be mistaken for one of an app.
+POOL_SOCKET = os.path.join(RUNTIME_DIRECTORY, "pool.control")
 
-except Exception:
-    pass
+BWRAP = os.environ.get("SANDBOX_MANAGER_BWRAP", "/bin/bwrap")
+XDG_DBUS_PROXY = os.environ.get("SANDBOX_MANAGER_XDG_DBUS_PROXY",
+                                "/usr/bin/xdg-dbus-proxy")
 
-try:
-    os.mkdir(APP_DIRECTORY)
-except Exception:
-    pass
 
-try:
-    os.mkdir(CONFIG_DIRECTORY)
-except Exception:
-    pass
-
-try:
-    os.mkdir(SECCOMP_DIRECTORY)
-except Exception:
-    pass
+def create_directories() -> None:
+    for directory in (DIRECTORY, APP_DIRECTORY, SECCOMP_DIRECTORY,
+                      PLAN_DIRECTORY, LOG_DIRECTORY):
+        os.makedirs(directory, exist_ok=True)
@@ -0,0 +1,141 @@
+import os, re, json, glob
+from typing import Dict, Iterator, Optional
+
+from .config import Config
+from .desktop import exec_argv
+from .syscalls import AUDIT_ARCH, SYSCALLS
+
+AUDIT_LOG = "/var/log/audit/audit.log"
+
+# Actions that let a syscall through are not denials
+SECCOMP_RET_ALLOW = 0x7fff0000
+SECCOMP_RET_LOG = 0x7ffc0000
+
+RECORD = re.compile(r"type=SECCOMP msg=audit\([^)]*\): (.*)")
+FIELD = re.compile(r"(\w+)=(\"[^\"]*\"|\S+)")
+
+
+def audit_fields(line: str) -> Optional[Dict[str, str]]:
+    match = RECORD.search(line)
+
+    if not match:
+        return None
+
+    fields = {}
+
+    for key, value in FIELD.findall(match.group(1)):
+        if value.startswith('"'):
+            value = value[1:-1]
+        elif key in ("comm", "exe"):
+            # Names with spaces or quotes are logged hex encoded
+            try:
+                value = bytes.fromhex(value).decode(errors="replace")
+            except ValueError:
+                pass
+
+        fields.setdefault(key, value)
+
+    return fields
+
+
+class AuditLogTail:
+
+    def __init__(self, log: str, state: str) -> None:
+        self._log = log
+        self._state = state
+
+        self.inode = None
+        self.offset = 0
+        self.pending: Dict[str, int] = {}
+
+        try:
+            with open(state) as fp:
+                data = json.load(fp)
+
+            self.inode = data["inode"]
+            self.offset = data["offset"]
+            self.pending = data["pending"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self._state), exist_ok=True)
+
+        with open(self._state, "w") as fp:
+            json.dump(
+                {
+                    "inode": self.inode,
+                    "offset": self.offset,
+                    "pending": self.pending
+                }, fp)
+
+    def _rotated(self) -> Optional[str]:
+        for path in sorted(glob.glob(f"{self._log}.*")):
+            try:
+                if os.stat(path).st_ino == self.inode:
+                    return path
+            except OSError:
+                continue
+
+    def _read(self, path: str, offset: int) -> Iterator[str]:
+        with open(path, "rb") as fp:
+            fp.seek(offset)
+
+            for line in fp:
+                # Leave a line auditd is still writing for the next read
+                if not line.endswith(b"\n"):
+                    break
+
+                self.offset += len(line)
+                yield line.decode(errors="replace")
+
+    def lines(self) -> Iterator[str]:
+        stat = os.stat(self._log)
+
+        if self.inode is not None and self.inode != stat.st_ino:
+            # Finish the file that was rotated away before starting the new one
+            rotated = self._rotated()
+            if rotated:
+                yield from self._read(rotated, self.offset)
+
+            self.offset = 0
+        elif self.offset > stat.st_size:
+            self.offset = 0
+
+        self.inode = stat.st_ino
+        yield from self._read(self._log, self.offset)
+
+
+class SeccompDenials:
+
+    def __init__(self, app: str, config: Config) -> None:
+        self._path = config.path.rstrip("/") + "/"
+        self._audit_arch = f"{AUDIT_ARCH['x86_64']:x}"
+
+        # The kernel truncates comm to 15 characters
+        argv = exec_argv(config.cmd) if config.cmd else []
+        binary = argv[0] if argv else ""
+        self._comm = os.path.basename(binary)[:15]
+
+        self._names = {nr: name for name, nr in SYSCALLS["x86_64"].items()}
+
+    def denial(self, line: str) -> Optional[str]:
+        fields = audit_fields(line)
+
+        if not fields or fields.get("arch") != self._audit_arch:
+            return None
+
+        try:
+            action = int(fields.get("code", "0"), 16)
+            nr = int(fields["syscall"])
+        except (KeyError, ValueError):
+            return None
+
+        if action & 0xffff0000 in (SECCOMP_RET_ALLOW, SECCOMP_RET_LOG):
+            return None
+
+        if not fields.get("exe", "").startswith(self._path) and \
+                fields.get("comm") != self._comm:
+            return None
+
+        return self._names.get(nr, f"syscall_{nr}")
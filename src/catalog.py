@@ -0,0 +1,321 @@
+import os, json, shutil, select, struct, threading
+from typing import Dict, List, Any, Optional, Callable
+
+from . import DIRECTORY
+from .desktop import DESKTOP_ENTRY_GROUP, read_desktop_entry
+
+CATALOG_FILE = os.path.join(DIRECTORY, "catalog.json")
+CATALOG_VERSION = 1
+
+# inotify(7) events that change what a directory of desktop entries holds
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ONLYDIR = 0x1000000
+
+WATCH_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+
+# Seconds to collect further events before refreshing, package managers
+# touch many files at once
+WATCH_SETTLE = 0.2
+
+# Seconds between refreshes that pick up application directories which did
+# not exist yet and so could not be watched
+WATCH_INTERVAL = 60
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def application_directories() -> List[str]:
+    data_dirs = os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share"
+
+    return [
+        os.path.join(directory, "applications")
+        for directory in data_dirs.split(":") if directory
+    ]
+
+
+def exec_binary(command: Optional[str]) -> Optional[str]:
+    if not command:
+        return None
+
+    if command.startswith('"'):
+        program = command[1:].partition('"')[0]
+    else:
+        program = command.partition(" ")[0]
+
+    program = program if os.path.isabs(program) else shutil.which(program)
+
+    return os.path.realpath(program) if program else None
+
+
+class Catalog:
+
+    def __init__(self, filename: str = CATALOG_FILE) -> None:
+        self._filename = filename
+
+        # Directory mtimes and the subdirectories found in them, and one
+        # record per desktop file
+        self._directories: Dict[str, Dict[str, Any]] = {}
+        self._files: Dict[str, Dict[str, Any]] = {}
+
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self._filename) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return
+
+        if data.get("version") == CATALOG_VERSION:
+            self._directories = data["directories"]
+            self._files = data["files"]
+
+    def save(self) -> None:
+        tmp = f"{self._filename}.{os.getpid()}.tmp"
+
+        try:
+            with open(tmp, "w") as fp:
+                json.dump(
+                    {
+                        "version": CATALOG_VERSION,
+                        "directories": self._directories,
+                        "files": self._files
+                    }, fp)
+
+            os.replace(tmp, self._filename)
+        except OSError:
+            pass
+
+    def _record(self, filename: str, stat: os.stat_result) -> Dict[str, Any]:
+        record = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+        try:
+            group = read_desktop_entry(filename).get(DESKTOP_ENTRY_GROUP)
+        except (OSError, UnicodeError):
+            group = None
+
+        if group is None:
+            return dict(record, valid=False)
+
+        return dict(record,
+                    valid=True,
+                    name=group.get("Name"),
+                    exec=group.get("Exec"),
+                    binary=exec_binary(group.get("TryExec") or
+                                       group.get("Exec")),
+                    icon=group.get("Icon"),
+                    no_display=group.get("NoDisplay") == "true" or
+                    group.get("Hidden") == "true")
+
+    def _scan(self, directory: str, mtime: int) -> List[str]:
+        subdirectories = []
+        present = set()
+
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir():
+                    subdirectories.append(entry.path)
+                    continue
+
+                if not entry.name.endswith(".desktop"):
+                    continue
+
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                present.add(entry.path)
+
+                record = self._files.get(entry.path)
+
+                if not record or record["mtime"] != stat.st_mtime_ns or \
+                        record["size"] != stat.st_size:
+                    self._files[entry.path] = self._record(entry.path, stat)
+
+        for filename in [
+                filename for filename in self._files
+                if os.path.dirname(filename) == directory and
+                filename not in present
+        ]:
+            del self._files[filename]
+
+        self._directories[directory] = {
+            "mtime": mtime,
+            "subdirectories": subdirectories
+        }
+
+        return subdirectories
+
+    def refresh(self, force: Optional[List[str]] = None) -> bool:
+        force = force or []
+        before = (self._directories, self._files)
+
+        self._files = dict(self._files)
+        self._directories = dict(self._directories)
+
+        stack = list(reversed(application_directories()))
+        seen = set()
+
+        # Only directories whose mtime changed are listed again. Desktop files
+        # edited in place do not change it, the watcher forces those.
+        while stack:
+            directory = stack.pop()
+
+            if directory in seen:
+                continue
+
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+
+            seen.add(directory)
+            known = self._directories.get(directory)
+
+            if known and known["mtime"] == mtime and directory not in force:
+                stack.extend(known["subdirectories"])
+                continue
+
+            try:
+                stack.extend(self._scan(directory, mtime))
+            except OSError:
+                continue
+
+        self._directories = {
+            directory: known
+            for directory, known in self._directories.items()
+            if directory in seen
+        }
+        self._files = {
+            filename: record
+            for filename, record in self._files.items()
+            if os.path.dirname(filename) in seen
+        }
+
+        return (self._directories, self._files) != before
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        entries = {}
+
+        # Desktop file IDs are relative to their applications directory with
+        # slashes turned into dashes, earlier data directories take priority
+        for root in reversed(application_directories()):
+            prefix = root + os.sep
+
+            for filename, record in self._files.items():
+                if not filename.startswith(prefix) or not record["valid"]:
+                    continue
+
+                desktop_id = filename[len(prefix):].replace(os.sep, "-")
+                entries[desktop_id] = dict(record, filename=filename)
+
+        return dict(sorted(entries.items()))
+
+    def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        for root in application_directories():
+            filename = os.path.join(root, f"{name}.desktop")
+            record = self._files.get(filename)
+
+            if record and record["valid"]:
+                return dict(record, filename=filename)
+
+        # IDs of entries in subdirectories need the full mapping
+        return self.entries().get(f"{name}.desktop")
+
+    def filename(self, name: str) -> str:
+        entry = self.lookup(name)
+
+        return entry["filename"] if entry \
+            else f"/usr/share/applications/{name}.desktop"
+
+    def directories(self) -> List[str]:
+        return list(self._directories)
+
+
+def shared_catalog() -> Catalog:
+    global _catalog
+
+    # Loaded and refreshed once per process, manifests look up many entries
+    # from several threads
+    with _catalog_lock:
+        if not _catalog:
+            _catalog = Catalog()
+
+            if _catalog.refresh():
+                _catalog.save()
+
+        return _catalog
+
+
+class CatalogWatcher:
+
+    def __init__(self, catalog: Catalog) -> None:
+        import ctypes
+
+        self._catalog = catalog
+        self._libc = ctypes.CDLL(None, use_errno=True)
+
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._watches: Dict[int, str] = {}
+
+    def _add_watches(self) -> None:
+        watched = set(self._watches.values())
+
+        for directory in self._catalog.directories():
+            if directory in watched:
+                continue
+
+            wd = self._libc.inotify_add_watch(self._fd, directory.encode(),
+                                              WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = directory
+
+    def _read_events(self) -> List[str]:
+        data = os.read(self._fd, 65536)
+        directories = []
+        offset = 0
+
+        while offset < len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+            offset += struct.calcsize("iIII") + length
+
+            directory = self._watches.get(wd)
+            if not directory:
+                continue
+
+            if mask & IN_DELETE_SELF:
+                del self._watches[wd]
+
+            directories.append(directory)
+
+        return directories
+
+    def watch(self, changed: Callable[[], None]) -> None:
+        self._add_watches()
+
+        while True:
+            directories = []
+
+            if select.select([self._fd], [], [], WATCH_INTERVAL)[0]:
+                directories = self._read_events()
+
+            while select.select([self._fd], [], [], WATCH_SETTLE)[0]:
+                directories += self._read_events()
+
+            if self._catalog.refresh(force=directories):
+                self._catalog.save()
+                changed()
+
+            self._add_watches()
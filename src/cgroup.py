@@ -0,0 +1,332 @@
+import os, re, functools, itertools
+from argparse import Namespace
+from typing import Dict, List, Optional, Self
+
+# cgroup v2 files an app can be limited with, and the controller of each
+LIMITS = {
+    "cpu.weight": "cpu",
+    "cpu.max": "cpu",
+    "memory.high": "memory",
+    "memory.max": "memory",
+    "io.weight": "io",
+    "pids.max": "pids",
+}
+
+# Controllers enabled for sandboxes when available, only to account for what
+# they used
+ACCOUNTING = {"memory", "io"}
+
+SIZE = re.compile(r"^(\d+)([KMGT]?)i?B?$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+CPU_PERIOD = 100000
+
+# Tells apart the sandboxes one process starts, like those of sandbox-pool
+_sequence = itertools.count()
+
+
+def _weight(name: str, value: str) -> str:
+    if not value.isdigit() or not 1 <= int(value) <= 10000:
+        raise ValueError(f"{name} has to be between 1 and 10000")
+
+    return str(int(value))
+
+
+def _size(name: str, value: str) -> str:
+    match = SIZE.match(value)
+
+    if value == "max":
+        return value
+    if not match:
+        raise ValueError(f"{name} takes a size like 512M or 2G, or max")
+
+    return str(int(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def _cpu_max(name: str, value: str) -> str:
+    # Either a share of one CPU like 150%, or the raw "quota period"
+    if value.endswith("%") and value[:-1].isdigit() and int(value[:-1]):
+        return f"{int(value[:-1]) * CPU_PERIOD // 100} {CPU_PERIOD}"
+
+    quota, _, period = value.partition(" ")
+    period = period or str(CPU_PERIOD)
+
+    if (quota == "max" or quota.isdigit()) and period.isdigit():
+        return f"{quota} {period}"
+
+    raise ValueError(f"{name} takes a percentage like 200%, or quota period")
+
+
+def _pids(name: str, value: str) -> str:
+    if value != "max" and not (value.isdigit() and int(value)):
+        raise ValueError(f"{name} takes a number of processes, or max")
+
+    return value
+
+
+PARSERS = {
+    "cpu.weight": _weight,
+    "cpu.max": _cpu_max,
+    "memory.high": _size,
+    "memory.max": _size,
+    "io.weight": _weight,
+    "pids.max": _pids,
+}
+
+
+def parse_limits(limits: Dict[str, str]) -> Dict[str, str]:
+    unknown = set(limits) - set(LIMITS)
+    if unknown:
+        raise ValueError(f"unknown limits {', '.join(sorted(unknown))}")
+
+    return {
+        name: PARSERS[name](name, str(value).strip())
+        for name, value in limits.items()
+    }
+
+
+def limits_from_args(args: Namespace) -> Dict[str, str]:
+    # sandbox-create flags are named after the files, --memory-max for
+    # memory.max
+    limits = {}
+
+    for name in LIMITS:
+        value = getattr(args, name.replace(".", "_"), None)
+        if value is not None:
+            limits[name] = value
+
+    return parse_limits(limits)
+
+
+def scope_properties(limits: Dict[str, str]) -> List[str]:
+    # The same limits as properties of a transient systemd scope
+    properties = []
+
+    for name, value in limits.items():
+        infinity = "infinity" if value == "max" else value
+
+        if name == "cpu.weight":
+            properties.append(f"CPUWeight={value}")
+        elif name == "io.weight":
+            properties.append(f"IOWeight={value}")
+        elif name == "pids.max":
+            properties.append(f"TasksMax={infinity}")
+        elif name == "memory.high":
+            properties.append(f"MemoryHigh={infinity}")
+        elif name == "memory.max":
+            properties.append(f"MemoryMax={infinity}")
+        elif name == "cpu.max":
+            quota, period = value.split()
+            if quota != "max":
+                properties.append(
+                    f"CPUQuota={int(quota) * 100 // int(period)}%")
+                properties.append(f"CPUQuotaPeriodSec={period}us")
+
+    return properties
+
+
+def cgroup_name(app: str) -> str:
+    return f"sandbox-{app}-{os.getpid()}-{next(_sequence)}"
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def _stale_cgroups(parent: str, app: str) -> List[str]:
+    # Cgroups of the app's sandboxes whose launcher is gone. Those of running
+    # launchers stay, they are empty until the sandbox joins them.
+    name = re.compile(rf"sandbox-{re.escape(app)}-(\d+)-\d+")
+    stale = []
+
+    try:
+        names = os.listdir(parent)
+    except OSError:
+        return []
+
+    for entry in names:
+        match = name.fullmatch(entry)
+
+        if match and not pid_alive(int(match.group(1))):
+            stale.append(os.path.join(parent, entry))
+
+    return stale
+
+
+@functools.lru_cache(maxsize=None)
+def cgroup_mount() -> Optional[str]:
+    try:
+        with open("/proc/self/mountinfo") as fp:
+            for line in fp:
+                fields, _, filesystem = line.partition(" - ")
+
+                if filesystem.split()[0] == "cgroup2":
+                    return fields.split()[4]
+    except (OSError, IndexError):
+        pass
+
+    return None
+
+
+class SandboxCgroup:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @classmethod
+    def of(cls, pid: int) -> Optional[Self]:
+        mount = cgroup_mount()
+
+        try:
+            with open(f"/proc/{pid}/cgroup") as fp:
+                for line in fp:
+                    if line.startswith("0::") and mount:
+                        return cls(mount + line[3:].strip().rstrip("/"))
+        except OSError:
+            pass
+
+        return None
+
+    @staticmethod
+    def _write(path: str, value: str) -> None:
+        with open(path, "w") as fp:
+            fp.write(value)
+
+    @classmethod
+    def create(cls, app: str, limits: Dict[str, str]) -> Optional[Self]:
+        current = cls.of(os.getpid())
+
+        if not current:
+            return None
+
+        # A cgroup with processes cannot hand controllers to children, so the
+        # sandbox goes next to the launcher's cgroup unless that is the root
+        parent = current.path
+        if parent != cgroup_mount():
+            parent = os.path.dirname(parent)
+
+        try:
+            with open(os.path.join(parent, "cgroup.controllers")) as fp:
+                available = fp.read().split()
+
+            controllers = {LIMITS[name] for name in limits}
+            if not controllers.issubset(available):
+                return None
+
+            # Launchers that exec'd bwrap or were killed left empty cgroups
+            for stale in _stale_cgroups(parent, app):
+                try:
+                    os.rmdir(stale)
+                except OSError:
+                    pass
+
+            cls._write(os.path.join(parent, "cgroup.subtree_control"),
+                       " ".join(f"+{name}" for name in sorted(controllers)))
+
+            for name in sorted(ACCOUNTING & set(available) - controllers):
+                try:
+                    cls._write(os.path.join(parent, "cgroup.subtree_control"),
+                               f"+{name}")
+                except OSError:
+                    pass
+
+            cgroup = cls(os.path.join(parent, cgroup_name(app)))
+            os.mkdir(cgroup.path)
+        except OSError:
+            return None
+
+        try:
+            for name, value in limits.items():
+                cls._write(os.path.join(cgroup.path, name), value)
+        except OSError:
+            cgroup.remove()
+            return None
+
+        return cgroup
+
+    def attach(self, pid: int = 0) -> None:
+        # 0 is the writing process, which is how a child joins before exec
+        self._write(os.path.join(self.path, "cgroup.procs"), str(pid))
+
+    def pids(self) -> List[int]:
+        try:
+            with open(os.path.join(self.path, "cgroup.procs")) as fp:
+                return [int(line) for line in fp if line.strip()]
+        except (OSError, ValueError):
+            return []
+
+    def kill(self) -> bool:
+        # cgroup.kill takes every process down at once, including any forked
+        # while it runs, it needs Linux 5.14
+        try:
+            self._write(os.path.join(self.path, "cgroup.kill"), "1")
+        except OSError:
+            return False
+
+        return True
+
+    def usage(self) -> Dict[str, int]:
+        # What the processes of the cgroup used, kept after they all exited
+        usage = {}
+
+        try:
+            with open(os.path.join(self.path, "cpu.stat")) as fp:
+                for line in fp:
+                    key, value = line.split()
+                    if key in ("user_usec", "system_usec"):
+                        usage[key] = int(value)
+        except (OSError, ValueError):
+            pass
+
+        try:
+            with open(os.path.join(self.path, "memory.peak")) as fp:
+                usage["memory.peak"] = int(fp.read())
+        except (OSError, ValueError):
+            pass
+
+        # One line per device, like "8:0 rbytes=1024 wbytes=0 rios=1 ..."
+        try:
+            with open(os.path.join(self.path, "io.stat")) as fp:
+                for line in fp:
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition("=")
+                        if key in ("rbytes", "wbytes"):
+                            usage[key] = usage.get(key, 0) + int(value)
+        except (OSError, ValueError):
+            pass
+
+        return usage
+
+    def remove(self) -> None:
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+
+def systemd_scope(app: str, limits: Dict[str, str]) -> Optional[List[str]]:
+    # Without a delegated cgroup to write to, systemd creates one for a
+    # transient scope that the command runs in
+    import shutil
+
+    systemd_run = shutil.which("systemd-run")
+
+    if not systemd_run or not os.environ.get("DBUS_SESSION_BUS_ADDRESS"):
+        return None
+
+    command = [
+        systemd_run, "--user", "--scope", "--quiet", "--collect",
+        f"--unit={cgroup_name(app)}"
+    ]
+
+    for prop in scope_properties(limits):
+        command += ["-p", prop]
+
+    return command
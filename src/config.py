@@ -1,9 +1,12 @@
-import json
-from typing import Self, Optional
+from typing import Self, Optional, Dict, Any
 
-from . import CONFIG_DIRECTORY
 from .permissions import Permissions, DBusPermissions
 from .desktop import DesktopEntry
+from .store import config_store
+
+# Seconds without a launch after which an app's pre-warmed sandboxes are
+# torn down
+POOL_IDLE = 600
 
 
 class Config:
@@ -17,7 +20,13 @@ class Config:
                  permissions: Permissions,
                  seccomp_filter: Optional[str] = None,
                  dbus_app: Optional[str] = None,
-                 dbus_permissions: Optional[DBusPermissions] = None) -> None:
+                 dbus_permissions: Optional[DBusPermissions] = None,
+                 single_instance: bool = False,
+                 pool_size: int = 0,
+                 pool_idle: int = POOL_IDLE,
+                 limits: Optional[Dict[str, str]] = None,
+                 idle_freeze: int = 0,
+                 minimal_root: bool = False) -> None:
         self.app = app
         self.path = path
         self.icon = icon
@@ -29,10 +38,17 @@ class Config:
         self.dbus_app = dbus_app
         self.dbus_permissions = dbus_permissions
 
-    @classmethod
-    def from_config(cls, config: str) -> Self:
-        data = json.load(open(config))
+        self.single_instance = single_instance
+
+        self.pool_size = pool_size
+        self.pool_idle = pool_idle
+
+        self.limits = limits or {}
+        self.idle_freeze = idle_freeze
+        self.minimal_root = minimal_root
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Self:
         return cls(app=data['app'],
                    path=data['path'],
                    icon=data['icon'],
@@ -42,7 +58,22 @@ class Config:
                    seccomp_filter=data['seccomp_filter'],
                    dbus_app=data['dbus_app'],
                    dbus_permissions=DBusPermissions.from_dict(
-                       data['dbus_permissions']))
+                       data['dbus_permissions']),
+                   single_instance=data.get('single_instance', False),
+                   pool_size=data.get('pool_size', 0),
+                   pool_idle=data.get('pool_idle', POOL_IDLE),
+                   limits=data.get('limits', {}),
+                   idle_freeze=data.get('idle_freeze', 0),
+                   minimal_root=data.get('minimal_root', False))
+
+    @classmethod
+    def from_app(cls, app: str) -> Self:
+        data = config_store().get(app)
+
+        if data is None:
+            raise KeyError(f"No sandboxed application '{app}'")
+
+        return cls.from_dict(data)
 
 
 class ConfigBuilder:
@@ -54,7 +85,13 @@ class ConfigBuilder:
                  permissions: Permissions,
                  seccomp_filter: Optional[str] = None,
                  dbus_app: Optional[str] = None,
-                 dbus_permissions: DBusPermissions = None) -> None:
+                 dbus_permissions: DBusPermissions = None,
+                 single_instance: bool = False,
+                 pool_size: int = 0,
+                 pool_idle: int = POOL_IDLE,
+                 limits: Optional[Dict[str, str]] = None,
+                 idle_freeze: int = 0,
+                 minimal_root: bool = False) -> None:
         self.app = app
         self.path = path
         self.entry = entry
@@ -64,9 +101,17 @@ class ConfigBuilder:
         self.dbus_app = dbus_app
         self.dbus_permissions = dbus_permissions
 
-    def build(self) -> None:
+        self.single_instance = single_instance
+
+        self.pool_size = pool_size
+        self.pool_idle = pool_idle
+
+        self.limits = limits or {}
+        self.idle_freeze = idle_freeze
+        self.minimal_root = minimal_root
 
-        data = {
+    def data(self) -> Dict[str, Any]:
+        return {
             "app": self.app,
             "path": self.path,
             "icon": self.entry._icon,
@@ -75,8 +120,18 @@ class ConfigBuilder:
             "permissions": self.permissions.permissions,
             "seccomp_filter": self.seccomp_filter,
             "dbus_app": self.dbus_app,
-            "dbus_permissions": self.dbus_permissions.permissions
+            "dbus_permissions": self.dbus_permissions.permissions,
+            "single_instance": self.single_instance,
+            "pool_size": self.pool_size,
+            "pool_idle": self.pool_idle,
+            "limits": self.limits,
+            "idle_freeze": self.idle_freeze,
+            "minimal_root": self.minimal_root
         }
 
-        with open(CONFIG_DIRECTORY + "/" + self.app, "w") as fp:
-            fp.write(json.dumps(data, indent=4))
+    def build(self) -> None:
+        config_store().put(self.app, self.data())
+
+
+def update_config(app: str, **values) -> None:
+    config_store().update(app, **values)
@@ -1,14 +1,148 @@
-import os
-from typing import Self
+import os, copy, functools
+from typing import Self, Optional, Dict, List
+
+DESKTOP_ENTRY_GROUP = "Desktop Entry"
+DESKTOP_ACTION_PREFIX = "Desktop Action "
+
+# Keys whose translations, such as Name[de], are carried over
+LOCALIZED_KEYS = ["Name", "GenericName", "Comment", "Keywords"]
+
+DesktopGroups = Dict[str, Dict[str, str]]
+
+# Field codes of Exec that take the files or URLs an app is opened with, and
+# those that are dropped
+FIELD_CODES = ["%f", "%F", "%u", "%U"]
+DROPPED_FIELD_CODES = ["%i", "%c", "%k", "%d", "%D", "%n", "%N", "%v", "%m"]
+
+
+def parse_desktop_entry(data: str) -> DesktopGroups:
+    groups = {}
+    group = None
+
+    for line in data.splitlines():
+        line = line.strip()
+
+        if not line or line.startswith("#"):
+            continue
+
+        if line.startswith("[") and line.endswith("]"):
+            group = groups.setdefault(line[1:-1], {})
+            continue
+
+        key, separator, value = line.partition("=")
+
+        if group is None or not separator:
+            continue
+
+        # Duplicate keys are invalid, the first one wins
+        group.setdefault(key.strip(), value.strip())
+
+    return groups
+
+
+@functools.lru_cache(maxsize=256)
+def _read_desktop_entry(filename: str, mtime_ns: int,
+                        size: int) -> DesktopGroups:
+    with open(filename, encoding="utf-8", errors="surrogateescape") as fp:
+        return parse_desktop_entry(fp.read())
+
+
+def read_desktop_entry(filename: str) -> DesktopGroups:
+    # Cached per file version, callers must not modify the result
+    stat = os.stat(filename)
+
+    return _read_desktop_entry(filename, stat.st_mtime_ns, stat.st_size)
+
+
+def split_exec(command: str) -> List[str]:
+    # Exec values are quoted like a small subset of the shell, with double
+    # quotes and backslash escapes
+    argv = []
+    current = None
+    quoted = escaped = False
+
+    for char in command:
+        if escaped:
+            current = (current or "") + char
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+            current = current or ""
+        elif char in " \t\n" and not quoted:
+            if current is not None:
+                argv.append(current)
+            current = None
+        else:
+            current = (current or "") + char
+
+    if current is not None:
+        argv.append(current)
+
+    return argv
+
+
+def exec_argv(command: str, args: Optional[List[str]] = None) -> List[str]:
+    # The launch arguments go where the first file or URL field code is, or
+    # at the end without one
+    args = list(args or [])
+    argv = []
+    placed = False
+
+    for arg in split_exec(command):
+        if arg in FIELD_CODES:
+            if not placed:
+                argv += args
+                placed = True
+        elif arg not in DROPPED_FIELD_CODES:
+            argv.append(arg.replace("%%", "%"))
+
+    return argv if placed else argv + args
+
+
+def exec_field_code(command: Optional[str]) -> Optional[str]:
+    for arg in split_exec(command or ""):
+        if arg in FIELD_CODES:
+            return arg
+
+    return None
+
+
+def exec_arguments(command: str) -> str:
+    if command.startswith('"'):
+        end = command.find('"', 1)
+        arguments = command[end + 1:] if end > 0 else ""
+    else:
+        _, _, arguments = command.partition(" ")
+
+    return arguments.strip()
+
+
+def _with_arguments(command: str, exec: Optional[str]) -> str:
+    arguments = exec_arguments(exec) if exec else ""
+    return f"{command} -- {arguments}" if arguments else command
 
 
 class DesktopEntry:
 
-    def __init__(self, filename: str, name: str, exec: str, type: str,
-                 icon: str, terminal: str, generic_name: str,
-                 start_notify: str, wm_class: str, mime_type: str,
-                 categories: str, actions: str, keywords: str,
-                 comment: str) -> None:
+    def __init__(self,
+                 filename: str,
+                 name: str,
+                 exec: str,
+                 type: str,
+                 icon: str,
+                 terminal: str,
+                 generic_name: str,
+                 start_notify: str,
+                 wm_class: str,
+                 mime_type: str,
+                 categories: str,
+                 actions: str,
+                 keywords: str,
+                 comment: str,
+                 localized: Optional[Dict[str, str]] = None,
+                 action_groups: Optional[DesktopGroups] = None) -> None:
 
         self._filename = filename
         self._entry = os.path.basename(filename)
@@ -26,6 +160,9 @@ class DesktopEntry:
         self._keywords = keywords
         self._comment = comment
 
+        self._localized = localized or {}
+        self._action_groups = action_groups or {}
+
         self._no_display = False
         self._sandboxed = False
 
@@ -38,34 +175,68 @@ class DesktopEntry:
 
     def set_sandbox_name(self) -> None:
         self._name = f"Sandboxed-{self.name}"
+        self._localized = {
+            key: f"Sandboxed-{value}" if key.startswith("Name[") else value
+            for key, value in self._localized.items()
+        }
         self._sandboxed = True
 
     def set_exec(self, command: str) -> None:
-        self._exec = command
+        # Files and URLs the entry is opened with are passed on to the
+        # sandboxed app, after "--" so options of the app are not taken for
+        # the launcher's
+        field_code = exec_field_code(self._exec)
+        self._exec = f"{command} -- {field_code}" if field_code else command
+
+        # Actions go through the same command, with their own arguments
+        self._action_groups = {
+            action: dict(group,
+                         Exec=_with_arguments(command, group.get("Exec")))
+            for action, group in self._action_groups.items()
+        }
 
     def set_no_display(self) -> None:
         self._no_display = True
 
     def add_category(self, category: str) -> None:
-        self._categories += category + ";"
+        categories = self._categories or ""
+
+        if categories and not categories.endswith(";"):
+            categories += ";"
+
+        self._categories = categories + category + ";"
+
+    def _localized_lines(self, key: str) -> str:
+        return "".join(f"{localized}={value}\n"
+                       for localized, value in self._localized.items()
+                       if localized.startswith(key + "["))
 
     def create_entry(self, app: str) -> None:
         data = "[Desktop Entry]\n"
         data += "Name=" + self._name + "\n" if self._name else ""
+        data += self._localized_lines("Name")
         data += "Exec=" + self._exec + "\n" if self._exec else ""
         data += "Type=" + self._type + "\n" if self._type else ""
         data += "Icon=" + self._icon + "\n" if self._icon else ""
         data += "Terminal=" + self._terminal + "\n" if self._terminal else ""
         data += "GenericName=" + self._generic_name + "\n" if self._generic_name else ""
+        data += self._localized_lines("GenericName")
+        data += "Comment=" + self._comment + "\n" if self._comment else ""
+        data += self._localized_lines("Comment")
         data += "StartupNotify=" + self._start_notify + "\n" if self._start_notify else ""
         data += "StartupWMClass=" + self._wm_class + "\n" if self._wm_class else ""
         data += "MimeType=" + self._mime_type + "\n" if self._mime_type else ""
         data += "Categories=" + self._categories + "\n" if self._categories else ""
         data += "Actions=" + self._actions + "\n" if self._actions else ""
         data += "Keywords=" + self._keywords + "\n" if self._keywords else ""
+        data += self._localized_lines("Keywords")
 
         if self._no_display:
-            data += f"NoDisplay=true"
+            data += f"NoDisplay=true\n"
+
+        for action, group in self._action_groups.items():
+            data += f"\n[{DESKTOP_ACTION_PREFIX}{action}]\n"
+            data += "".join(f"{key}={value}\n" for key, value in group.items())
 
         home_dir = os.path.expanduser("~")
 
@@ -82,55 +253,66 @@ class DesktopEntry:
     @classmethod
     def from_desktop_entry(cls, filename: str) -> Self:
 
-        data = open(filename, "r").read()
+        groups = read_desktop_entry(filename)
+        group = groups.get(DESKTOP_ENTRY_GROUP)
 
-        def get_key_value(key):
-            result = data.split(key + "=")
+        if group is None:
+            raise ValueError(f"{filename} has no [{DESKTOP_ENTRY_GROUP}] group")
 
-            if len(result) > 1:
-                return result[1].split("\n")[0]
+        localized = {
+            key: value
+            for key, value in group.items()
+            if key.partition("[")[0] in LOCALIZED_KEYS and "[" in key
+        }
 
-        name = get_key_value("Name")
-        exec = get_key_value("Exec")
-        type = get_key_value("Type")
-        icon = get_key_value("Icon")
-        terminal = get_key_value("Terminal")
-        comment = get_key_value("Comment")
-        generic_name = get_key_value("GenericName")
-        start_notify = get_key_value("StartupNotify")
-        wm_class = get_key_value("StartupWMClass")
-        mime_type = get_key_value("MimeType")
-        categories = get_key_value("Categories")
-        actions = get_key_value("Actions")
-        keywords = get_key_value("Keywords")
+        # Only actions the entry lists are valid, in the order listed
+        action_groups = {}
+
+        for action in (group.get("Actions") or "").split(";"):
+            action_group = groups.get(DESKTOP_ACTION_PREFIX + action)
+
+            if action and action_group is not None:
+                action_groups[action] = action_group
 
         return cls(filename=filename,
-                   name=name,
-                   exec=exec,
-                   type=type,
-                   icon=icon,
-                   terminal=terminal,
-                   comment=comment,
-                   generic_name=generic_name,
-                   start_notify=start_notify,
-                   wm_class=wm_class,
-                   mime_type=mime_type,
-                   categories=categories,
-                   actions=actions,
-                   keywords=keywords)
-
-
-def desktop_entry_factory(name: str) -> DesktopEntry:
+                   name=group.get("Name"),
+                   exec=group.get("Exec"),
+                   type=group.get("Type"),
+                   icon=group.get("Icon"),
+                   terminal=group.get("Terminal"),
+                   comment=group.get("Comment"),
+                   generic_name=group.get("GenericName"),
+                   start_notify=group.get("StartupNotify"),
+                   wm_class=group.get("StartupWMClass"),
+                   mime_type=group.get("MimeType"),
+                   categories=group.get("Categories"),
+                   actions=group.get("Actions"),
+                   keywords=group.get("Keywords"),
+                   localized=localized,
+                   action_groups=action_groups)
+
+
+def desktop_entry_factory(name: str,
+                          source: Optional[DesktopEntry] = None) -> DesktopEntry:
+    # Callers that already parsed the entry pass it in to avoid reading it
+    # again, the factories only ever modify a copy of it
+    if source:
+        return copy.copy(source)
+
+    from .catalog import shared_catalog
+
     entry = DesktopEntry.from_desktop_entry(
-        filename=f"/usr/share/applications/{name}.desktop")
+        filename=shared_catalog().filename(name))
 
     return entry
 
 
-def sandboxed_desktop_entry_factory(app: str, name: str,
-                                    script: str) -> DesktopEntry:
-    entry = DesktopEntry.from_desktop_entry(
-        filename=f"/usr/share/applications/{name}.desktop")
+def sandboxed_desktop_entry_factory(
+        app: str,
+        name: str,
+        script: str,
+        source: Optional[DesktopEntry] = None) -> DesktopEntry:
+    entry = desktop_entry_factory(name=name, source=source)
 
     entry.add_category("Sandboxed")
     entry.set_exec(script)
@@ -141,9 +323,9 @@ def sandboxed_desktop_entry_factory(app: str, name: str,
     return entry
 
 
-def hidden_desktop_entry_factory(name: str) -> DesktopEntry:
-    entry = DesktopEntry.from_desktop_entry(
-        filename=f"/usr/share/applications/{name}.desktop")
+def hidden_desktop_entry_factory(
+        name: str, source: Optional[DesktopEntry] = None) -> DesktopEntry:
+    entry = desktop_entry_factory(name=name, source=source)
 
     entry.set_no_display()
     entry.create_entry(app=name)
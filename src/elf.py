@@ -0,0 +1,171 @@
+import struct
+from typing import BinaryIO, Dict, List, Optional, Self, Tuple
+
+ELF_MAGIC = b"\x7fELF"
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2MSB = 2
+
+ET_EXEC = 2
+ET_DYN = 3
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+EM_386 = 3
+EM_X86_64 = 62
+EM_AARCH64 = 183
+
+# Offsets of e_phoff, e_phentsize and e_phnum, and the layouts of a program
+# header and a dynamic entry, by ELF class
+LAYOUTS = {
+    ELFCLASS32: ((28, "I"), 42, "IIIIIIII", "iI"),
+    ELFCLASS64: ((32, "Q"), 54, "IIQQQQQQ", "qQ"),
+}
+
+
+class ElfObject:
+
+    def __init__(self,
+                 path: str,
+                 elf_class: int,
+                 machine: int,
+                 interpreter: Optional[str] = None,
+                 soname: Optional[str] = None,
+                 needed: Optional[List[str]] = None,
+                 rpath: Optional[List[str]] = None,
+                 runpath: Optional[List[str]] = None) -> None:
+        self.path = path
+        self.elf_class = elf_class
+        self.machine = machine
+        self.interpreter = interpreter
+        self.soname = soname
+        self.needed = needed or []
+        self.rpath = rpath or []
+        self.runpath = runpath or []
+
+    @property
+    def arch(self) -> Tuple[int, int]:
+        return self.elf_class, self.machine
+
+    @classmethod
+    def read(cls, path: str) -> Optional[Self]:
+        # Only the headers and the dynamic section are read, not the whole
+        # file. None for anything that is not a dynamic executable or
+        # shared object.
+        try:
+            with open(path, "rb") as fp:
+                return cls._read(path, fp)
+        except (OSError, struct.error, ValueError, UnicodeDecodeError):
+            return None
+
+    @classmethod
+    def _read(cls, path: str, fp: BinaryIO) -> Optional[Self]:
+        ident = fp.read(64)
+
+        if len(ident) < 52 or ident[:4] != ELF_MAGIC or \
+                ident[4] not in LAYOUTS:
+            return None
+
+        elf_class = ident[4]
+        order = ">" if ident[5] == ELFDATA2MSB else "<"
+        (phoff_offset, phoff_format), phentsize_offset, program_format, \
+            dynamic_format = LAYOUTS[elf_class]
+
+        elf_type, machine = struct.unpack_from(order + "HH", ident, 16)
+
+        if elf_type not in (ET_EXEC, ET_DYN):
+            return None
+
+        phoff, = struct.unpack_from(order + phoff_format, ident, phoff_offset)
+        phentsize, phnum = struct.unpack_from(order + "HH", ident,
+                                              phentsize_offset)
+
+        fp.seek(phoff)
+        headers = fp.read(phentsize * phnum)
+
+        loads = []
+        dynamic = None
+        interpreter = None
+
+        for index in range(phnum):
+            fields = struct.unpack_from(order + program_format, headers,
+                                        index * phentsize)
+
+            if elf_class == ELFCLASS64:
+                p_type, _, offset, vaddr, _, filesz, _, _ = fields
+            else:
+                p_type, offset, vaddr, _, filesz, _, _, _ = fields
+
+            if p_type == PT_LOAD:
+                loads.append((vaddr, offset, filesz))
+            elif p_type == PT_DYNAMIC:
+                dynamic = (offset, filesz)
+            elif p_type == PT_INTERP:
+                fp.seek(offset)
+                interpreter = fp.read(filesz).rstrip(b"\0").decode()
+
+        elf = cls(path=path,
+                  elf_class=elf_class,
+                  machine=machine,
+                  interpreter=interpreter)
+
+        # Statically linked
+        if dynamic is None:
+            return elf
+
+        fp.seek(dynamic[0])
+        data = fp.read(dynamic[1])
+        size = struct.calcsize(order + dynamic_format)
+        entries: Dict[int, List[int]] = {}
+
+        for offset in range(0, len(data) - size + 1, size):
+            tag, value = struct.unpack_from(order + dynamic_format, data,
+                                            offset)
+            if tag == DT_NULL:
+                break
+
+            entries.setdefault(tag, []).append(value)
+
+        if DT_STRTAB not in entries:
+            return elf
+
+        # DT_STRTAB is an address, found in the file through the segment
+        # that loads it
+        address = entries[DT_STRTAB][0]
+        strtab = next((address - vaddr + offset
+                       for vaddr, offset, filesz in loads
+                       if vaddr <= address < vaddr + filesz), None)
+
+        if strtab is None:
+            return elf
+
+        fp.seek(strtab)
+        strings = fp.read(entries.get(DT_STRSZ, [0])[0])
+
+        def string(offset: int) -> str:
+            return strings[offset:strings.index(b"\0", offset)].decode()
+
+        def paths(tag: int) -> List[str]:
+            return [
+                path for value in entries.get(tag, [])
+                for path in string(value).split(":") if path
+            ]
+
+        elf.needed = [string(value) for value in entries.get(DT_NEEDED, [])]
+        elf.soname = string(entries[DT_SONAME][0]) \
+            if DT_SONAME in entries else None
+        elf.rpath = paths(DT_RPATH)
+        elf.runpath = paths(DT_RUNPATH)
+
+        return elf
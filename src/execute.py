@@ -0,0 +1,237 @@
+import os, sys, time, shlex
+from typing import Optional, Tuple, List
+
+from . import BWRAP
+from .plan import LaunchPlan
+from .cgroup import SandboxCgroup
+from .trace import phase, active_trace, finish_trace
+from .desktop import exec_argv
+
+# Executes cached plans. Only what every launch needs is imported up front,
+# the proxy, log capture and lifecycle are imported by the paths using them.
+
+
+def args_fd(options: List[str]) -> int:
+    # bwrap reads NUL separated options from --args, which keeps long bind
+    # lists off the command line and clear of ARG_MAX
+    fd = os.memfd_create("bwrap-args")
+
+    os.write(fd, b"".join(os.fsencode(option) + b"\0" for option in options))
+    os.lseek(fd, 0, os.SEEK_SET)
+
+    return fd
+
+
+def display_command(command: List[str], options: List[str]) -> str:
+    # What the command line would be with the options inline
+    if "--args" in command:
+        index = command.index("--args")
+        command = command[:index] + options + command[index + 2:]
+
+    return shlex.join(command)
+
+
+def prepare_command(
+    plan: LaunchPlan
+) -> Tuple[List[str], List[int], Optional[int], Optional[SandboxCgroup]]:
+    # Options that only apply to this launch follow --args, the command to
+    # run in the sandbox is appended by the caller after "--"
+    options = args_fd(plan.options)
+    command = [BWRAP, "--args", str(options)]
+    pass_fds = [options]
+    sync_fd = None
+    cgroup = None
+
+    if plan.dbus_app:
+        from .permissions import DBusPermissions
+        from .proxy import XdgDbusProxy
+
+        with phase("dbus-proxy"):
+            sync_fd = XdgDbusProxy(
+                app=plan.dbus_app,
+                permissions=DBusPermissions(plan.dbus_permissions)).acquire()
+
+        # bwrap keeps the proxy alive for as long as the sandbox runs
+        command += ["--sync-fd", str(sync_fd)]
+        pass_fds.append(sync_fd)
+
+    if plan.seccomp_filter:
+        from .seccomp import seccomp_filter_fd
+
+        # Policies are compiled once per content and handed over in a memfd
+        with phase("seccomp"):
+            seccomp_fd = seccomp_filter_fd(plan.seccomp_filter)
+
+        command += ["--seccomp", str(seccomp_fd)]
+        pass_fds.append(seccomp_fd)
+
+    # The child joins the cgroup before it execs bwrap, so everything in the
+    # sandbox is created inside it. Apps without limits get one as well, it
+    # is what sandbox-freeze freezes.
+    with phase("cgroup"):
+        cgroup = SandboxCgroup.create(plan.app, plan.limits)
+
+    if plan.limits and not cgroup:
+        from .cgroup import systemd_scope
+
+        scope = systemd_scope(plan.app, plan.limits)
+
+        if scope:
+            command = scope + command
+        else:
+            print(
+                "Resource limits are not applied, there is no delegated "
+                "cgroup v2 subtree or systemd user session",
+                file=sys.stderr)
+
+    return command, pass_fds, sync_fd, cgroup
+
+
+def execute_plan(plan: LaunchPlan,
+                 args: List[str],
+                 replace: bool = False,
+                 ready_fd: Optional[int] = None) -> None:
+    info_fd = None
+    server = None
+
+    # The launcher of a single-instance app stays around to serve later
+    # launches, so it cannot replace itself with bwrap
+    replace = replace and not plan.single_instance
+
+    command, pass_fds, sync_fd, cgroup = prepare_command(plan)
+    sandbox = None
+
+    # Recorded so sandbox-freeze and sandbox-list find the sandbox
+    if cgroup:
+        from .freezer import RunningSandbox
+
+        sandbox = RunningSandbox(app=plan.app,
+                                 pid=os.getpid(),
+                                 cgroup=cgroup.path)
+        sandbox.save()
+
+    if plan.single_instance:
+        from .instance import InstanceServer
+
+        info_read, info_fd = os.pipe()
+        command += ["--info-fd", str(info_fd)]
+        pass_fds.append(info_fd)
+
+        server = InstanceServer(app=plan.app,
+                                binary_cmd=plan.binary_cmd,
+                                info_fd=info_read,
+                                seccomp_filter=plan.seccomp_filter,
+                                confined=bool(plan.limits))
+
+    # bwrap reports the sandboxed pid once the namespaces are set up, and
+    # the exit code of the app. A launcher that replaces itself is not around
+    # to read it, bwrap tells the caller waiting on ready_fd directly then.
+    trace = active_trace()
+    status_read = status_fd = None
+
+    if not replace:
+        status_read, status_fd = os.pipe()
+        command += ["--json-status-fd", str(status_fd)]
+        pass_fds.append(status_fd)
+    elif ready_fd is not None:
+        command += ["--info-fd", str(ready_fd)]
+        pass_fds.append(ready_fd)
+
+    command += ["--"] + exec_argv(plan.binary_cmd, args)
+
+    print(display_command(command, plan.options))
+    print("------------------")
+
+    if replace:
+        # Become bwrap, leaving no Python process behind for the lifetime of
+        # the app
+        for fd in pass_fds:
+            os.set_inheritable(fd, True)
+
+        if cgroup:
+            cgroup.attach()
+
+        filename = finish_trace()
+        if filename:
+            print(f"Trace written to {filename}", file=sys.stderr)
+
+        os.execv(command[0], command)
+
+    import subprocess
+    from .logs import LogCapture
+    from .lifecycle import SandboxLifecycle
+    from .usage import launch_usage, record_usage
+
+    # Output is streamed into a size-bounded log instead of being buffered
+    # for the lifetime of the application
+    capture = LogCapture(plan.app)
+
+    proxy_pid = None
+    if sync_fd is not None:
+        from .permissions import DBusPermissions
+        from .proxy import XdgDbusProxy
+
+        proxy_pid = XdgDbusProxy(
+            app=plan.dbus_app,
+            permissions=DBusPermissions(plan.dbus_permissions)).pid()
+
+    try:
+        started = time.time()
+        spawned = time.monotonic_ns()
+
+        with phase("spawn"):
+            process = subprocess.Popen(
+                command,
+                pass_fds=pass_fds,
+                preexec_fn=cgroup.attach if cgroup else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+
+        # bwrap holds its own copies, the proxy's FIFO is kept open until the
+        # sandbox is gone
+        for fd in pass_fds:
+            if fd not in (sync_fd, info_fd):
+                os.close(fd)
+
+        lifecycle = SandboxLifecycle(
+            process=process,
+            capture=capture,
+            status_fd=status_read,
+            spawned=spawned,
+            cgroup=cgroup,
+            proxy_pid=proxy_pid,
+            ready_fd=ready_fd)
+
+        if server:
+            os.close(info_fd)
+            server.start()
+
+        returncode = lifecycle.run()
+        rusage = lifecycle.rusage
+
+        # Read from the cgroup before it is removed, sandbox-stats sums the
+        # history up
+        if rusage:
+            record_usage(
+                plan.app,
+                launch_usage(started=started,
+                             wall=(time.monotonic_ns() - spawned) / 1e9,
+                             status=returncode,
+                             rusage=rusage,
+                             cgroup=cgroup))
+
+        if trace and capture.first_output:
+            trace.instant("first-output", capture.first_output)
+    finally:
+        if server:
+            server.stop()
+        if sync_fd is not None:
+            os.close(sync_fd)
+        if sandbox:
+            sandbox.remove()
+        if cgroup:
+            cgroup.remove()
+
+    if returncode:
+        print(capture.format_tail(), file=sys.stderr)
+        raise subprocess.CalledProcessError(returncode, command[0])
@@ -0,0 +1,138 @@
+import os, json
+from typing import Dict, List, Optional, Self
+
+from . import SANDBOXES_DIRECTORY
+from .cgroup import pid_alive
+
+
+class RunningSandbox:
+
+    def __init__(self, app: str, pid: int, cgroup: str) -> None:
+        self.app = app
+        self.pid = pid
+        self.cgroup = cgroup
+
+    @property
+    def filename(self) -> str:
+        return os.path.join(SANDBOXES_DIRECTORY,
+                            os.path.basename(self.cgroup) + ".json")
+
+    @classmethod
+    def load(cls, filename: str) -> Optional[Self]:
+        try:
+            with open(filename) as fp:
+                data = json.load(fp)
+
+            return cls(app=data["app"], pid=data["pid"], cgroup=data["cgroup"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self) -> None:
+        os.makedirs(SANDBOXES_DIRECTORY, mode=0o700, exist_ok=True)
+
+        with open(self.filename + ".tmp", "w") as fp:
+            json.dump({
+                "app": self.app,
+                "pid": self.pid,
+                "cgroup": self.cgroup
+            }, fp)
+
+        os.replace(self.filename + ".tmp", self.filename)
+
+    def remove(self) -> None:
+        try:
+            os.unlink(self.filename)
+        except FileNotFoundError:
+            pass
+
+    def _events(self) -> Dict[str, str]:
+        with open(os.path.join(self.cgroup, "cgroup.events")) as fp:
+            return dict(line.split() for line in fp if line.strip())
+
+    def populated(self) -> bool:
+        try:
+            return self._events().get("populated") == "1"
+        except OSError:
+            return False
+
+    def alive(self) -> bool:
+        # The record is saved before the sandbox joins the cgroup, until then
+        # only the launcher tells that it runs
+        return self.populated() or (os.path.isdir(self.cgroup) and
+                                    pid_alive(self.pid))
+
+    def state(self) -> str:
+        try:
+            with open(os.path.join(self.cgroup, "cgroup.freeze")) as fp:
+                freeze = fp.read().strip() == "1"
+
+            frozen = self._events().get("frozen") == "1"
+        except OSError:
+            return "exited"
+
+        if frozen:
+            return "frozen"
+
+        # The kernel freezes the tasks one by one
+        return "freezing" if freeze else "running"
+
+    def _freeze(self, value: str) -> None:
+        with open(os.path.join(self.cgroup, "cgroup.freeze"), "w") as fp:
+            fp.write(value)
+
+    def freeze(self) -> None:
+        self._freeze("1")
+
+    def thaw(self) -> None:
+        self._freeze("0")
+
+
+def running_sandboxes(app: Optional[str] = None) -> List[RunningSandbox]:
+    try:
+        filenames = os.listdir(SANDBOXES_DIRECTORY)
+    except FileNotFoundError:
+        return []
+
+    sandboxes = []
+
+    for filename in filenames:
+        if not filename.endswith(".json"):
+            continue
+
+        sandbox = RunningSandbox.load(
+            os.path.join(SANDBOXES_DIRECTORY, filename))
+
+        if not sandbox or (app and sandbox.app != app):
+            continue
+
+        # Launchers that exec'd bwrap cannot remove their record
+        if not sandbox.alive():
+            sandbox.remove()
+            continue
+
+        sandboxes.append(sandbox)
+
+    return sandboxes
+
+
+def freeze_app(app: str) -> int:
+    # A sandbox that joins a frozen cgroup would start out frozen
+    sandboxes = [
+        sandbox for sandbox in running_sandboxes(app) if sandbox.populated()
+    ]
+
+    for sandbox in sandboxes:
+        sandbox.freeze()
+
+    return len(sandboxes)
+
+
+def thaw_app(app: str) -> int:
+    thawed = 0
+
+    for sandbox in running_sandboxes(app):
+        if sandbox.state() != "running":
+            sandbox.thaw()
+            thawed += 1
+
+    return thawed
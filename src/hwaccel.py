@@ -0,0 +1,390 @@
+import os, glob, json
+from typing import Any, Dict, List, Optional, Self, Tuple
+
+from . import RUNTIME_DIRECTORY
+
+# Devices only change with a reboot or hotplug, one probe serves all apps
+HWACCEL_CACHE = os.path.join(RUNTIME_DIRECTORY, "hwaccel.json")
+
+DRM_CLASS = "/sys/class/drm"
+CHAR_DEVICES = "/sys/dev/char"
+DEV_DRI = "/dev/dri"
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+# Where distributions install VA-API and VDPAU drivers and Vulkan ICDs
+VA_DIRECTORIES = [
+    "/usr/lib64/dri", "/usr/lib/x86_64-linux-gnu/dri",
+    "/usr/lib/aarch64-linux-gnu/dri", "/usr/lib/dri"
+]
+VDPAU_DIRECTORIES = [
+    "/usr/lib64/vdpau", "/usr/lib/x86_64-linux-gnu/vdpau",
+    "/usr/lib/aarch64-linux-gnu/vdpau", "/usr/lib/vdpau"
+]
+ICD_DIRECTORIES = ["/usr/share/vulkan/icd.d", "/etc/vulkan/icd.d"]
+
+# VA-API drivers in order of preference, the VDPAU driver and the Vulkan
+# driver libraries for each kernel driver
+KERNEL_DRIVERS = {
+    "i915": (["iHD", "i965"], "va_gl", ["libvulkan_intel"]),
+    "xe": (["iHD"], "va_gl", ["libvulkan_intel"]),
+    "amdgpu": (["radeonsi"], "radeonsi", ["libvulkan_radeon", "amdvlk"]),
+    "radeon": (["r600", "radeonsi"], "r600", ["libvulkan_radeon"]),
+    "nouveau": (["nouveau"], "nouveau", ["libvulkan_nouveau"]),
+    "nvidia": (["nvidia"], "nvidia", ["libGLX_nvidia"]),
+    "virtio_gpu": (["virtio_gpu"], None, ["libvulkan_virtio"]),
+}
+
+# The proprietary NVIDIA driver is driven through its own devices
+NVIDIA_DEVICES = [
+    "/dev/nvidiactl", "/dev/nvidia-modeset", "/dev/nvidia-uvm",
+    "/dev/nvidia-uvm-tools"
+]
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except OSError:
+        return None
+
+
+def _driver(device: str) -> Optional[str]:
+    try:
+        return os.path.basename(os.readlink(os.path.join(device, "driver")))
+    except OSError:
+        return None
+
+
+class GpuDevice:
+
+    def __init__(self,
+                 render: str,
+                 card: Optional[str],
+                 numbers: List[str],
+                 sysfs: str,
+                 driver: Optional[str],
+                 pci_id: Optional[str],
+                 primary: bool = False) -> None:
+        self.render = render
+        self.card = card
+        # major:minor of the render and card nodes, how libdrm finds the
+        # device in sysfs
+        self.numbers = numbers
+        self.sysfs = sysfs
+        self.driver = driver
+        self.pci_id = pci_id
+        self.primary = primary
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Self:
+        return cls(**data)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "render": self.render,
+            "card": self.card,
+            "numbers": self.numbers,
+            "sysfs": self.sysfs,
+            "driver": self.driver,
+            "pci_id": self.pci_id,
+            "primary": self.primary
+        }
+
+
+class HwaccelProfile:
+    """
+    The GPUs of this machine and what a sandbox needs to use them: device
+    nodes, their sysfs directories, the drivers for video decoding and
+    Vulkan, and the environment that selects them.
+    """
+
+    def __init__(self,
+                 devices: List[GpuDevice],
+                 nodes: List[str],
+                 links: List[List[str]],
+                 files: List[str],
+                 libraries: List[str],
+                 env: Dict[str, str],
+                 key: Optional[Dict[str, Any]] = None) -> None:
+        self.devices = devices
+        self.nodes = nodes
+        self.links = links
+        # ICD manifests, and the drivers that are loaded with dlopen
+        self.files = files
+        self.libraries = libraries
+        self.env = env
+        self.key = key
+
+    @property
+    def sysfs(self) -> List[str]:
+        return [device.sysfs for device in self.devices]
+
+    @property
+    def primary(self) -> Optional[GpuDevice]:
+        return next((device for device in self.devices if device.primary),
+                    None)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Self:
+        return cls(devices=[
+            GpuDevice.from_dict(device) for device in data["devices"]
+        ],
+                   nodes=data["nodes"],
+                   links=data["links"],
+                   files=data["files"],
+                   libraries=data["libraries"],
+                   env=data["env"],
+                   key=data["key"])
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "devices": [device.as_dict() for device in self.devices],
+            "nodes": self.nodes,
+            "links": self.links,
+            "files": self.files,
+            "libraries": self.libraries,
+            "env": self.env,
+            "key": self.key
+        }
+
+
+def hwaccel_watched() -> List[str]:
+    # Hotplug changes /dev/dri, installing a driver its directory
+    return [DEV_DRI] + VA_DIRECTORIES + VDPAU_DIRECTORIES + ICD_DIRECTORIES
+
+
+def _key() -> Dict[str, Any]:
+    stamp = []
+
+    for path in hwaccel_watched():
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+
+    return {"boot": _read(BOOT_ID), "stamp": stamp}
+
+
+def _probe_devices() -> List[GpuDevice]:
+    devices = []
+
+    for node in sorted(glob.glob(os.path.join(DRM_CLASS, "renderD*"))):
+        sysfs = os.path.realpath(os.path.join(node, "device"))
+        name = os.path.basename(node)
+
+        cards = sorted(
+            os.path.basename(card)
+            for card in glob.glob(os.path.join(sysfs, "drm", "card*"))
+            if "-" not in os.path.basename(card))
+
+        numbers = [
+            number for number in (
+                _read(os.path.join(DRM_CLASS, node_name, "dev"))
+                for node_name in [name] + cards[:1]) if number
+        ]
+
+        vendor = _read(os.path.join(sysfs, "vendor"))
+        device = _read(os.path.join(sysfs, "device"))
+
+        devices.append(
+            GpuDevice(render=os.path.join(DEV_DRI, name),
+                      card=os.path.join(DEV_DRI, cards[0]) if cards else None,
+                      numbers=numbers,
+                      sysfs=sysfs,
+                      driver=_driver(sysfs),
+                      pci_id=f"{vendor[2:]}:{device[2:]}"
+                      if vendor and device else None,
+                      primary=_read(os.path.join(sysfs, "boot_vga")) == "1"))
+
+    # Without a boot VGA device, such as on ARM, the first one is used
+    if devices and not any(device.primary for device in devices):
+        devices[0].primary = True
+
+    return devices
+
+
+def _find_driver(directories: List[str],
+                 filenames: List[str]) -> Optional[Tuple[str, str]]:
+    for filename in filenames:
+        for directory in directories:
+            path = os.path.join(directory, filename)
+
+            if os.path.exists(path):
+                return directory, path
+
+    return None
+
+
+def _vulkan_icds(drivers: List[str]) -> List[Tuple[str, str]]:
+    # Manifests whose library belongs to one of the drivers, with that
+    # library. Software renderers like lavapipe are left out.
+    names = [
+        name for driver in drivers
+        for name in KERNEL_DRIVERS.get(driver, ([], None, []))[2]
+    ]
+    icds = []
+
+    for directory in ICD_DIRECTORIES:
+        for manifest in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            try:
+                with open(manifest) as fp:
+                    library = json.load(fp)["ICD"]["library_path"]
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+
+            if any(os.path.basename(library).startswith(name)
+                   for name in names):
+                icds.append((manifest, library))
+
+    return icds
+
+
+def probe_hwaccel() -> HwaccelProfile:
+    devices = _probe_devices()
+    nodes = []
+    links = []
+
+    for device in devices:
+        nodes += [node for node in (device.render, device.card) if node]
+
+        for number in device.numbers:
+            link = os.path.join(CHAR_DEVICES, number)
+
+            try:
+                links.append([os.readlink(link), link])
+            except OSError:
+                continue
+
+    drivers = [device.driver for device in devices if device.driver]
+
+    if "nvidia" in drivers:
+        nodes += [
+            node for node in NVIDIA_DEVICES + sorted(
+                glob.glob("/dev/nvidia[0-9]*")) if os.path.exists(node)
+        ]
+
+    files = []
+    libraries = []
+    env = {}
+    primary = next((device for device in devices if device.primary), None)
+
+    if primary and primary.driver in KERNEL_DRIVERS:
+        va_drivers, vdpau_driver, _ = KERNEL_DRIVERS[primary.driver]
+
+        found = _find_driver(VA_DIRECTORIES,
+                             [f"{name}_drv_video.so" for name in va_drivers])
+
+        if found:
+            directory, path = found
+            env["LIBVA_DRIVER_NAME"] = os.path.basename(path).removesuffix(
+                "_drv_video.so")
+            env["LIBVA_DRIVERS_PATH"] = directory
+            libraries.append(path)
+
+        found = _find_driver(VDPAU_DIRECTORIES, [
+            f"libvdpau_{vdpau_driver}.so.1", f"libvdpau_{vdpau_driver}.so"
+        ]) if vdpau_driver else None
+
+        if found:
+            directory, path = found
+            env["VDPAU_DRIVER"] = vdpau_driver
+            env["VDPAU_DRIVER_PATH"] = directory
+            libraries.append(path)
+
+    icds = _vulkan_icds(drivers)
+
+    if icds:
+        env["VK_ICD_FILENAMES"] = ":".join(manifest for manifest, _ in icds)
+        files += [manifest for manifest, _ in icds]
+        libraries += [
+            library for _, library in icds if os.path.isabs(library)
+        ]
+
+    return HwaccelProfile(devices=devices,
+                          nodes=nodes,
+                          links=links,
+                          files=files,
+                          libraries=libraries,
+                          env=env)
+
+
+def hwaccel_profile() -> HwaccelProfile:
+    key = _key()
+
+    try:
+        with open(HWACCEL_CACHE) as fp:
+            profile = HwaccelProfile.from_dict(json.load(fp))
+
+        if profile.key == key:
+            return profile
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    profile = probe_hwaccel()
+    profile.key = key
+
+    os.makedirs(RUNTIME_DIRECTORY, exist_ok=True)
+
+    with open(HWACCEL_CACHE + ".tmp", "w") as fp:
+        json.dump(profile.as_dict(), fp)
+
+    os.replace(HWACCEL_CACHE + ".tmp", HWACCEL_CACHE)
+
+    return profile
+
+
+# Programs that show whether an API reaches the GPU, run by sandbox-diagnose
+# inside the app's sandbox
+ACCELERATION_CHECKS = [
+    ("VA-API", ["vainfo"]),
+    ("VDPAU", ["vdpauinfo"]),
+    ("Vulkan", ["vulkaninfo", "--summary"]),
+    ("OpenGL", ["eglinfo", "-B"]),
+]
+
+CHECK_TIMEOUT = 20
+
+SOFTWARE_RENDERERS = ("llvmpipe", "softpipe", "swrast", "lavapipe")
+GPU_DEVICE_TYPES = ("INTEGRATED_GPU", "DISCRETE_GPU", "VIRTUAL_GPU")
+
+
+def _line(output: str, marker: str) -> str:
+    return next((line.strip()
+                 for line in output.splitlines() if marker in line), "")
+
+
+def acceleration_verdict(api: str,
+                         returncode: int,
+                         output: str,
+                         errors: str = "") -> Tuple[str, str]:
+    # "hardware", "software" or "failed", with the line that tells
+    if returncode:
+        lines = [
+            line.strip() for line in (errors or output).splitlines()
+            if line.strip()
+        ]
+        return "failed", lines[-1] if lines else f"exit status {returncode}"
+
+    if api == "VA-API":
+        if "VAProfile" not in output:
+            return "failed", "no decoding profiles"
+        return "hardware", _line(output, "Driver version")
+
+    if api == "VDPAU":
+        return "hardware", _line(output, "Information string")
+
+    if api == "Vulkan":
+        device = _line(output, "deviceName")
+
+        if any(kind in output for kind in GPU_DEVICE_TYPES):
+            return "hardware", device
+        return "software", device or "no GPU devices"
+
+    renderer = _line(output, "renderer")
+
+    if not renderer:
+        return "failed", "no renderer"
+
+    return "software" if any(name in renderer for name in SOFTWARE_RENDERERS) \
+        else "hardware", renderer
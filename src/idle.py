@@ -0,0 +1,197 @@
+import os, time, shutil, threading, subprocess
+from typing import Dict, Optional, Set
+
+from . import HOME_DIR
+from .freezer import freeze_app, thaw_app
+
+# Seconds between checks for apps that went idle
+IDLE_INTERVAL = 10
+
+
+def session_idle() -> Optional[float]:
+    # Seconds since the last input anywhere in the session, from logind
+    session = os.environ.get("XDG_SESSION_ID")
+    loginctl = shutil.which("loginctl")
+
+    if not session or not loginctl:
+        return None
+
+    try:
+        output = subprocess.run([
+            loginctl, "show-session", session, "-p", "IdleHint", "-p",
+            "IdleSinceHintMonotonic"
+        ],
+                                capture_output=True,
+                                text=True,
+                                timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    values = dict(
+        line.split("=", 1) for line in output.splitlines() if "=" in line)
+
+    if values.get("IdleHint") != "yes":
+        return 0.0
+
+    try:
+        since = int(values["IdleSinceHintMonotonic"]) / 1e6
+    except (KeyError, ValueError):
+        return None
+
+    return max(time.clock_gettime(time.CLOCK_MONOTONIC) - since, 0.0)
+
+
+def window_classes(app: str, cmd: str) -> Set[str]:
+    # What the windows of an app are called in WM_CLASS
+    classes = {app.lower()}
+
+    if cmd:
+        classes.add(os.path.basename(cmd.split()[0]).lower())
+
+    entry = os.path.join(HOME_DIR, ".local", "share", "applications",
+                         f"{app}-sandboxed.desktop")
+
+    try:
+        with open(entry) as fp:
+            for line in fp:
+                if line.startswith("StartupWMClass="):
+                    classes.add(line.split("=", 1)[1].strip().lower())
+    except OSError:
+        pass
+
+    return classes
+
+
+class IdleFreezer:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+        self._classes: Dict[str, Set[str]] = {}
+        self._idle: Dict[str, int] = {}
+        self._last_input: Dict[str, float] = {}
+        self._focused: Optional[str] = None
+
+        # Apps frozen here, as opposed to by sandbox-freeze
+        self._frozen: Set[str] = set()
+
+    def _refresh(self) -> None:
+        from .store import config_store
+
+        classes = {}
+        idle = {}
+
+        for app, data in config_store().items().items():
+            if data.get("idle_freeze"):
+                idle[app] = data["idle_freeze"] * 60
+                classes[app] = window_classes(app, data.get("cmd", ""))
+
+        with self._lock:
+            self._classes = classes
+            self._idle = idle
+
+    def _window_app(self, window: str) -> Optional[str]:
+        try:
+            output = subprocess.run(
+                ["xprop", "-id", window, "WM_CLASS"],
+                capture_output=True,
+                text=True,
+                timeout=5).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+
+        # WM_CLASS(STRING) = "instance", "Class"
+        names = {
+            name.strip().strip('"').lower()
+            for name in output.partition("=")[2].split(",")
+        }
+
+        with self._lock:
+            for app, classes in self._classes.items():
+                if names & classes:
+                    return app
+
+        return None
+
+    def _focus(self, app: Optional[str]) -> None:
+        now = time.monotonic()
+
+        with self._lock:
+            if self._focused:
+                self._last_input[self._focused] = now
+
+            self._focused = app
+
+            if app:
+                self._last_input[app] = now
+                self._frozen.discard(app)
+
+        if app:
+            thaw_app(app)
+
+    def _watch_focus(self, process: subprocess.Popen) -> None:
+        # xprop prints the active window every time the focus changes
+        for line in process.stdout:
+            window = line.rsplit("#", 1)[-1].split(",")[0].strip()
+
+            if window.startswith("0x"):
+                self._focus(self._window_app(window))
+
+    def _check(self, focus: bool) -> None:
+        self._refresh()
+
+        now = time.monotonic()
+        idle = None if focus else session_idle()
+
+        # Held throughout, so a focus change waits for the app to be frozen
+        # before it thaws it, and an app that just got focus is not frozen
+        with self._lock:
+            for app, limit in self._idle.items():
+                if focus:
+                    if app == self._focused:
+                        continue
+                    since = now - self._last_input.setdefault(app, now)
+                elif idle is None:
+                    continue
+                else:
+                    since = idle
+
+                if since >= limit and app not in self._frozen:
+                    if freeze_app(app):
+                        print(f"Froze {app} after {int(since // 60)} minutes "
+                              "idle")
+                        self._frozen.add(app)
+
+                # Without knowing which window has focus, any input thaws
+                # what went idle
+                elif not focus and since < limit and app in self._frozen:
+                    thaw_app(app)
+                    self._frozen.discard(app)
+
+    def stop(self, *args) -> None:
+        self._stopping.set()
+
+    def serve(self) -> None:
+        process = None
+
+        if os.environ.get("DISPLAY") and shutil.which("xprop"):
+            process = subprocess.Popen(
+                ["xprop", "-root", "-spy", "_NET_ACTIVE_WINDOW"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True)
+
+            self._refresh()
+            threading.Thread(target=self._watch_focus,
+                             args=(process, ),
+                             daemon=True).start()
+
+        try:
+            while not self._stopping.is_set():
+                self._check(focus=process is not None)
+                self._stopping.wait(IDLE_INTERVAL)
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
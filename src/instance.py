@@ -0,0 +1,195 @@
+import os, json, socket, struct, threading, subprocess
+from typing import List, Optional
+
+from . import BWRAP, RUNTIME_DIRECTORY
+from .desktop import exec_argv
+from .logs import LogCapture
+
+# Namespaces a forwarded launch joins, the network is never unshared
+INSTANCE_NAMESPACES = ["--user", "--mount", "--pid", "--uts", "--ipc"]
+
+
+def control_socket_path(app: str) -> str:
+    return os.path.join(RUNTIME_DIRECTORY, f"{app}.sock")
+
+
+def forward_launch(app: str, args: List[str]) -> bool:
+    path = control_socket_path(app)
+
+    if not os.path.exists(path):
+        return False
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(json.dumps({"args": args}).encode() + b"\n")
+            reply = sock.makefile("rb").readline()
+    except OSError:
+        # Left behind by an instance that did not shut down cleanly
+        return False
+
+    try:
+        return json.loads(reply)["ok"]
+    except (ValueError, KeyError):
+        return False
+
+
+class InstanceServer:
+
+    def __init__(self,
+                 app: str,
+                 binary_cmd: str,
+                 info_fd: int,
+                 seccomp_filter: Optional[str] = None,
+                 confined: bool = False) -> None:
+        self._app = app
+        self._binary_cmd = binary_cmd
+        self._info_fd = info_fd
+        self._seccomp_filter = seccomp_filter
+        self._confined = confined
+
+        self._path = control_socket_path(app)
+        self._socket = None
+        self._child_pid = None
+
+    def _read_child_pid(self) -> Optional[int]:
+        # bwrap writes a JSON object to --info-fd once the sandbox has been
+        # set up. The app inherits the descriptor from bwrap and keeps the
+        # pipe open, so do not wait for end of file.
+        data = b""
+
+        with open(self._info_fd, "rb", buffering=0) as fp:
+            while chunk := fp.read(4096):
+                data += chunk
+
+                try:
+                    return json.loads(data)["child-pid"]
+                except ValueError:
+                    continue
+                except KeyError:
+                    return None
+
+    def _command(self, args: List[str], seccomp_fd: Optional[int]) -> list:
+        pid = self._child_pid
+        command = exec_argv(self._binary_cmd, args)
+
+        # nsenter cannot install a seccomp filter, so a nested bwrap that
+        # shares the whole sandbox root does it instead
+        if seccomp_fd is not None:
+            command = [
+                os.path.realpath(BWRAP), "--bind", "/", "/", "--seccomp",
+                str(seccomp_fd), "--"
+            ] + command
+
+        return ["nsenter", f"--target={pid}", "--preserve-credentials"
+                ] + INSTANCE_NAMESPACES + ["--wd=/", "--"] + command
+
+    def _environment(self) -> dict:
+        with open(f"/proc/{self._child_pid}/environ", "rb") as fp:
+            variables = fp.read().split(b"\0")
+
+        return dict(
+            variable.decode(errors="surrogateescape").split("=", 1)
+            for variable in variables if b"=" in variable)
+
+    def _run(self, args: List[str]) -> None:
+        env = self._environment()
+        seccomp_fd = None
+        cgroup = None
+
+        # Later launches count against the resource limits of the sandbox
+        if self._confined:
+            from .cgroup import SandboxCgroup
+            cgroup = SandboxCgroup.of(self._child_pid)
+
+        if self._seccomp_filter:
+            from .seccomp import seccomp_filter_fd
+            seccomp_fd = seccomp_filter_fd(self._seccomp_filter)
+
+        try:
+            command = self._command(args, seccomp_fd)
+
+            print(" ".join(command))
+            print("------------------")
+
+            process = subprocess.Popen(
+                command,
+                env=env,
+                cwd="/",
+                pass_fds=[seccomp_fd] if seccomp_fd is not None else [],
+                preexec_fn=cgroup.attach if cgroup else None,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        finally:
+            if seccomp_fd is not None:
+                os.close(seccomp_fd)
+
+        threading.Thread(target=self._capture, args=(process, ),
+                         daemon=True).start()
+
+    def _capture(self, process: subprocess.Popen) -> None:
+        # Into the app's rotating log, like the output of the sandbox
+        LogCapture(self._app).pump([process.stdout, process.stderr])
+        process.wait()
+
+    def _handle(self, connection: socket.socket) -> None:
+        credentials = connection.getsockopt(socket.SOL_SOCKET,
+                                            socket.SO_PEERCRED,
+                                            struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", credentials)
+
+        try:
+            request = json.loads(connection.makefile("rb").readline())
+
+            if uid != os.getuid():
+                raise PermissionError("launch requested by another user")
+
+            self._run(request["args"])
+            reply = {"ok": True}
+        except Exception as error:
+            reply = {"ok": False, "error": str(error)}
+
+        connection.sendall(json.dumps(reply).encode() + b"\n")
+
+    def _serve(self) -> None:
+        self._child_pid = self._read_child_pid()
+
+        if not self._child_pid:
+            return
+
+        os.makedirs(RUNTIME_DIRECTORY, mode=0o700, exist_ok=True)
+
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self._path)
+        self._socket.listen()
+
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+
+            with connection:
+                self._handle(connection)
+
+    def start(self) -> None:
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def stop(self) -> None:
+        if not self._socket:
+            return
+
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+        # Wakes up the accept() in the serving thread
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
@@ -1,55 +1,12 @@
-import os, fcntl, subprocess
-from typing import Optional
+import os, sys, subprocess
+from typing import Optional, List, Dict
 
-from . import APP_DIRECTORY
+from . import APP_DIRECTORY, BWRAP
 from .permissions import Permissions, DBusPermissionList, PermissionList
-
-
-class XdgDbusProxy:
-
-    def __init__(self, app: str, permissions: Permissions) -> None:
-        self._app = app
-        self._permissions = permissions
-
-        self._command = ["/usr/bin/xdg-dbus-proxy"]
-        self._xdg_runtime_dir = os.environ['XDG_RUNTIME_DIR']
-
-    def _set_permissions(self) -> None:
-
-        self._command.append(f"--own={self._app}")
-        self._command.append(f"--own={self._app}.*")
-
-        if self._permissions.has_permission(DBusPermissionList.Notifications):
-            self._command.append("--talk=org.freedesktop.portal.Notification")
-        if self._permissions.has_permission(DBusPermissionList.Screencast):
-            self._command.append("--talk=org.freedesktop.portal.Screencast")
-        if self._permissions.has_permission(DBusPermissionList.Screenshot):
-            self._command.append("--talk=org.freedesktop.portal.Screenshot")
-
-    def _set_dbus_proxy_socket(self) -> None:
-        dbus_session_bus_address = os.environ['DBUS_SESSION_BUS_ADDRESS']
-
-        self._command.append(
-            f"{dbus_session_bus_address} {self._xdg_runtime_dir}/xdg-dbus-proxy/{self._app}.sock"
-        )
-
-    def launch(self) -> int:
-
-        self._set_dbus_proxy_socket()
-        self._set_permissions()
-
-        args = " ".join(arg for arg in self._command)
-        print(args)
-        print("------------------")
-
-        os.system(f"mkdir -p {self._xdg_runtime_dir}/xdg-dbus-proxy")
-
-        pid = os.fork()
-
-        if not pid:
-            os.execl(self._command[0], *args.split(" "))
-
-        return pid
+from .plan import LaunchPlan
+from .execute import args_fd, execute_plan
+from .proxy import proxy_socket_path
+from .mounts import optimize_mounts
 
 
 class SandboxLauncher:
@@ -57,13 +14,17 @@ class SandboxLauncher:
     def __init__(
             self,
             binary_cmd: str,
-            args: str,
+            args: List[str],
             app: str,
             path: str,
             permissions: Permissions,
             seccomp_filter: Optional[str] = None,
             dbus_app: Optional[str] = None,
-            dbus_permissions: Optional[DBusPermissionList] = None) -> None:
+            dbus_permissions: Optional[DBusPermissionList] = None,
+            single_instance: bool = False,
+            limits: Optional[Dict[str, str]] = None,
+            minimal_root: bool = False,
+            extra_binaries: Optional[List[str]] = None) -> None:
         self.binary_cmd = binary_cmd
         self.args = args
         self.app = app
@@ -72,8 +33,18 @@ class SandboxLauncher:
         self.seccomp_filter = seccomp_filter
         self.dbus_app = dbus_app
         self.dbus_permissions = dbus_permissions
-
-        self.command = ["/bin/bwrap"]
+        self.single_instance = single_instance
+        self.limits = limits or {}
+        self.minimal_root = minimal_root
+        # Host programs to run in the sandbox besides the app, a minimal
+        # root binds them with their libraries
+        self.extra_binaries = extra_binaries or []
+
+        self.options = []
+        # Files whose changes make the plan stale
+        self.watched = []
+        self.library_view = None
+        self.hwaccel = None
 
         self.wayland_display = os.environ.get('WAYLAND_DISPLAY')
         self.xauthority = os.environ.get('XAUTHORITY')
@@ -83,62 +54,109 @@ class SandboxLauncher:
         self.home = os.environ['HOME']
         self.user = os.environ['USER']
 
-        self.seccomp_fd = None
-        self.xdg_proxy_pid = None
-
     def _bind(self, source: str, dest: Optional[str] = None) -> None:
         dest = dest if dest else source
-        self.command.append(f"--bind-try {source} {dest}")
+        self.options += ["--bind-try", source, dest]
 
     def _ro_bind(self, source: str, dest: Optional[str] = None) -> None:
         dest = dest if dest else source
-        self.command.append(f"--ro-bind-try {source} {dest}")
+        self.options += ["--ro-bind-try", source, dest]
 
     def _dev_bind(self, source: str, dest: Optional[str] = None) -> None:
         dest = dest if dest else source
-        self.command.append(f"--dev-bind-try {source} {dest}")
+        self.options += ["--dev-bind-try", source, dest]
 
     def _set_env(self, env: str, value: str) -> None:
-        self.command.append(f"--setenv {env} {value}")
+        self.options += ["--setenv", env, value]
 
     def _tmpfs_bind(self, path: str) -> None:
-        self.command.append(f"--tmpfs {path}")
+        self.options += ["--tmpfs", path]
 
     def _set_ipc_permission(self) -> None:
         if not self.permissions.has_permission(PermissionList.Ipc):
-            self.command.append("--unshare-ipc")
+            self.options.append("--unshare-ipc")
 
     def _set_security_isolation(self) -> None:
-        self.command.append("--unshare-pid")
-        self.command.append("--unshare-uts")
-        self.command.append("--unshare-cgroup")
-        self.command.append("--unshare-user")
-        self.command.append("--new-session")
+        self.options.append("--unshare-pid")
+        self.options.append("--unshare-uts")
+        self.options.append("--unshare-cgroup")
+        self.options.append("--unshare-user")
+        self.options.append("--new-session")
 
     def _bind_etc_paths(self) -> None:
         etc_bind_paths = [
             "/etc/ssl/certs/ca-bundle.crt",
             "/etc/ssl/certs/ca-certificates.crt", "/etc/resolv.conf",
-            "/etc/hosts", "/etc/ld.so.preload", "/etc/ld.so.conf",
-            "/etc/ld.so.cache", "/etc/ld.so.conf.d", "/etc/fonts"
+            "/etc/hosts", "/etc/ld.so.preload", "/etc/fonts"
         ]
 
+        # A minimal root brings its own ld.so.cache
+        if not self.library_view:
+            etc_bind_paths += [
+                "/etc/ld.so.conf", "/etc/ld.so.cache", "/etc/ld.so.conf.d"
+            ]
+
         for path in etc_bind_paths:
             self._ro_bind(path)
 
-    def _bind_filesystem_paths(self) -> None:
-        fs_bind_paths = ["/usr", "/lib64", "/lib", "/usr", "/proc", "/dev"]
+    def _set_library_view(self) -> None:
+        # Only building a plan scans libraries, a warm launch does not load
+        # the scanner
+        from .libraries import HOST_LD_CACHE, app_binary, library_view
 
-        for path in fs_bind_paths:
-            self._ro_bind(path)
+        binary = app_binary(self.binary_cmd, self.path)
+
+        if not binary:
+            print(f"Cannot find the binary of '{self.binary_cmd}', using the "
+                  "full root",
+                  file=sys.stderr)
+            return
+
+        # Video and Vulkan drivers are loaded with dlopen
+        extra = self.extra_binaries + (self.hwaccel.libraries
+                                       if self.hwaccel else [])
+
+        # Launches handed to a single instance install their seccomp filter
+        # with a nested bwrap, which has to be in the sandbox
+        if self.single_instance and self.seccomp_filter:
+            extra.append(os.path.realpath(BWRAP))
+        view = library_view(binary, self.path, extra)
+
+        if not view:
+            return
+
+        if view.missing:
+            print(f"Libraries of {binary} not found: "
+                  f"{', '.join(view.missing)}",
+                  file=sys.stderr)
 
-        self.command.append("--dev /dev")
-        self.command.append("--proc /proc")
+        # An app update or a change to the host's libraries scans again
+        self.watched += [binary, HOST_LD_CACHE]
+        self.library_view = view
+
+    def _bind_minimal_root(self) -> None:
+        for target, link in self.library_view.links:
+            self.options += ["--symlink", target, link]
+
+        for source, dest in self.library_view.binds:
+            self._ro_bind(source, dest)
+
+        self._ro_bind(self.library_view.cache, "/etc/ld.so.cache")
+
+    def _bind_filesystem_paths(self) -> None:
+        if self.library_view:
+            self._bind_minimal_root()
+        else:
+            for path in ["/usr", "/lib64", "/lib"]:
+                self._ro_bind(path)
+
+        self.options += ["--dev", "/dev"]
+        self.options += ["--proc", "/proc"]
 
         self._tmpfs_bind("/var")
         self._tmpfs_bind("/tmp")
 
-        self.command.append(f"--tmpfs /run --dir {self.xdg_runtime_dir}")
+        self.options += ["--tmpfs", "/run", "--dir", self.xdg_runtime_dir]
 
     def _set_display(self) -> None:
         if self.display:
@@ -154,10 +172,31 @@ class SandboxLauncher:
             self._ro_bind(f"{self.xdg_runtime_dir}/{self.wayland_display}")
 
     def _set_dri(self) -> None:
-        if self.permissions.has_permission(PermissionList.Dri):
-            self._dev_bind("/dev/dri")
-            self._ro_bind("/sys/devices/pci0000:00")
-            self._ro_bind("/sys/dev/char")
+        if not self.hwaccel:
+            return
+
+        # Only the GPUs' nodes and sysfs directories, libdrm finds the
+        # latter through the /sys/dev/char links
+        for node in self.hwaccel.nodes:
+            self._dev_bind(node)
+
+        for sysfs in self.hwaccel.sysfs:
+            self._ro_bind(sysfs)
+
+        for target, link in self.hwaccel.links:
+            self.options += ["--symlink", target, link]
+
+        # A minimal root binds the drivers with their libraries, the full
+        # root only lacks those installed outside /usr
+        for path in self.hwaccel.files + ([] if self.library_view else
+                                          self.hwaccel.libraries):
+            self._ro_bind(path)
+
+        for env, value in self.hwaccel.env.items():
+            self._set_env(env, value)
+
+        from .hwaccel import hwaccel_watched
+        self.watched += hwaccel_watched()
 
     def _set_audio(self) -> None:
         if self.permissions.has_permission(PermissionList.Pulseaudio):
@@ -176,9 +215,11 @@ class SandboxLauncher:
         else:
             self._bind(source=f"{APP_DIRECTORY}/{self.app}", dest=self.home)
 
-    def _launch_xdg_dbus_proxy(self) -> Optional[int]:
+    def _bind_xdg_dbus_proxy(self) -> None:
         if self.permissions.has_permission(PermissionList.Dbus):
-            xdg_socket_path = f"{self.xdg_runtime_dir}/xdg-dbus-proxy/{self.dbus_app}.sock"
+            xdg_socket_path = proxy_socket_path(self.xdg_runtime_dir,
+                                                self.dbus_app,
+                                                self.dbus_permissions)
             self._ro_bind(source=xdg_socket_path, dest="/run/user/1000/bus")
 
             self._ro_bind("/var/lib/dbus/machine-id")
@@ -186,15 +227,20 @@ class SandboxLauncher:
             self._set_env("DBUS_SESSION_BUS_ADDRESS",
                           "unix:path=/run/user/1000/bus")
 
-            return XdgDbusProxy(app=self.dbus_app,
-                                permissions=self.dbus_permissions).launch()
-
     def _set_misc(self) -> None:
         self._set_env("GTK_THEME", "Adwaita:dark")
         self._set_env("XDG_DATA_DIRS", self.xdg_data_dirs)
         self._bind(f"/home/{self.user}/.config/mimeapps.list")
 
-    def launch(self) -> None:
+    def build(self) -> LaunchPlan:
+        # Probed while building the plan only, warm launches reuse its options
+        if self.permissions.has_permission(PermissionList.Dri):
+            from .hwaccel import hwaccel_profile
+            self.hwaccel = hwaccel_profile()
+
+        if self.minimal_root:
+            self._set_library_view()
+
         self._set_security_isolation()
         self._set_ipc_permission()
 
@@ -202,39 +248,62 @@ class SandboxLauncher:
         self._bind_filesystem_paths()
 
         self._set_display()
+        self._set_dri()
 
         self._set_shared_downloads()
         self._set_shared_home()
 
         self._set_misc()
 
-        xdg_dbus_proxy_pid = self._launch_xdg_dbus_proxy()
+        self._bind_xdg_dbus_proxy()
         self._ro_bind(self.path)
 
-        if self.seccomp_filter:
-            fd = open(self.seccomp_filter, "r")
-            self.seccomp_fd = os.dup(fd.fileno())
-            fcntl.fcntl(
-                self.seccomp_fd, fcntl.F_SETFD,
-                fcntl.fcntl(self.seccomp_fd, fcntl.F_GETFD)
-                & ~fcntl.FD_CLOEXEC)
+        dbus = self.permissions.has_permission(PermissionList.Dbus)
+
+        # Which system paths exist is settled once here instead of by bwrap
+        # on every launch, sockets in the runtime directory are left to it
+        options, missing = optimize_mounts(self.options,
+                                           volatile=[self.xdg_runtime_dir])
+
+        return LaunchPlan(
+            app=self.app,
+            options=options,
+            missing=missing,
+            watched=self.watched,
+            binary_cmd=self.binary_cmd,
+            seccomp_filter=self.seccomp_filter,
+            dbus_app=self.dbus_app if dbus else None,
+            dbus_permissions=int(self.dbus_permissions) if dbus else None,
+            single_instance=self.single_instance,
+            limits=self.limits)
 
-            self.command.append(f"--seccomp {self.seccomp_fd}")
-
-        self.command.append(self.binary_cmd)
-        self.command.append(self.args)
-
-        command_args = " ".join(arg for arg in self.command[1:])
-        print(self.command[0], command_args)
-        print("------------------")
-
-        if self.seccomp_fd:
-            subprocess.check_output(f"{self.command[0]} {command_args}",
-                                    shell=True,
-                                    pass_fds=[self.seccomp_fd])
-        else:
-            subprocess.check_output(f"{self.command[0]} {command_args}",
-                                    shell=True)
-
-        if xdg_dbus_proxy_pid:
-            os.kill(xdg_dbus_proxy_pid, 9)
+    def launch(self) -> None:
+        execute_plan(self.build(), self.args)
+
+
+def run_plan(plan: LaunchPlan, argv: List[str],
+             timeout: float) -> subprocess.CompletedProcess:
+    # Runs a command in the app's sandbox, without the proxy, cgroup and
+    # log capture of a launch
+    options = args_fd(plan.options)
+    command = [BWRAP, "--args", str(options)]
+    pass_fds = [options]
+
+    if plan.seccomp_filter:
+        from .seccomp import seccomp_filter_fd
+
+        seccomp_fd = seccomp_filter_fd(plan.seccomp_filter)
+        command += ["--seccomp", str(seccomp_fd)]
+        pass_fds.append(seccomp_fd)
+
+    try:
+        return subprocess.run(command + ["--"] + argv,
+                              pass_fds=pass_fds,
+                              stdin=subprocess.DEVNULL,
+                              capture_output=True,
+                              text=True,
+                              errors="replace",
+                              timeout=timeout)
+    finally:
+        for fd in pass_fds:
+            os.close(fd)
@@ -0,0 +1,332 @@
+import os, re, json
+from typing import Dict, List, Optional, Self, Set, Tuple
+
+from . import SECCOMP_DIRECTORY
+from .config import update_config
+from .seccomp import (CONSTANTS, MASK_64, compiled_filter, is_policy,
+                      machine, parse_policy)
+from .syscalls import SYSCALLS
+
+# Files bigger than this are split between worker processes
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Syscalls bwrap's exec of the application and its teardown always need
+BASELINE_SYSCALLS = ["execve", "exit", "exit_group", "rt_sigreturn"]
+
+# Arguments whose observed values become the only ones allowed
+ARGUMENT_FILTERS = {
+    "ioctl": 1,
+    "fcntl": 1,
+    "socket": 0,
+    "prctl": 0,
+}
+
+# Syscalls that only get to map executable memory if a trace shows it
+PROT_EXEC_FILTERS = {"mmap": 2, "mprotect": 2, "pkey_mprotect": 2}
+
+# More distinct values than this and an argument filter is not worth it
+MAX_ARGUMENT_VALUES = 32
+
+PROT_EXEC = CONSTANTS["PROT_EXEC"]
+
+# Optional "[pid N]" or pid column and timestamp, then either the syscall or
+# the resumed half of one that was interrupted
+LINE = re.compile(r"^(?:\[pid\s+\d+\]\s+|\d+\s+)?(?:[\d:.]+\s+)?"
+                  r"(?:<\.\.\. (\w+) resumed>|(\w+)\((.*))$")
+
+
+def split_arguments(text: str) -> List[str]:
+    arguments = []
+    current = ""
+    depth = 0
+    quoted = False
+    escaped = False
+
+    for char in text:
+        if quoted:
+            current += char
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                quoted = False
+            continue
+
+        if char == '"':
+            quoted = True
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            if depth == 0:
+                break
+            depth -= 1
+        elif char == "," and depth == 0:
+            arguments.append(current.strip())
+            current = ""
+            continue
+
+        current += char
+
+    arguments.append(current.strip())
+    return arguments
+
+
+def parse_value(text: str) -> Optional[int]:
+    value = 0
+
+    for term in text.split("|"):
+        term = term.strip()
+
+        try:
+            value |= int(term, 0) & MASK_64
+        except ValueError:
+            if term not in CONSTANTS:
+                return None
+            value |= CONSTANTS[term]
+
+    return value
+
+
+class SyscallProfile:
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {}
+        self.unknown: Dict[str, int] = {}
+
+        # Values seen per filtered argument, None once one could not be read
+        # or there are too many to list
+        self.values: Dict[str, Optional[Set[int]]] = {}
+
+    def _add_value(self, name: str, value: Optional[int]) -> None:
+        values = self.values.setdefault(name, set())
+
+        if values is None:
+            return
+
+        if value is None or len(values) >= MAX_ARGUMENT_VALUES:
+            self.values[name] = None
+        else:
+            values.add(value)
+
+    def add(self, name: str, arguments: Optional[str]) -> None:
+        # Resumed calls were counted, and had their arguments recorded, when
+        # they started
+        if arguments is None:
+            return
+
+        if name not in SYSCALLS["x86_64"]:
+            self.unknown[name] = self.unknown.get(name, 0) + 1
+            return
+
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+        index = ARGUMENT_FILTERS.get(name, PROT_EXEC_FILTERS.get(name))
+        if index is None:
+            return
+
+        values = split_arguments(arguments)
+        value = parse_value(values[index]) if index < len(values) else None
+
+        if name in PROT_EXEC_FILTERS:
+            value = None if value is None else value & PROT_EXEC
+
+        self._add_value(name, value)
+
+    def merge(self, other: Self) -> None:
+        for name, count in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+        for name, count in other.unknown.items():
+            self.unknown[name] = self.unknown.get(name, 0) + count
+
+        for name, values in other.values.items():
+            if values is None:
+                self.values[name] = None
+                continue
+
+            for value in values:
+                self._add_value(name, value)
+
+    def to_dict(self) -> dict:
+        return {
+            "counts": self.counts,
+            "values": {
+                name: sorted(values) if values is not None else None
+                for name, values in self.values.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Self:
+        profile = cls()
+        profile.counts = data["counts"]
+        profile.values = {
+            name: set(values) if values is not None else None
+            for name, values in data["values"].items()
+        }
+
+        return profile
+
+    def _rule(self, name: str) -> str:
+        values = self.values.get(name)
+
+        if values is None:
+            return "1"
+
+        if name in PROT_EXEC_FILTERS:
+            return "1" if PROT_EXEC in values else \
+                f"arg{PROT_EXEC_FILTERS[name]} in ~PROT_EXEC"
+
+        return " || ".join(f"arg{ARGUMENT_FILTERS[name]} == {value:#x}"
+                           for value in sorted(values))
+
+    def to_policy(self) -> str:
+        names = sorted(self.counts, key=lambda name: -self.counts[name])
+        names += [name for name in BASELINE_SYSCALLS if name not in names]
+
+        return "".join(f"{name}: {self._rule(name)}\n" for name in names)
+
+
+def parse_chunk(filename: str, start: int, end: int) -> SyscallProfile:
+    profile = SyscallProfile()
+
+    with open(filename, "rb") as fp:
+        fp.seek(start)
+
+        # A line belongs to the chunk it starts in
+        if start:
+            fp.seek(start - 1)
+            fp.readline()
+
+        while fp.tell() < end:
+            line = fp.readline()
+
+            if not line:
+                break
+
+            match = LINE.match(line.decode(errors="replace").rstrip("\n"))
+
+            if not match:
+                continue
+
+            if match.group(1):
+                profile.add(match.group(1), None)
+            else:
+                profile.add(match.group(2), match.group(3))
+
+    return profile
+
+
+def _parse_chunk(chunk: Tuple[str, int, int]) -> SyscallProfile:
+    return parse_chunk(*chunk)
+
+
+def trace_chunks(filenames: List[str]) -> List[Tuple[str, int, int]]:
+    chunks = []
+
+    for filename in filenames:
+        size = os.path.getsize(filename)
+
+        for start in range(0, max(size, 1), CHUNK_SIZE):
+            chunks.append((filename, start, min(start + CHUNK_SIZE, size)))
+
+    return chunks
+
+
+def learn_traces(filenames: List[str],
+                 jobs: Optional[int] = None) -> SyscallProfile:
+    chunks = trace_chunks(filenames)
+    profile = SyscallProfile()
+
+    if len(chunks) == 1 or jobs == 1:
+        for chunk in chunks:
+            profile.merge(_parse_chunk(chunk))
+
+        return profile
+
+    from multiprocessing import Pool
+
+    # Workers only send back their small profiles, never trace lines
+    with Pool(jobs) as pool:
+        for result in pool.imap_unordered(_parse_chunk, chunks):
+            profile.merge(result)
+
+    return profile
+
+
+def app_seccomp_directory(app: str) -> str:
+    return os.path.join(SECCOMP_DIRECTORY, app)
+
+
+def load_app_profile(app: str) -> SyscallProfile:
+    filename = os.path.join(app_seccomp_directory(app), "learned.json")
+
+    try:
+        with open(filename) as fp:
+            return SyscallProfile.from_dict(json.load(fp))
+    except FileNotFoundError:
+        return SyscallProfile()
+
+
+def save_app_profile(app: str, profile: SyscallProfile) -> str:
+    directory = app_seccomp_directory(app)
+    policy = os.path.join(directory, f"{app}.policy")
+
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, "learned.json"), "w") as fp:
+        json.dump(profile.to_dict(), fp)
+
+    with open(policy, "w") as fp:
+        fp.write(profile.to_policy())
+
+    # Fails before the app is switched over to a policy that does not build
+    compiled_filter(policy)
+    update_config(app, seccomp_filter=policy)
+
+    return policy
+
+
+def allow_syscalls(app: str, seccomp_filter: Optional[str],
+                   denied: Dict[str, int]) -> List[str]:
+    if not seccomp_filter or not is_policy(seccomp_filter):
+        raise ValueError(f"{app} has no seccomp policy that can be patched")
+
+    directory = app_seccomp_directory(app)
+    unknown = [name for name in denied if name not in SYSCALLS["x86_64"]]
+
+    # Learned policies are rebuilt from their profile, with the argument
+    # filters of denied syscalls dropped since audit does not log arguments
+    if os.path.exists(os.path.join(directory, "learned.json")) and \
+            os.path.dirname(seccomp_filter) == directory:
+        profile = load_app_profile(app)
+
+        for name, count in denied.items():
+            if name in unknown:
+                continue
+
+            profile.counts[name] = profile.counts.get(name, 0) + count
+            if name in profile.values:
+                profile.values[name] = None
+
+        save_app_profile(app, profile)
+        return unknown
+
+    # Hand written policies get new lines, rules that exist and still denied
+    # the syscall are left to the user
+    with open(seccomp_filter) as fp:
+        text = fp.read()
+
+    rules = {rule.name for rule in parse_policy(text, machine(), seccomp_filter)}
+    review = unknown + [name for name in denied if name in rules]
+    added = [name for name in denied if name not in review]
+
+    if added:
+        with open(seccomp_filter, "a") as fp:
+            if text and not text.endswith("\n"):
+                fp.write("\n")
+            fp.write("".join(f"{name}: 1\n" for name in added))
+
+    compiled_filter(seccomp_filter)
+
+    return review
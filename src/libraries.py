@@ -0,0 +1,500 @@
+import os, sys, json, shutil, struct, hashlib
+from functools import cmp_to_key
+from typing import Any, Dict, List, Optional, Self, Tuple
+
+from . import DIRECTORY
+from .elf import (ElfObject, ELFCLASS32, ELFCLASS64, EM_386,
+                  EM_X86_64, EM_AARCH64)
+
+LIBRARY_DIRECTORY = os.path.join(DIRECTORY, "libraries")
+
+HOST_LD_CACHE = "/etc/ld.so.cache"
+
+# ld.so.cache as written by glibc 2.32 and later, the older format may
+# precede it in the same file
+CACHE_MAGIC = b"glibc-ld.so.cache1.1"
+OLD_CACHE_MAGIC = b"ld.so-1.7.0"
+OLD_CACHE_ENTRY = 12
+CACHE_HEADER = struct.Struct("=20sIIB3xI12x")
+CACHE_ENTRY = struct.Struct("=iIIIQ")
+CACHE_LITTLE_ENDIAN = 2
+CACHE_BIG_ENDIAN = 3
+
+# The flags ld.so accepts in cache entries, by ELF class and machine
+CACHE_FLAGS = {
+    (ELFCLASS64, EM_X86_64): 0x0303,
+    (ELFCLASS32, EM_386): 0x0003,
+    (ELFCLASS64, EM_AARCH64): 0x0a03,
+}
+
+# Directories ld.so searches after the cache
+DEFAULT_DIRECTORIES = {
+    ELFCLASS64: ["/lib64", "/usr/lib64"],
+    ELFCLASS32: ["/lib", "/usr/lib"],
+}
+
+# Loaded with dlopen, which DT_NEEDED does not show: libraries that come
+# with a library in the graph, and directories of plugins next to it
+DLOPENED = {
+    "libc.so.6": ([
+        "libnss_files.so.2", "libnss_dns.so.2", "libnss_myhostname.so.2",
+        "libnss_resolve.so.2", "libnss_systemd.so.2", "libgcc_s.so.1"
+    ], ["gconv"]),
+    "libEGL.so.1": (["libEGL_mesa.so.0"], ["dri"]),
+    "libGLX.so.0": (["libGLX_mesa.so.0"], ["dri"]),
+    "libGL.so.1": (["libGLX_mesa.so.0"], ["dri"]),
+    "libgdk_pixbuf-2.0.so.0": ([], ["gdk-pixbuf-2.0"]),
+    "libgio-2.0.so.0": ([], ["gio/modules"]),
+    "libgtk-3.so.0": ([], ["gtk-3.0"]),
+    "libgtk-4.so.1": ([], ["gtk-4.0"]),
+    "libgstreamer-1.0.so.0": ([], ["gstreamer-1.0"]),
+    "libpipewire-0.3.so.0": ([], ["pipewire-0.3", "spa-0.2"]),
+    "libpulse.so.0": ([], ["pulseaudio"]),
+    "libasound.so.2": ([], ["alsa-lib"]),
+    "libQt5Core.so.5": ([], ["qt5/plugins"]),
+    "libQt6Core.so.6": ([], ["qt6/plugins"]),
+}
+
+# Bound in every minimal root: data, locales, and the shell system() and
+# the pre-warmed pool run
+MINIMAL_ROOT_PATHS = ["/usr/share", "/usr/lib/locale"]
+MINIMAL_ROOT_EXECUTABLES = ["/bin/sh"]
+
+# Top level directories that merged /usr systems link into /usr
+ROOT_LINKS = ["/bin", "/sbin", "/lib", "/lib64", "/lib32", "/libx32"]
+
+
+def _libcmp(first: str, second: str) -> int:
+    # ld.so's _dl_cache_libcmp, numbers within names compare by value
+    index = other = 0
+
+    while index < len(first):
+        if first[index].isdigit():
+            if other >= len(second) or not second[other].isdigit():
+                return 1
+
+            start = index
+            while index < len(first) and first[index].isdigit():
+                index += 1
+            value = int(first[start:index])
+
+            start = other
+            while other < len(second) and second[other].isdigit():
+                other += 1
+
+            if value != int(second[start:other]):
+                return value - int(second[start:other])
+        elif other < len(second) and second[other].isdigit():
+            return -1
+        elif other >= len(second) or first[index] != second[other]:
+            return ord(first[index]) - (ord(second[other])
+                                        if other < len(second) else 0)
+        else:
+            index += 1
+            other += 1
+
+    return -1 if other < len(second) else 0
+
+
+def read_ld_cache(
+        filename: str = HOST_LD_CACHE) -> Dict[int, Dict[str, str]]:
+    # Library paths by flags and soname, the first entry of a soname wins
+    # like it does for ld.so
+    try:
+        with open(filename, "rb") as fp:
+            data = fp.read()
+    except OSError:
+        return {}
+
+    offset = 0
+
+    if data.startswith(OLD_CACHE_MAGIC):
+        count, = struct.unpack_from("=I", data, 12)
+        offset = (16 + count * OLD_CACHE_ENTRY + 7) & ~7
+
+    if data[offset:offset + len(CACHE_MAGIC)] != CACHE_MAGIC:
+        return {}
+
+    _, count, _, _, _ = CACHE_HEADER.unpack_from(data, offset)
+    libraries: Dict[int, Dict[str, str]] = {}
+
+    def string(position: int) -> str:
+        position += offset
+        return os.fsdecode(data[position:data.index(b"\0", position)])
+
+    for index in range(count):
+        flags, key, value, _, hwcap = CACHE_ENTRY.unpack_from(
+            data, offset + CACHE_HEADER.size + index * CACHE_ENTRY.size)
+
+        # glibc-hwcaps subdirectories are left to the plain entries
+        if hwcap:
+            continue
+
+        libraries.setdefault(flags, {}).setdefault(string(key), string(value))
+
+    return libraries
+
+
+def write_ld_cache(filename: str, libraries: Dict[str, str],
+                   flags: int) -> None:
+    # ld.so binary searches the entries, ldconfig sorts them descending
+    sonames = sorted(libraries, key=cmp_to_key(lambda a, b: _libcmp(b, a)))
+    start = CACHE_HEADER.size + len(sonames) * CACHE_ENTRY.size
+
+    entries = b""
+    strings = b""
+
+    for soname in sonames:
+        key = start + len(strings)
+        strings += os.fsencode(soname) + b"\0"
+        value = start + len(strings)
+        strings += os.fsencode(libraries[soname]) + b"\0"
+
+        entries += CACHE_ENTRY.pack(flags, key, value, 0, 0)
+
+    endian = CACHE_LITTLE_ENDIAN if sys.byteorder == "little" else \
+        CACHE_BIG_ENDIAN
+
+    with open(filename + ".tmp", "wb") as fp:
+        fp.write(
+            CACHE_HEADER.pack(CACHE_MAGIC, len(sonames), len(strings), endian,
+                              0) + entries + strings)
+
+    os.replace(filename + ".tmp", filename)
+
+
+def sandbox_path(path: str) -> str:
+    # Where a host path is bound in a minimal root, which links the top
+    # level directories into /usr like the host but binds nothing through
+    # those links
+    return os.path.join(os.path.realpath(os.path.dirname(path)),
+                        os.path.basename(path))
+
+
+def _stamp(path: str) -> Optional[List[int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class LibraryView:
+    """
+    What a minimal root binds: the links of the top level directories, host
+    paths with where they go in the sandbox, and an ld.so.cache that only
+    lists the libraries the app can load.
+    """
+
+    def __init__(self,
+                 links: List[List[str]],
+                 binds: List[List[str]],
+                 cache: str,
+                 missing: Optional[List[str]] = None) -> None:
+        self.links = links
+        self.binds = binds
+        self.cache = cache
+        self.missing = missing or []
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Self:
+        return cls(links=data["links"],
+                   binds=data["binds"],
+                   cache=data["cache"],
+                   missing=data["missing"])
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "links": self.links,
+            "binds": self.binds,
+            "cache": self.cache,
+            "missing": self.missing
+        }
+
+
+class LibraryScanner:
+
+    def __init__(self,
+                 binary: str,
+                 path: str,
+                 extra: Optional[List[str]] = None) -> None:
+        self._binary = binary
+        # Further programs and dlopen'ed drivers to bind with what they
+        # link against
+        self._extra = extra or []
+        self._path = os.path.realpath(path)
+
+        self._host = read_ld_cache()
+        self.flags = 0
+
+        # Sonames found in the host cache or default directories, they make
+        # up the generated cache
+        self.libraries: Dict[str, str] = {}
+        self.binds: Dict[str, str] = {}
+        self.missing: List[str] = []
+
+        self._resolved = set()
+        self._queue: List[ElfObject] = []
+        self._bundled: List[str] = []
+        self._directories: List[str] = []
+
+    def _inside_app(self, path: str) -> bool:
+        return os.path.realpath(path).startswith(self._path + os.sep)
+
+    def _bind(self, path: str) -> None:
+        # The app directory and plugin directories are bound as a whole
+        dest = sandbox_path(path)
+
+        if not self._inside_app(path) and not any(
+                dest.startswith(directory + os.sep)
+                for directory in self._directories):
+            self.binds.setdefault(dest, path)
+
+    def _expand(self, directory: str, origin: str, elf: ElfObject) -> str:
+        lib = "lib64" if elf.elf_class == ELFCLASS64 else "lib"
+
+        for token, value in (("$ORIGIN", origin), ("${ORIGIN}", origin),
+                             ("$LIB", lib), ("${LIB}", lib)):
+            directory = directory.replace(token, value)
+
+        return directory
+
+    def _candidate(self, path: str,
+                   arch: Tuple[int, int]) -> Optional[ElfObject]:
+        elf = ElfObject.read(path) if os.path.isfile(path) else None
+        return elf if elf and elf.arch == arch else None
+
+    def _search(self, soname: str, elf: ElfObject,
+                main: ElfObject) -> Tuple[Optional[ElfObject], bool]:
+        # Returns the library and whether ld.so finds it through the cache
+        # or the default directories
+        origin = os.path.dirname(os.path.realpath(elf.path))
+        directories = []
+
+        # DT_RPATH is ignored once an object has DT_RUNPATH
+        if not elf.runpath:
+            directories += elf.rpath + main.rpath
+        directories += elf.runpath
+
+        for directory in directories:
+            directory = self._expand(directory, origin, elf)
+
+            if "$" in directory:
+                continue
+
+            library = self._candidate(os.path.join(directory, soname),
+                                      elf.arch)
+            if library:
+                return library, False
+
+        # Apps that set LD_LIBRARY_PATH in a wrapper load what they ship
+        for directory in self._bundled:
+            library = self._candidate(os.path.join(directory, soname),
+                                      elf.arch)
+            if library:
+                return library, False
+
+        path = self._host.get(self.flags, {}).get(soname)
+        library = self._candidate(path, elf.arch) if path else None
+
+        if library:
+            return library, True
+
+        for directory in DEFAULT_DIRECTORIES[elf.elf_class]:
+            library = self._candidate(os.path.join(directory, soname),
+                                      elf.arch)
+            if library:
+                return library, True
+
+        return None, False
+
+    def _add(self, elf: ElfObject) -> None:
+        self._queue.append(elf)
+
+        if elf.interpreter:
+            self._bind(elf.interpreter)
+
+    def _add_library(self, soname: str, elf: ElfObject, main: ElfObject,
+                     required: bool) -> None:
+        if soname in self._resolved:
+            return
+
+        self._resolved.add(soname)
+
+        if "/" in soname:
+            library = self._candidate(soname, elf.arch)
+            system = False
+        else:
+            library, system = self._search(soname, elf, main)
+
+        if not library:
+            if required:
+                self.missing.append(soname)
+            return
+
+        self._bind(library.path)
+        self._add(library)
+
+        if system and not self._inside_app(library.path):
+            self.libraries[soname] = sandbox_path(library.path)
+
+        libraries, plugins = DLOPENED.get(soname, ([], []))
+
+        for name in libraries:
+            self._add_library(name, library, main, required=False)
+
+        for name in plugins:
+            self._add_plugins(
+                os.path.join(os.path.dirname(library.path), name), elf.arch)
+
+    def _add_plugins(self, directory: str, arch: Tuple[int, int]) -> None:
+        if not os.path.isdir(directory) or self._inside_app(directory):
+            return
+
+        self.binds.setdefault(sandbox_path(directory), directory)
+        self._directories.append(sandbox_path(directory))
+
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if ".so" in filename:
+                    plugin = self._candidate(os.path.join(root, filename),
+                                             arch)
+                    if plugin:
+                        self._queue.append(plugin)
+
+    def _bundled_directories(self, arch: Tuple[int, int]) -> List[str]:
+        directories = []
+
+        for root, _, filenames in os.walk(self._path):
+            for filename in filenames:
+                if ".so" not in filename:
+                    continue
+
+                library = self._candidate(os.path.join(root, filename), arch)
+
+                if library:
+                    directories.append(root)
+                    self._queue.append(library)
+                    break
+
+        return directories
+
+    def scan(self, cache: str) -> Optional[LibraryView]:
+        main = ElfObject.read(self._binary)
+
+        if not main or not main.interpreter:
+            print(
+                f"{self._binary} is not a dynamically linked ELF binary, "
+                "using the full root",
+                file=sys.stderr)
+            return None
+
+        self.flags = CACHE_FLAGS.get(main.arch)
+
+        if self.flags is None:
+            print(f"No ld.so.cache format for the architecture of "
+                  f"{self._binary}, using the full root",
+                  file=sys.stderr)
+            return None
+
+        self._bind(main.path)
+        self._add(main)
+        self._bundled = self._bundled_directories(main.arch)
+
+        for path in MINIMAL_ROOT_EXECUTABLES + self._extra:
+            elf = self._candidate(path, main.arch)
+            if elf:
+                self._bind(path)
+                self._add(elf)
+
+        while self._queue:
+            elf = self._queue.pop(0)
+
+            for soname in elf.needed:
+                self._add_library(soname, elf, main, required=True)
+
+        for path in MINIMAL_ROOT_PATHS:
+            if os.path.exists(path):
+                self.binds.setdefault(sandbox_path(path), path)
+
+        links = [[os.readlink(path), path] for path in ROOT_LINKS
+                 if os.path.islink(path)]
+
+        write_ld_cache(cache, self.libraries, self.flags)
+
+        return LibraryView(links=links,
+                           binds=[[source, dest]
+                                  for dest, source in self.binds.items()],
+                           cache=cache,
+                           missing=self.missing)
+
+
+def library_view(binary: str,
+                 path: str,
+                 extra: Optional[List[str]] = None) -> Optional[LibraryView]:
+    """
+    The libraries an app links against, found by walking DT_NEEDED from its
+    binary and the shared objects it ships. Scans are kept by the content of
+    the binary and redone when it or the host's ld.so.cache changes.
+    """
+    from .plan import file_hash
+
+    digest = file_hash(binary)
+
+    if not digest:
+        print(f"Cannot read {binary}, using the full root", file=sys.stderr)
+        return None
+
+    # Views with further programs or drivers are kept apart from the app's
+    extra = extra or []
+    if extra:
+        digest = hashlib.sha256(
+            (digest + json.dumps(extra)).encode()).hexdigest()
+
+    filename = os.path.join(LIBRARY_DIRECTORY, f"{digest}.json")
+    key = {"path": path, "extra": extra, "system": _stamp(HOST_LD_CACHE)}
+
+    try:
+        with open(filename) as fp:
+            data = json.load(fp)
+
+        view = LibraryView.from_dict(data["view"])
+
+        if data["key"] == key and os.path.exists(view.cache):
+            return view
+    except (OSError, ValueError, KeyError):
+        pass
+
+    os.makedirs(LIBRARY_DIRECTORY, exist_ok=True)
+
+    view = LibraryScanner(binary, path, extra).scan(
+        os.path.join(LIBRARY_DIRECTORY, f"{digest}.ld.so.cache"))
+
+    if not view:
+        return None
+
+    with open(filename + ".tmp", "w") as fp:
+        json.dump({"key": key, "view": view.as_dict()}, fp)
+
+    os.replace(filename + ".tmp", filename)
+
+    return view
+
+
+def app_binary(cmd: str, path: str) -> Optional[str]:
+    # The Exec line names the binary by path or by a name in the app
+    # directory or on $PATH
+    from .desktop import exec_argv
+
+    argv = exec_argv(cmd, [])
+
+    if not argv:
+        return None
+
+    if os.path.isabs(argv[0]):
+        return argv[0]
+
+    bundled = os.path.join(path, argv[0])
+
+    return bundled if os.path.isfile(bundled) else shutil.which(argv[0])
@@ -0,0 +1,327 @@
+import os, sys, json, time, signal, selectors, threading, subprocess
+from typing import Dict, List, Optional
+
+from .cgroup import SandboxCgroup
+from .logs import LogCapture
+from .trace import active_trace
+from .usage import wait_usage
+
+# Seconds the app gets to exit after SIGTERM before the sandbox is killed
+SHUTDOWN_TIMEOUT = 5
+
+# Seconds to keep reading output after bwrap exited, a process that escaped
+# the sandbox may hold the pipes open forever
+DRAIN_TIMEOUT = 1
+
+# Signals to the launcher that shut the sandbox down
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+
+
+def report_ready(fd: int, child_pid: Optional[int]) -> None:
+    # The same JSON bwrap writes to --info-fd, for launchers that exec it
+    with open(fd, "w") as fp:
+        fp.write(json.dumps({"child-pid": child_pid} if child_pid else {}) +
+                 "\n")
+
+
+def _pidfd(pid: int) -> Optional[int]:
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+
+def _descendants(pid: int) -> List[int]:
+    # From the children files of every thread, which need
+    # CONFIG_PROC_CHILDREN
+    found = []
+    pending = [pid]
+
+    while pending:
+        parent = pending.pop()
+
+        try:
+            tasks = os.listdir(f"/proc/{parent}/task")
+        except OSError:
+            continue
+
+        for task in tasks:
+            try:
+                with open(f"/proc/{parent}/task/{task}/children") as fp:
+                    children = [int(child) for child in fp.read().split()]
+            except (OSError, ValueError):
+                continue
+
+            found += children
+            pending += children
+
+    return found
+
+
+# Follows a sandbox from spawning bwrap until nothing of it is left. One
+# selector waits for output, bwrap's --json-status-fd, pidfds of bwrap and
+# the shared xdg-dbus-proxy, and shutdown signals to the launcher.
+class SandboxLifecycle:
+
+    def __init__(self,
+                 process: subprocess.Popen,
+                 capture: LogCapture,
+                 status_fd: int,
+                 spawned: int,
+                 cgroup: Optional[SandboxCgroup] = None,
+                 proxy_pid: Optional[int] = None,
+                 ready_fd: Optional[int] = None) -> None:
+        self._process = process
+        self._capture = capture
+        self._spawned = spawned
+        self._cgroup = cgroup
+        self._ready_fd = ready_fd
+
+        self.child_pid: Optional[int] = None
+        self.exit_code: Optional[int] = None
+        self.rusage = None
+
+        self._child_pidfd = None
+        self._status = b""
+        self._setup_done = None
+        self._terminating = None
+        self._killed = False
+        self._drain = None
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(process.stdout.fileno(), selectors.EVENT_READ,
+                                "output")
+        self._selector.register(process.stderr.fileno(), selectors.EVENT_READ,
+                                "output")
+        self._selector.register(status_fd, selectors.EVENT_READ, "status")
+
+        # Readable once the process exited, without reaping it
+        self._pidfd = os.pidfd_open(process.pid)
+        self._selector.register(self._pidfd, selectors.EVENT_READ, "exit")
+
+        self._proxy_pidfd = _pidfd(proxy_pid) if proxy_pid else None
+        if self._proxy_pidfd is not None:
+            self._selector.register(self._proxy_pidfd, selectors.EVENT_READ,
+                                    "proxy")
+
+        self._wakeup = None
+        self._handlers: Dict[int, object] = {}
+
+    def _install_signals(self) -> None:
+        # Only the main thread can handle signals
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        self._wakeup = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+        self._selector.register(self._wakeup[0], selectors.EVENT_READ,
+                                "signal")
+        signal.set_wakeup_fd(self._wakeup[1])
+
+        for signum in SHUTDOWN_SIGNALS:
+            self._handlers[signum] = signal.signal(signum,
+                                                   lambda *args: None)
+
+    def _restore_signals(self) -> None:
+        if not self._wakeup:
+            return
+
+        for signum, handler in self._handlers.items():
+            signal.signal(signum, handler)
+
+        signal.set_wakeup_fd(-1)
+
+        for fd in self._wakeup:
+            os.close(fd)
+
+    def _sandbox_pids(self) -> List[int]:
+        # bwrap joins the cgroup before it execs, but stays outside the
+        # sandbox's pid namespace. Signalled, it would exit and leave the app
+        # behind.
+        try:
+            namespace = os.stat(f"/proc/{self.child_pid}/ns/pid").st_ino
+        except OSError:
+            return []
+
+        pids = []
+
+        for pid in self._cgroup.pids():
+            try:
+                if os.stat(f"/proc/{pid}/ns/pid").st_ino == namespace:
+                    pids.append(pid)
+            except OSError:
+                continue
+
+        return pids
+
+    def _signal_sandbox(self, signum: int) -> bool:
+        # The init of the pid namespace ignores SIGTERM, what runs under it
+        # is signalled. Without a cgroup those are found through the children
+        # of the init.
+        pids = self._sandbox_pids() if self._cgroup else _descendants(
+            self.child_pid)
+        signalled = False
+
+        for pid in pids:
+            if pid == self.child_pid:
+                continue
+
+            try:
+                os.kill(pid, signum)
+                signalled = True
+            except ProcessLookupError:
+                pass
+
+        return signalled
+
+    def terminate(self) -> None:
+        # A second request does not wait any longer
+        if self._terminating:
+            self.kill()
+            return
+
+        if self._drain is not None:
+            return
+
+        # Nothing to shut down gracefully before the sandbox is set up
+        if self._child_pidfd is None:
+            self.kill()
+            return
+
+        # There is no waiting for an app that was not reached
+        if not self._signal_sandbox(signal.SIGTERM):
+            self.kill()
+            return
+
+        self._terminating = time.monotonic() + SHUTDOWN_TIMEOUT
+
+    def kill(self) -> None:
+        self._killed = True
+
+        if self._cgroup and self._cgroup.kill():
+            return
+
+        for pidfd in (self._child_pidfd, self._pidfd):
+            if pidfd is None:
+                continue
+
+            try:
+                signal.pidfd_send_signal(pidfd, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _read_status(self, fd: int) -> None:
+        data = os.read(fd, 4096)
+
+        if not data:
+            self._selector.unregister(fd)
+            os.close(fd)
+            return
+
+        # One JSON object per line, the first once the namespaces are set
+        # up, the last once the app exited
+        self._status += data
+        *lines, self._status = self._status.split(b"\n")
+        now = time.monotonic_ns()
+        trace = active_trace()
+
+        for line in lines:
+            try:
+                status = json.loads(line)
+            except ValueError:
+                continue
+
+            if "child-pid" in status and self.child_pid is None:
+                self.child_pid = status["child-pid"]
+                self._child_pidfd = _pidfd(self.child_pid)
+                self._setup_done = now
+
+                if trace:
+                    trace.complete("bwrap.setup", self._spawned, now)
+                if self._ready_fd is not None:
+                    report_ready(self._ready_fd, self.child_pid)
+                    self._ready_fd = None
+
+            elif "exit-code" in status:
+                self.exit_code = status["exit-code"]
+
+                if trace and self._setup_done:
+                    trace.complete("app", self._setup_done, now,
+                                   {"exit-code": self.exit_code})
+
+    def _exited(self) -> None:
+        self._selector.unregister(self._pidfd)
+        self.rusage = wait_usage(self._process)
+        self._drain = time.monotonic() + DRAIN_TIMEOUT
+
+    def _proxy_exited(self) -> None:
+        self._selector.unregister(self._proxy_pidfd)
+        print("xdg-dbus-proxy exited, D-Bus is no longer reachable from the "
+              "sandbox",
+              file=sys.stderr)
+
+    def _timeout(self) -> Optional[float]:
+        deadlines = [self._drain] if self._drain else []
+
+        if self._terminating and not self._killed:
+            deadlines.append(self._terminating)
+
+        return max(min(deadlines) - time.monotonic(), 0) if deadlines \
+            else None
+
+    def _running(self) -> bool:
+        if self._drain is None:
+            return True
+
+        pending = [
+            key for key in self._selector.get_map().values()
+            if key.data in ("output", "status")
+        ]
+
+        return bool(pending) and time.monotonic() < self._drain
+
+    def run(self) -> int:
+        self._install_signals()
+
+        try:
+            while self._running():
+                events = self._selector.select(self._timeout())
+
+                if self._terminating and not self._killed and \
+                        self._drain is None and \
+                        time.monotonic() >= self._terminating:
+                    self.kill()
+
+                for key, _ in events:
+                    if key.data == "output":
+                        if not self._capture.read(key.fd):
+                            self._selector.unregister(key.fd)
+                    elif key.data == "status":
+                        self._read_status(key.fd)
+                    elif key.data == "exit":
+                        self._exited()
+                    elif key.data == "proxy":
+                        self._proxy_exited()
+                    elif key.data == "signal":
+                        os.read(key.fd, 512)
+                        self.terminate()
+        finally:
+            self._restore_signals()
+            self._close()
+
+        return self._process.returncode
+
+    def _close(self) -> None:
+        for key in list(self._selector.get_map().values()):
+            if key.data == "status":
+                os.close(key.fd)
+
+        self._selector.close()
+        self._capture.close()
+
+        # End of file without a pid tells the caller the sandbox never came up
+        if self._ready_fd is not None:
+            os.close(self._ready_fd)
+
+        for fd in (self._pidfd, self._child_pidfd, self._proxy_pidfd):
+            if fd is not None:
+                os.close(fd)
@@ -0,0 +1,142 @@
+import os, time, fcntl, selectors, collections
+from typing import Optional, List, IO
+
+from . import LOG_DIRECTORY
+
+MAX_LOG_BYTES = 4 * 1024 * 1024
+LOG_BACKUPS = 2
+
+# Lines kept in memory to report why an application exited
+RING_LINES = 100
+
+# Longest partial line held back while waiting for its newline
+MAX_LINE_BYTES = 16 * 1024
+
+
+def log_filename(app: str) -> str:
+    return os.path.join(LOG_DIRECTORY, f"{app}.log")
+
+
+class RotatingLog:
+
+    def __init__(self,
+                 filename: str,
+                 max_bytes: int = MAX_LOG_BYTES,
+                 backups: int = LOG_BACKUPS) -> None:
+        self._filename = filename
+        self._max_bytes = max_bytes
+        self._backups = backups
+
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        # Every launch of an app writes the same log. The lock is a file of
+        # its own, the log is a different file once rotated.
+        self._lock = os.open(filename + ".lock",
+                             os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+        self._fp = open(filename, "ab")
+
+    def _rotated(self) -> bool:
+        try:
+            return os.stat(self._filename).st_ino != os.fstat(
+                self._fp.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self) -> None:
+        self._fp.close()
+
+        for index in range(self._backups - 1, 0, -1):
+            source = f"{self._filename}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self._filename}.{index + 1}")
+
+        if self._backups:
+            os.replace(self._filename, f"{self._filename}.1")
+
+        self._fp = open(self._filename, "ab")
+
+    def write(self, data: bytes) -> None:
+        fcntl.flock(self._lock, fcntl.LOCK_EX)
+
+        try:
+            # Another launch may have rotated or written to the log since
+            if self._rotated():
+                self._fp.close()
+                self._fp = open(self._filename, "ab")
+
+            size = os.fstat(self._fp.fileno()).st_size
+
+            if size and size + len(data) > self._max_bytes:
+                self._rotate()
+
+            self._fp.write(data)
+            self._fp.flush()
+        finally:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self._fp.close()
+        os.close(self._lock)
+
+
+class LogCapture:
+
+    def __init__(self, app: str) -> None:
+        self._log = RotatingLog(log_filename(app))
+        self._partial = {}
+
+        self.tail = collections.deque(maxlen=RING_LINES)
+        self.first_output: Optional[int] = None
+
+    def _feed(self, fd: int, data: bytes) -> None:
+        data = self._partial.pop(fd, b"") + data
+        lines = data.split(b"\n")
+
+        # Keep an unterminated line back so streams do not interleave
+        # mid-line, unless it grows past the limit
+        partial = lines.pop()
+        if len(partial) > MAX_LINE_BYTES:
+            lines.append(partial)
+        elif partial:
+            self._partial[fd] = partial
+
+        if lines:
+            self._log.write(b"".join(line + b"\n" for line in lines))
+            self.tail.extend(lines)
+
+    def read(self, fd: int) -> bool:
+        # False once the stream reached end of file
+        data = os.read(fd, 65536)
+
+        if data:
+            if self.first_output is None:
+                self.first_output = time.monotonic_ns()
+
+            self._feed(fd, data)
+            return True
+
+        if fd in self._partial:
+            self._feed(fd, b"\n")
+
+        return False
+
+    def close(self) -> None:
+        self._log.close()
+
+    def pump(self, streams: List[IO[bytes]]) -> None:
+        selector = selectors.DefaultSelector()
+
+        for stream in streams:
+            selector.register(stream.fileno(), selectors.EVENT_READ)
+
+        while selector.get_map():
+            for key, _ in selector.select():
+                if not self.read(key.fd):
+                    selector.unregister(key.fd)
+
+        selector.close()
+        self.close()
+
+    def format_tail(self, lines: Optional[int] = None) -> str:
+        tail = list(self.tail)[-lines:] if lines else self.tail
+        return "\n".join(line.decode(errors="replace") for line in tail)
@@ -0,0 +1,161 @@
+import os, json, tomllib
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+from .config import POOL_IDLE
+from .desktop import DesktopEntry, desktop_entry_factory
+from .sandbox import Sandbox, sandbox_factory, check_args
+from .cgroup import LIMITS
+
+# Flags an app lists under "permissions", named like the sandbox-create flags
+PERMISSION_FLAGS = [
+    "dri", "ipc", "home", "downloads", "pulseaudio", "pipewire", "dbus",
+    "screencast", "screenshot", "notifications", "vfs"
+]
+
+MANIFEST_KEYS = [
+    "entry", "path", "seccomp", "permissions", "dbus_app", "single_instance",
+    "pool_size", "pool_idle", "limits", "idle_freeze", "minimal_root"
+]
+
+
+def load_manifest(filename: str) -> Dict[str, Dict[str, Any]]:
+    with open(filename, "rb") as fp:
+        if filename.endswith(".toml"):
+            data = tomllib.load(fp)
+        else:
+            data = json.load(fp)
+
+    apps = data.get("apps")
+
+    if not isinstance(apps, dict):
+        raise ValueError(f"{filename} has no [apps] table")
+
+    return apps
+
+
+def manifest_args(app: str, data: Dict[str, Any], base: str) -> Namespace:
+    if not isinstance(data, dict):
+        raise ValueError("has to be a table")
+
+    unknown = set(data) - set(MANIFEST_KEYS)
+    if unknown:
+        raise ValueError(f"unknown keys {', '.join(sorted(unknown))}")
+
+    if not data.get("entry") or not data.get("path"):
+        raise ValueError("entry and path are required")
+
+    flags = data.get("permissions", [])
+    unknown = set(flags) - set(PERMISSION_FLAGS)
+    if unknown:
+        raise ValueError(f"unknown permissions {', '.join(sorted(unknown))}")
+
+    # Relative seccomp filters are looked up next to the manifest
+    seccomp = data.get("seccomp")
+    if seccomp:
+        seccomp = os.path.abspath(os.path.join(base, seccomp))
+
+    args = Namespace(app=app,
+                     entry=data["entry"],
+                     path=data["path"],
+                     seccomp=seccomp,
+                     dbus_app=data.get("dbus_app"),
+                     single_instance=data.get("single_instance", False),
+                     pool_size=data.get("pool_size", 0),
+                     pool_idle=data.get("pool_idle", POOL_IDLE),
+                     idle_freeze=data.get("idle_freeze", 0),
+                     minimal_root=data.get("minimal_root", False))
+
+    for flag in PERMISSION_FLAGS:
+        setattr(args, flag, flag in flags)
+
+    # Limits are keyed by their cgroup file, "memory.max" = "2G"
+    limits = data.get("limits", {})
+    unknown = set(limits) - set(LIMITS)
+    if unknown:
+        raise ValueError(f"unknown limits {', '.join(sorted(unknown))}")
+
+    for name in LIMITS:
+        setattr(args, name.replace(".", "_"), limits.get(name))
+
+    check_args(args)
+
+    return args
+
+
+class ManifestRunner:
+
+    def __init__(self, filename: str, jobs: Optional[int] = None) -> None:
+        self._filename = filename
+        self._jobs = jobs or os.cpu_count()
+
+        self._results: Dict[str, str] = {}
+        self._errors: Dict[str, str] = {}
+
+    def _sandboxes(self) -> Dict[str, Sandbox]:
+        base = os.path.dirname(os.path.abspath(self._filename))
+        sandboxes = {}
+
+        for app, data in load_manifest(self._filename).items():
+            try:
+                sandboxes[app] = sandbox_factory(
+                    manifest_args(app, data, base))
+            # Values of the wrong type fail on the first use, for that app
+            except (TypeError, KeyError, ValueError, AttributeError) as error:
+                self._errors[app] = str(error)
+
+        return sandboxes
+
+    def _parse(self, name: str) -> DesktopEntry:
+        return desktop_entry_factory(name=name)
+
+    def _apply(self, sandbox: Sandbox,
+               entries: Dict[str, DesktopEntry]) -> None:
+        try:
+            self._results[sandbox.app] = sandbox.apply(entries[sandbox.entry])
+        except Exception as error:
+            self._errors[sandbox.app] = str(error)
+
+    def run(self) -> bool:
+        sandboxes = self._sandboxes()
+        names = sorted({sandbox.entry for sandbox in sandboxes.values()})
+        entries = {}
+
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            # Every desktop entry is read once, however many apps use it
+            futures = {
+                name: executor.submit(self._parse, name)
+                for name in names
+            }
+
+            for name, future in futures.items():
+                try:
+                    entries[name] = future.result()
+                except (OSError, ValueError) as error:
+                    for sandbox in sandboxes.values():
+                        if sandbox.entry == name:
+                            self._errors[sandbox.app] = str(error)
+
+            for sandbox in sandboxes.values():
+                if sandbox.app not in self._errors:
+                    executor.submit(self._apply, sandbox, entries)
+
+        self._report()
+
+        return not self._errors
+
+    def _report(self) -> None:
+        counts = {"created": 0, "changed": 0, "skipped": 0, "failed": 0}
+
+        for app, result in sorted(self._results.items()):
+            counts[result] += 1
+            print(f"{result:8} {app}")
+
+        for app, error in sorted(self._errors.items()):
+            counts["failed"] += 1
+            print(f"\x1b[91mfailed\x1b[0m   {app}: {error}")
+
+        print("------------------")
+        print(", ".join(f"{count} {result}"
+                        for result, count in counts.items()))
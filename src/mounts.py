@@ -0,0 +1,217 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+# bwrap options that put something at their last argument, with the number
+# of arguments they take
+MOUNT_OPTIONS = {
+    "--bind": 2,
+    "--bind-try": 2,
+    "--ro-bind": 2,
+    "--ro-bind-try": 2,
+    "--dev-bind": 2,
+    "--dev-bind-try": 2,
+    "--tmpfs": 1,
+    "--dev": 1,
+    "--proc": 1,
+    "--mqueue": 1,
+    "--dir": 1,
+    "--symlink": 2,
+}
+
+# Create a path in the sandbox instead of mounting over it
+CREATE_OPTIONS = ("--dir", "--symlink")
+
+# Apply to the mount option that follows them
+MODIFIER_OPTIONS = {"--perms": 1, "--size": 1}
+
+OTHER_OPTIONS = {
+    "--setenv": 2,
+    "--unsetenv": 1,
+    "--chdir": 1,
+    "--hostname": 1,
+    "--unshare-all": 0,
+    "--unshare-user": 0,
+    "--unshare-user-try": 0,
+    "--unshare-ipc": 0,
+    "--unshare-pid": 0,
+    "--unshare-net": 0,
+    "--unshare-uts": 0,
+    "--unshare-cgroup": 0,
+    "--unshare-cgroup-try": 0,
+    "--share-net": 0,
+    "--new-session": 0,
+    "--die-with-parent": 0,
+    "--clearenv": 0,
+}
+
+# Sources that come and go while the session runs, sockets of the proxy,
+# the compositor and the sound server. They stay to be tried at launch.
+VOLATILE_ROOTS = ["/run", "/tmp", "/dev/shm"]
+
+
+class MountOperation:
+
+    def __init__(self, tokens: List[str]) -> None:
+        self.tokens = tokens
+
+        option = next(token for token in tokens if token in MOUNT_OPTIONS)
+        arguments = tokens[tokens.index(option) + 1:]
+
+        self.option = option
+        self.kind = option.removesuffix("-try")
+        self.source = arguments[0] if len(arguments) == 2 else None
+        self.dest = os.path.normpath(arguments[-1])
+
+    @property
+    def optional(self) -> bool:
+        return self.option.endswith("-try")
+
+    @property
+    def identity(self) -> bool:
+        return self.source is not None and \
+            os.path.normpath(self.source) == self.dest
+
+
+def _under(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip("/") + "/")
+
+
+def _parse(options: List[str]) -> Optional[List[object]]:
+    # Mount operations are grouped with their modifiers, everything else is
+    # kept as it is. None for options this does not know the arguments of.
+    operations = []
+    pending = []
+    index = 0
+
+    while index < len(options):
+        option = options[index]
+
+        if option in MODIFIER_OPTIONS:
+            count = MODIFIER_OPTIONS[option]
+            pending += options[index:index + count + 1]
+        elif option in MOUNT_OPTIONS:
+            count = MOUNT_OPTIONS[option]
+            operations.append(
+                MountOperation(pending + options[index:index + count + 1]))
+            pending = []
+        elif option in OTHER_OPTIONS and not pending:
+            count = OTHER_OPTIONS[option]
+            operations.append(options[index:index + count + 1])
+        else:
+            return None
+
+        index += count + 1
+
+    return None if pending or index != len(options) else operations
+
+
+def optimize_mounts(
+        options: List[str],
+        volatile: Optional[List[str]] = None) -> Tuple[List[str], List[str]]:
+    """
+    Reduces bwrap options to the mounts that end up visible in the sandbox.
+    Optional binds of sources that do not exist are dropped, so are mounts
+    that a later mount on the same or a parent path hides and binds already
+    exposed unchanged by a bind of a parent path. Returns the options and the
+    sources that were dropped for not existing.
+    """
+    operations = _parse(options)
+
+    if operations is None:
+        return options, []
+
+    volatile = VOLATILE_ROOTS + (volatile or [])
+    missing = []
+    # Optional mounts that are not known to happen at launch
+    uncertain = set()
+
+    for operation in operations:
+        if not isinstance(operation, MountOperation) or \
+                not operation.optional:
+            continue
+
+        resolved = os.path.realpath(operation.source)
+
+        if any(_under(resolved, root) for root in volatile):
+            uncertain.add(id(operation))
+        elif not os.path.exists(resolved):
+            missing.append(operation.source)
+
+    operations = [
+        operation for operation in operations
+        if not isinstance(operation, MountOperation) or
+        operation.source not in missing or not operation.optional
+    ]
+
+    # Walking backwards, every mount hides what was mounted at or below its
+    # path before it
+    covering = []
+    seen = set()
+    kept = []
+
+    for operation in reversed(operations):
+        if isinstance(operation, MountOperation):
+            tokens = tuple(operation.tokens)
+
+            if tokens in seen or any(
+                    _under(operation.dest, dest) for dest in covering):
+                continue
+
+            seen.add(tokens)
+
+            if operation.option not in CREATE_OPTIONS and \
+                    id(operation) not in uncertain:
+                covering.append(operation.dest)
+
+        kept.append(operation)
+
+    kept.reverse()
+
+    # bwrap binds recursively, a bind of /usr/share/fonts after one of /usr
+    # of the same kind adds nothing while nothing was mounted in between
+    result: List[object] = []
+
+    for operation in kept:
+        if isinstance(operation, MountOperation) and operation.identity:
+            parent = next(
+                (earlier for earlier in reversed(result)
+                 if isinstance(earlier, MountOperation) and
+                 earlier.option not in CREATE_OPTIONS and
+                 _under(operation.dest, earlier.dest)), None)
+
+            if parent and parent.identity and \
+                    parent.kind == operation.kind and \
+                    id(parent) not in uncertain:
+                continue
+
+        result.append(operation)
+
+    options = []
+
+    for operation in result:
+        options += operation.tokens if isinstance(
+            operation, MountOperation) else operation
+
+    return options, missing
+
+
+def mount_stamp(missing: List[str]) -> List[List[object]]:
+    # A dropped source that appears later changes the directory it would be
+    # created in, or the closest parent that exists
+    directories: Dict[str, int] = {}
+
+    for path in missing:
+        directory = os.path.dirname(os.path.abspath(path))
+
+        while True:
+            try:
+                directories[directory] = os.stat(directory).st_mtime_ns
+                break
+            except OSError:
+                parent = os.path.dirname(directory)
+                if parent == directory:
+                    break
+                directory = parent
+
+    return [[directory, mtime]
+            for directory, mtime in sorted(directories.items())]
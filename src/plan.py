@@ -0,0 +1,226 @@
+import os, json
+from typing import Self, Optional, List, Dict, Any
+
+from . import CONFIG_DATABASE, PLAN_DIRECTORY
+from .mounts import mount_stamp
+
+PLAN_VERSION = 7
+
+# Environment variables the launcher bakes into the bwrap command line
+LAUNCH_ENVIRONMENT = [
+    "HOME", "USER", "DISPLAY", "XAUTHORITY", "WAYLAND_DISPLAY",
+    "XDG_RUNTIME_DIR", "XDG_DATA_DIRS"
+]
+
+
+def file_hash(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+
+    import hashlib
+
+    try:
+        with open(path, "rb") as fp:
+            return hashlib.sha256(fp.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def code_stamp() -> int:
+    # Any module of the package can change what a plan contains; when they
+    # are shipped inside an archive fall back to the archive itself.
+    path = os.path.dirname(__file__)
+
+    try:
+        return max(entry.stat().st_mtime_ns for entry in os.scandir(path)
+                   if entry.name.endswith(".py"))
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+
+    while path and not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return 0
+        path = parent
+
+    return os.stat(path).st_mtime_ns
+
+
+def config_stamp() -> List[Optional[List[int]]]:
+    # Read without importing sqlite3. Any committed change shows in the WAL
+    # or, once checkpointed, in the database file; an empty WAL only means a
+    # connection is open.
+    stamp = []
+
+    for filename in (CONFIG_DATABASE, CONFIG_DATABASE + "-wal"):
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            stamp.append(None)
+            continue
+
+        stamp.append([stat.st_mtime_ns, stat.st_size] if stat.st_size else None)
+
+    return stamp
+
+
+def config_revision(app: str) -> Optional[int]:
+    # The revision of the app's own row, only read when the database changed
+    # since the plan was saved; sqlite3 is slow to import
+    import sqlite3
+    from .store import config_store
+
+    try:
+        return config_store().revision(app)
+    except (sqlite3.Error, ValueError):
+        return None
+
+
+def file_stamp(paths: List[str]) -> List[Optional[int]]:
+    stamp = []
+
+    for path in paths:
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+
+    return stamp
+
+
+def plan_key(seccomp_filter: Optional[str], missing: List[str],
+             watched: List[str]) -> Dict[str, Any]:
+    return {
+        "version": PLAN_VERSION,
+        "code": code_stamp(),
+        "config": config_stamp(),
+        "seccomp": file_hash(seccomp_filter),
+        "mounts": mount_stamp(missing),
+        "files": file_stamp(watched),
+        "env": {env: os.environ.get(env)
+                for env in LAUNCH_ENVIRONMENT},
+    }
+
+
+class LaunchPlan:
+
+    def __init__(self,
+                 app: str,
+                 options: List[str],
+                 binary_cmd: str,
+                 missing: Optional[List[str]] = None,
+                 watched: Optional[List[str]] = None,
+                 seccomp_filter: Optional[str] = None,
+                 dbus_app: Optional[str] = None,
+                 dbus_permissions: Optional[int] = None,
+                 single_instance: bool = False,
+                 limits: Optional[Dict[str, str]] = None,
+                 key: Optional[Dict[str, Any]] = None) -> None:
+        self.app = app
+        self.options = options
+        self.binary_cmd = binary_cmd
+        # Optional sources left out of the options for not existing
+        self.missing = missing or []
+        self.watched = watched or []
+        self.seccomp_filter = seccomp_filter
+        self.dbus_app = dbus_app
+        self.dbus_permissions = dbus_permissions
+        self.single_instance = single_instance
+        self.limits = limits or {}
+        self.key = key
+
+    @staticmethod
+    def filename(app: str) -> str:
+        return os.path.join(PLAN_DIRECTORY, f"{app}.json")
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Self:
+        return cls(app=data['app'],
+                   options=data['options'],
+                   binary_cmd=data['binary_cmd'],
+                   missing=data['missing'],
+                   watched=data['watched'],
+                   seccomp_filter=data['seccomp_filter'],
+                   dbus_app=data['dbus_app'],
+                   dbus_permissions=data['dbus_permissions'],
+                   single_instance=data['single_instance'],
+                   limits=data['limits'],
+                   key=data['key'])
+
+    @classmethod
+    def load(cls, app: str) -> Optional[Self]:
+        try:
+            with open(cls.filename(app)) as fp:
+                plan = cls.from_dict(json.load(fp))
+
+            key = plan_key(plan.seccomp_filter, plan.missing,
+                           plan.watched)
+            key["revision"] = plan.key.get("revision")
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+
+        if plan.key == key:
+            return plan
+
+        if plan.key != dict(key, config=plan.key.get("config")):
+            return None
+
+        # The database changed, but the plan is only stale if the app's own
+        # row did. The new stamp spares the next launch the lookup.
+        if key["revision"] is None or key["revision"] != config_revision(app):
+            return None
+
+        plan.key = key
+
+        try:
+            plan._write()
+        except OSError:
+            pass
+
+        return plan
+
+    def save(self) -> None:
+        self.key = plan_key(self.seccomp_filter, self.missing,
+                            self.watched)
+        self.key["revision"] = config_revision(self.app)
+
+        self._write()
+
+    def _write(self) -> None:
+        data = {
+            "app": self.app,
+            "options": self.options,
+            "binary_cmd": self.binary_cmd,
+            "missing": self.missing,
+            "watched": self.watched,
+            "seccomp_filter": self.seccomp_filter,
+            "dbus_app": self.dbus_app,
+            "dbus_permissions": self.dbus_permissions,
+            "single_instance": self.single_instance,
+            "limits": self.limits,
+            "key": self.key
+        }
+
+        os.makedirs(PLAN_DIRECTORY, exist_ok=True)
+
+        filename = self.filename(self.app)
+        with open(filename + ".tmp", "w") as fp:
+            fp.write(json.dumps(data))
+
+        os.replace(filename + ".tmp", filename)
+
+    def execute(self,
+                args: List[str],
+                replace: bool = False,
+                ready_fd: Optional[int] = None) -> None:
+        # Imported here so a warm launch only pays for what it runs
+        from .execute import execute_plan
+
+        execute_plan(self, args, replace=replace, ready_fd=ready_fd)
+
+
+def remove_plan(app: str) -> None:
+    try:
+        os.unlink(LaunchPlan.filename(app))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,302 @@
+import os, sys, json, time, shlex, shutil, signal, socket, tempfile
+import threading, subprocess
+from typing import Dict, List
+
+from . import RUNTIME_DIRECTORY, POOL_SOCKET
+from .config import Config
+from .logs import LogCapture
+from .plan import LaunchPlan
+from .store import config_store
+from .execute import prepare_command
+from .freezer import RunningSandbox
+from .desktop import exec_argv
+from .usage import wait_usage, launch_usage, record_usage
+
+# Where a pooled sandbox finds the command it has been handed
+SLOT_MOUNT = "/run/sandbox-pool"
+
+# Seconds between checks for idle pools and slots that need replacing
+MAINTENANCE_INTERVAL = 5
+
+
+def pool_launch(app: str, args: List[str]) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(POOL_SOCKET)
+            sock.sendall(
+                json.dumps({
+                    "app": app,
+                    "args": args
+                }).encode() + b"\n")
+            reply = sock.makefile("rb").readline()
+    except OSError:
+        return False
+
+    try:
+        return json.loads(reply)["ok"]
+    except (ValueError, KeyError):
+        return False
+
+
+class PoolSlot:
+
+    def __init__(self, plan: LaunchPlan) -> None:
+        self.plan = plan
+        self.directory = tempfile.mkdtemp(prefix=f"{plan.app}-",
+                                          dir=RUNTIME_DIRECTORY)
+
+        command, pass_fds, _, self._cgroup = prepare_command(plan)
+        self._sandbox = None
+        self._started = None
+
+        if self._cgroup:
+            self._sandbox = RunningSandbox(app=plan.app,
+                                           pid=os.getpid(),
+                                           cgroup=self._cgroup.path)
+            self._sandbox.save()
+
+        # The sandbox is fully set up but its shell blocks on the go pipe
+        # until the pool writes the command to run and releases it. Closing
+        # the pipe without writing makes the shell, and the sandbox, exit.
+        go_read, self._go = os.pipe()
+        shell = os.path.realpath("/bin/sh")
+        # The pipe is the shell's stdin, dash only redirects from single digit
+        # descriptors
+        waiter = [shell, "-c", f"read -r _ && . {SLOT_MOUNT}/exec"]
+
+        command += [
+            "--ro-bind-try", shell, shell, "--ro-bind", self.directory,
+            SLOT_MOUNT, "--"
+        ] + waiter
+
+        self.process = subprocess.Popen(command,
+                                        pass_fds=pass_fds,
+                                        preexec_fn=self._cgroup.attach
+                                        if self._cgroup else None,
+                                        stdin=go_read,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+
+        # bwrap now holds everything the sandbox needs
+        os.close(go_read)
+        for fd in pass_fds:
+            os.close(fd)
+
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        self._thread.start()
+
+    def _supervise(self) -> None:
+        LogCapture(self.plan.app).pump(
+            [self.process.stdout, self.process.stderr])
+        rusage = wait_usage(self.process)
+
+        # Slots discarded before they were handed out ran no app
+        if rusage and self._started:
+            started, spawned = self._started
+            record_usage(
+                self.plan.app,
+                launch_usage(started=started,
+                             wall=(time.monotonic_ns() - spawned) / 1e9,
+                             status=self.process.returncode,
+                             rusage=rusage,
+                             cgroup=self._cgroup))
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        if self._sandbox:
+            self._sandbox.remove()
+        if self._cgroup:
+            self._cgroup.remove()
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def start(self, args: List[str]) -> None:
+        # The idle freezer may have frozen the waiting sandbox
+        if self._sandbox:
+            self._sandbox.thaw()
+
+        with open(os.path.join(self.directory, "exec"), "w") as fp:
+            fp.write(
+                f"exec {shlex.join(exec_argv(self.plan.binary_cmd, args))} "
+                "</dev/null\n")
+
+        self._started = (time.time(), time.monotonic_ns())
+
+        # read only succeeds on a complete line
+        os.write(self._go, b"go\n")
+        os.close(self._go)
+
+    def discard(self) -> None:
+        os.close(self._go)
+
+    def join(self) -> None:
+        self._thread.join()
+
+
+class SandboxPool:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+        self._ready: Dict[str, List[PoolSlot]] = {}
+        self._started: List[PoolSlot] = []
+        self._last_used: Dict[str, float] = {}
+
+    def _pooled_apps(self) -> Dict[str, Config]:
+        apps = {}
+
+        for app, data in config_store().items().items():
+            try:
+                config = Config.from_dict(data)
+            except (ValueError, KeyError):
+                continue
+
+            if config.pool_size and not config.single_instance:
+                apps[app] = config
+
+        return apps
+
+    def _plan(self, app: str) -> LaunchPlan:
+        from .sandbox import sandbox_launch_plan
+
+        plan = LaunchPlan.load(app=app)
+
+        return plan if plan else sandbox_launch_plan(app)
+
+    def _maintain_app(self, app: str, config: Config, now: float) -> None:
+        last_used = self._last_used.setdefault(app, now)
+        idle = now - last_used > config.pool_idle
+        plan = None if idle else self._plan(app)
+
+        with self._lock:
+            ready = self._ready.setdefault(app, [])
+
+            # Drop slots of idle apps, slots that died and slots built from an
+            # outdated plan
+            for slot in list(ready):
+                if idle or not slot.alive() or slot.plan.key != plan.key:
+                    ready.remove(slot)
+                    slot.discard()
+
+            missing = 0 if idle else config.pool_size - len(ready)
+
+        # Setting up sandboxes is slow, do not hold up launches meanwhile
+        for _ in range(missing):
+            slot = PoolSlot(plan)
+
+            with self._lock:
+                self._ready[app].append(slot)
+
+    def _maintain(self) -> None:
+        now = time.monotonic()
+
+        # An app that was removed or cannot be set up must not take the pools
+        # of the others down
+        for app, config in self._pooled_apps().items():
+            try:
+                self._maintain_app(app, config, now)
+            except Exception as error:
+                print(f"Cannot keep sandboxes of {app} ready: {error!r}",
+                      file=sys.stderr)
+
+        with self._lock:
+            self._started = [slot for slot in self._started if slot.alive()]
+
+    @staticmethod
+    def _reply(connection: socket.socket, reply: Dict) -> None:
+        try:
+            connection.sendall(json.dumps(reply).encode() + b"\n")
+        except OSError:
+            pass
+
+    def _handle(self, connection: socket.socket) -> None:
+        # Requests that cannot be served get an answer as well, so
+        # sandbox-launch falls back right away instead of waiting
+        try:
+            request = json.loads(connection.makefile("rb").readline())
+            app, args = request["app"], request["args"]
+
+            if not isinstance(app, str) or not isinstance(args, list) or \
+                    not all(isinstance(arg, str) for arg in args):
+                raise ValueError("app has to be a name and args a list of "
+                                 "strings")
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            self._reply(connection, {
+                "ok": False,
+                "error": f"Invalid request: {error}"
+            })
+            return
+
+        with self._lock:
+            self._last_used[app] = time.monotonic()
+            ready = self._ready.get(app, [])
+            slot = ready.pop(0) if ready else None
+
+            if slot and slot.alive():
+                slot.start(args)
+                self._started.append(slot)
+            elif slot:
+                slot.discard()
+                slot = None
+
+        self._reply(connection, {"ok": bool(slot)})
+
+        # Refill the pool, or wake it up again after it went idle
+        self._wakeup.set()
+
+    def _serve(self, server: socket.socket) -> None:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+
+            with connection:
+                self._handle(connection)
+
+    def _stop(self, *args) -> None:
+        self._stopping = True
+        self._wakeup.set()
+
+    def serve(self) -> None:
+        os.makedirs(RUNTIME_DIRECTORY, mode=0o700, exist_ok=True)
+
+        try:
+            os.unlink(POOL_SOCKET)
+        except FileNotFoundError:
+            pass
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(POOL_SOCKET)
+        server.listen()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        threading.Thread(target=self._serve, args=(server, ),
+                         daemon=True).start()
+
+        try:
+            while not self._stopping:
+                self._maintain()
+                self._wakeup.wait(MAINTENANCE_INTERVAL)
+                self._wakeup.clear()
+        finally:
+            os.unlink(POOL_SOCKET)
+            server.shutdown(socket.SHUT_RDWR)
+            server.close()
+
+            with self._lock:
+                slots = self._started
+
+                for ready in self._ready.values():
+                    while ready:
+                        slot = ready.pop()
+                        slot.discard()
+                        slots.append(slot)
+
+            # Keep capturing the output of applications that are running
+            for slot in slots:
+                slot.join()
@@ -0,0 +1,148 @@
+import os, fcntl, select
+from typing import Optional
+
+from . import XDG_DBUS_PROXY
+from .permissions import DBusPermissions, DBusPermissionList
+
+# Seconds to wait for a freshly spawned proxy to report its socket as ready
+PROXY_READY_TIMEOUT = 5
+
+
+def proxy_name(app: str, permissions: DBusPermissions) -> str:
+    return f"{app}-{int(permissions)}"
+
+
+def proxy_socket_path(xdg_runtime_dir: str, app: str,
+                      permissions: DBusPermissions) -> str:
+    return os.path.join(xdg_runtime_dir, "xdg-dbus-proxy",
+                        proxy_name(app, permissions) + ".sock")
+
+
+# One xdg-dbus-proxy is shared by every sandbox of a D-Bus app running with
+# the same permissions. The kernel counts its users: each launch opens the
+# read end of the proxy's FIFO and hands it to bwrap as --sync-fd, and the
+# proxy exits by itself once the last reader is gone. A lock file serialises
+# looking for a running proxy and spawning a new one.
+class XdgDbusProxy:
+
+    def __init__(self, app: str, permissions: DBusPermissions) -> None:
+        self._app = app
+        self._permissions = permissions
+
+        self._command = [XDG_DBUS_PROXY]
+        self._xdg_runtime_dir = os.environ['XDG_RUNTIME_DIR']
+
+        self._directory = os.path.join(self._xdg_runtime_dir, "xdg-dbus-proxy")
+        self._socket = proxy_socket_path(self._xdg_runtime_dir, app,
+                                         permissions)
+
+        base = os.path.join(self._directory, proxy_name(app, permissions))
+        self._fifo = base + ".fifo"
+        self._lock = base + ".lock"
+        self._pidfile = base + ".pid"
+
+    def _set_permissions(self) -> None:
+
+        self._command.append(f"--own={self._app}")
+        self._command.append(f"--own={self._app}.*")
+
+        if self._permissions.has_permission(DBusPermissionList.Notifications):
+            self._command.append("--talk=org.freedesktop.portal.Notification")
+        if self._permissions.has_permission(DBusPermissionList.Screencast):
+            self._command.append("--talk=org.freedesktop.portal.Screencast")
+        if self._permissions.has_permission(DBusPermissionList.Screenshot):
+            self._command.append("--talk=org.freedesktop.portal.Screenshot")
+
+    def _set_dbus_proxy_socket(self) -> None:
+        dbus_session_bus_address = os.environ['DBUS_SESSION_BUS_ADDRESS']
+
+        self._command.append(dbus_session_bus_address)
+        self._command.append(self._socket)
+
+    def _running_pid(self) -> Optional[int]:
+        try:
+            with open(self._pidfile) as fp:
+                pid = int(fp.read())
+
+            # Make sure the pid has not been reused by something else
+            with open(f"/proc/{pid}/cmdline", "rb") as fp:
+                cmdline = fp.read().split(b"\0")
+        except (OSError, ValueError):
+            return None
+
+        if self._socket.encode() not in cmdline:
+            return None
+
+        return pid if os.path.exists(self._socket) else None
+
+    def pid(self) -> Optional[int]:
+        return self._running_pid()
+
+    def _spawn(self, reader: int) -> None:
+        # Succeeds without blocking because this process holds a reader
+        writer = os.open(self._fifo, os.O_WRONLY | os.O_NONBLOCK)
+
+        self._command.append(f"--fd={writer}")
+        self._set_dbus_proxy_socket()
+        self._set_permissions()
+
+        print(" ".join(self._command))
+        print("------------------")
+
+        try:
+            os.unlink(self._socket)
+        except FileNotFoundError:
+            pass
+
+        pid = os.fork()
+
+        if not pid:
+            # Detach the proxy so neither the launcher nor bwrap, which may
+            # replace it, ever has to reap it
+            try:
+                os.setsid()
+                if not os.fork():
+                    os.close(reader)
+                    os.set_inheritable(writer, True)
+
+                    with open(self._pidfile, "w") as fp:
+                        fp.write(str(os.getpid()))
+
+                    os.execv(self._command[0], self._command)
+            finally:
+                os._exit(0)
+
+        os.waitpid(pid, 0)
+        os.close(writer)
+
+        # The proxy writes a single byte once its socket accepts clients and
+        # the FIFO reports end of file if it dies before that
+        ready, _, _ = select.select([reader], [], [], PROXY_READY_TIMEOUT)
+        if not ready or os.read(reader, 1) != b"x":
+            raise RuntimeError(f"xdg-dbus-proxy for {self._app} did not start")
+
+    def acquire(self) -> int:
+        os.makedirs(self._directory, mode=0o700, exist_ok=True)
+
+        lock = os.open(self._lock, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC,
+                       0o600)
+
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if not os.path.exists(self._fifo):
+                os.mkfifo(self._fifo, 0o600)
+
+            reader = os.open(self._fifo,
+                             os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+
+            try:
+                if not self._running_pid():
+                    self._spawn(reader)
+            except BaseException:
+                os.close(reader)
+                raise
+
+            return reader
+        finally:
+            os.close(lock)
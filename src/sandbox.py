@@ -1,16 +1,21 @@
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, List
 from argparse import Namespace
 
-from . import DIRECTORY, APP_DIRECTORY, CONFIG_DIRECTORY, SECCOMP_DIRECTORY, HOME_DIR
+from . import DIRECTORY, APP_DIRECTORY, SECCOMP_DIRECTORY, HOME_DIR
 from .desktop import (DesktopEntry, sandboxed_desktop_entry_factory,
                       hidden_desktop_entry_factory, desktop_entry_factory)
 
 from .permissions import (Permissions, PermissionBuilder,
                           DBusPermissionBuilder)
 
-from .config import ConfigBuilder, Config
+from .config import ConfigBuilder, Config, POOL_IDLE
 from .launcher import SandboxLauncher
+from .plan import LaunchPlan, remove_plan
+from .seccomp import is_policy, compiled_filter
+from .cgroup import limits_from_args
+from .store import config_store
+from .trace import phase
 
 
 class Sandbox:
@@ -23,7 +28,13 @@ class Sandbox:
             permissions: Permissions,
             seccomp_filter: Optional[str] = None,
             dbus_app: Optional[str] = None,
-            dbus_permissions: Optional[DBusPermissionBuilder] = None) -> None:
+            dbus_permissions: Optional[DBusPermissionBuilder] = None,
+            single_instance: bool = False,
+            pool_size: int = 0,
+            pool_idle: int = POOL_IDLE,
+            limits: Optional[Dict[str, str]] = None,
+            idle_freeze: int = 0,
+            minimal_root: bool = False) -> None:
 
         self.app = app
         self.path = path
@@ -31,18 +42,50 @@ class Sandbox:
         self.filename = f"/usr/bin/{entry}"
         self.seccomp_filter = seccomp_filter
 
-        realpath = os.path.realpath(self.filename)
-        self.realpath = realpath if not " " in realpath else f"\"{realpath}\""
-
         self.permissions = permissions
 
         self.dbus_app = dbus_app
         self.dbus_permissions = dbus_permissions
 
+        self.single_instance = single_instance
+
+        self.pool_size = pool_size
+        self.pool_idle = pool_idle
+
+        self.limits = limits or {}
+        self.idle_freeze = idle_freeze
+        self.minimal_root = minimal_root
+
         self.script = DIRECTORY + f"/{self.app}.sh"
         self.app_data_dir = APP_DIRECTORY + "/" + app
 
-    def create_app(self) -> None:
+    def _config_builder(self, entry: DesktopEntry) -> ConfigBuilder:
+        return ConfigBuilder(app=self.app,
+                             entry=entry,
+                             path=self.path,
+                             permissions=self.permissions,
+                             seccomp_filter=self.seccomp_filter,
+                             dbus_app=self.dbus_app,
+                             dbus_permissions=self.dbus_permissions,
+                             single_instance=self.single_instance,
+                             pool_size=self.pool_size,
+                             pool_idle=self.pool_idle,
+                             limits=self.limits,
+                             idle_freeze=self.idle_freeze,
+                             minimal_root=self.minimal_root)
+
+    def _install(self, source: DesktopEntry) -> None:
+        sandboxed_desktop_entry_factory(
+            app=self.app,
+            name=self.entry,
+            script=f"sandbox-launch --app {self.app}",
+            source=source)
+
+        hidden_desktop_entry_factory(name=self.entry, source=source)
+
+        self._config_builder(source).build()
+
+    def create_app(self, source: Optional[DesktopEntry] = None) -> None:
 
         # Create application home directory
         try:
@@ -50,33 +93,64 @@ class Sandbox:
         except Exception:
             raise ValueError("Sandboxed application already exists")
 
-        sandboxed_desktop_entry_factory(
-            app=self.app,
-            name=self.entry,
-            script=f"sandbox-launch --app {self.app}")
+        self._install(source or desktop_entry_factory(name=self.entry))
 
-        entry = hidden_desktop_entry_factory(name=self.entry)
-        entry = desktop_entry_factory(name=self.entry)
+    def apply(self, source: DesktopEntry) -> str:
+        applications = os.path.join(HOME_DIR, ".local", "share",
+                                    "applications")
+        current = config_store().get(self.app)
 
-        ConfigBuilder(app=self.app,
-                      entry=entry,
-                      path=self.path,
-                      permissions=self.permissions,
-                      seccomp_filter=self.seccomp_filter,
-                      dbus_app=self.dbus_app,
-                      dbus_permissions=self.dbus_permissions).build()
+        data = self._config_builder(source).data()
+        installed = os.path.isdir(self.app_data_dir) and os.path.exists(
+            os.path.join(applications, f"{self.app}-sandboxed.desktop"))
 
+        if installed and current == data:
+            return "skipped"
 
-def sandbox_delete_app(app: str) -> None:
-    home_dir = os.path.expanduser("~")
-    config_file_path = os.path.join(home_dir, ".sandbox_manager", "config",
-                                    app)
+        # Unhide the desktop entry the app was previously created from
+        if current and current.get("entry") != data["entry"]:
+            try:
+                os.unlink(os.path.join(applications, current["entry"]))
+            except (OSError, KeyError, TypeError):
+                pass
 
-    config = Config.from_config(config_file_path)
+        os.makedirs(self.app_data_dir, exist_ok=True)
+        self._install(source)
+
+        return "changed" if current else "created"
+
+
+def check_args(args: Namespace) -> None:
+    if args.seccomp and not os.path.exists(args.seccomp):
+        raise ValueError(
+            "--seccomp requires a valid path to a BPF filter or policy")
+
+    # Reports policy errors now and warms the compiled filter cache
+    if args.seccomp and is_policy(args.seccomp):
+        compiled_filter(args.seccomp)
+
+    # Raises on limits cgroups would not accept
+    limits_from_args(args)
+
+    if args.dbus and not args.dbus_app:
+        raise ValueError(
+            "--dbus-app is required if dbus is enabled. Example: --dbus-app org.signal.Signal"
+        )
+
+    if not args.dbus:
+        if args.screencast or args.screenshot or args.vfs:
+            raise ValueError(
+                "Cannot enable screencasting/screenshotting/vfs without DBus access."
+            )
+
+
+def sandbox_delete_app(app: str) -> None:
+    config = Config.from_app(app)
 
     os.system(f"rm -rf {APP_DIRECTORY}/{app}")
-    os.system(f"rm -rf {CONFIG_DIRECTORY}/{app}")
+    config_store().delete(app)
     os.system(f"rm -rf {SECCOMP_DIRECTORY}/{app}")
+    remove_plan(app)
 
     applications = os.path.join(HOME_DIR, ".local", "share", "applications")
 
@@ -84,7 +158,7 @@ def sandbox_delete_app(app: str) -> None:
     os.system(f"rm -rf {applications}/{config.entry}")
 
 
-def sandbox_app_factory(args: Namespace) -> None:
+def sandbox_factory(args: Namespace) -> Sandbox:
 
     permissions = PermissionBuilder()
     permissions.from_args(args)
@@ -95,27 +169,52 @@ def sandbox_app_factory(args: Namespace) -> None:
     permissions = permissions.build()
     dbus_permissions = dbus_permissions.build()
 
-    Sandbox(app=args.app,
-            path=args.path,
-            entry=args.entry,
-            permissions=permissions,
-            seccomp_filter=args.seccomp,
-            dbus_app=args.dbus_app,
-            dbus_permissions=dbus_permissions).create_app()
-
-
-def sandbox_launcher(args: Dict[str, Any], argstr: str) -> None:
-    home_dir = os.path.expanduser("~")
-    config_file_path = os.path.join(home_dir, ".sandbox_manager", "config",
-                                    args.app)
-
-    config = Config.from_config(config_file_path)
-
-    SandboxLauncher(binary_cmd=config.cmd,
-                    args=argstr,
-                    app=config.app,
-                    path=config.path,
-                    permissions=config.permissions,
-                    seccomp_filter=config.seccomp_filter,
-                    dbus_app=config.dbus_app,
-                    dbus_permissions=config.dbus_permissions).launch()
+    return Sandbox(app=args.app,
+                   path=args.path,
+                   entry=args.entry,
+                   permissions=permissions,
+                   seccomp_filter=args.seccomp,
+                   dbus_app=args.dbus_app,
+                   dbus_permissions=dbus_permissions,
+                   single_instance=args.single_instance,
+                   pool_size=args.pool_size,
+                   pool_idle=args.pool_idle,
+                   limits=limits_from_args(args),
+                   idle_freeze=args.idle_freeze,
+                   minimal_root=args.minimal_root)
+
+
+def sandbox_app_factory(args: Namespace) -> None:
+    sandbox_factory(args).create_app()
+
+
+def config_launcher(
+        config: Config,
+        args: Optional[List[str]] = None,
+        extra_binaries: Optional[List[str]] = None) -> SandboxLauncher:
+    return SandboxLauncher(binary_cmd=config.cmd,
+                           args=args or [],
+                           app=config.app,
+                           path=config.path,
+                           permissions=config.permissions,
+                           seccomp_filter=config.seccomp_filter,
+                           dbus_app=config.dbus_app,
+                           dbus_permissions=config.dbus_permissions,
+                           single_instance=config.single_instance,
+                           limits=config.limits,
+                           minimal_root=config.minimal_root,
+                           extra_binaries=extra_binaries)
+
+
+def sandbox_launch_plan(app: str,
+                        args: Optional[List[str]] = None) -> LaunchPlan:
+    with phase("config"):
+        config = Config.from_app(app)
+
+    with phase("argv"):
+        plan = config_launcher(config, args).build()
+
+    with phase("plan.save"):
+        plan.save()
+
+    return plan
@@ -0,0 +1,496 @@
+import os, re, struct, hashlib
+from typing import Dict, List, Optional, Tuple, Union
+
+from . import SECCOMP_DIRECTORY
+from .syscalls import AUDIT_ARCH, SYSCALLS
+
+SECCOMP_CACHE_DIRECTORY = os.path.join(SECCOMP_DIRECTORY, "cache")
+
+# Part of every cache key, bump it whenever the generated code changes
+COMPILER_VERSION = 2
+
+SECCOMP_RET_KILL_PROCESS = 0x80000000
+SECCOMP_RET_KILL_THREAD = 0x00000000
+SECCOMP_RET_TRAP = 0x00030000
+SECCOMP_RET_ERRNO = 0x00050000
+SECCOMP_RET_LOG = 0x7ffc0000
+SECCOMP_RET_ALLOW = 0x7fff0000
+
+BPF_LD_W_ABS = 0x20
+BPF_JMP_JA = 0x05
+BPF_JMP_JEQ_K = 0x15
+BPF_JMP_JGT_K = 0x25
+BPF_JMP_JGE_K = 0x35
+BPF_JMP_JSET_K = 0x45
+BPF_RET_K = 0x06
+
+# Offsets into struct seccomp_data
+SECCOMP_DATA_NR = 0
+SECCOMP_DATA_ARCH = 4
+SECCOMP_DATA_ARGS = 16
+
+# Syscalls of the x32 ABI share the x86_64 audit arch
+X32_SYSCALL_BIT = 0x40000000
+
+# Checked one by one before the search over the remaining syscalls, these
+# make up most of the syscalls a desktop application makes
+HOT_SYSCALLS = [
+    "futex", "read", "write", "epoll_wait", "epoll_pwait", "recvmsg",
+    "sendmsg", "ppoll"
+]
+
+# Named values policies may use in argument filters
+CONSTANTS = {
+    "O_RDONLY": 0o0,
+    "O_WRONLY": 0o1,
+    "O_RDWR": 0o2,
+    "O_ACCMODE": 0o3,
+    "O_CREAT": 0o100,
+    "O_EXCL": 0o200,
+    "O_NOCTTY": 0o400,
+    "O_TRUNC": 0o1000,
+    "O_APPEND": 0o2000,
+    "O_NONBLOCK": 0o4000,
+    "O_DIRECTORY": 0o200000,
+    "O_NOFOLLOW": 0o400000,
+    "O_CLOEXEC": 0o2000000,
+    "O_PATH": 0o10000000,
+    "O_TMPFILE": 0o20200000,
+    "PROT_NONE": 0x0,
+    "PROT_READ": 0x1,
+    "PROT_WRITE": 0x2,
+    "PROT_EXEC": 0x4,
+    "MAP_SHARED": 0x01,
+    "MAP_PRIVATE": 0x02,
+    "MAP_FIXED": 0x10,
+    "MAP_ANONYMOUS": 0x20,
+    "AF_UNIX": 1,
+    "AF_INET": 2,
+    "AF_INET6": 10,
+    "AF_NETLINK": 16,
+    "SOCK_STREAM": 1,
+    "SOCK_DGRAM": 2,
+    "SOCK_SEQPACKET": 5,
+    "SOCK_NONBLOCK": 0o4000,
+    "SOCK_CLOEXEC": 0o2000000,
+    "F_DUPFD": 0,
+    "F_GETFD": 1,
+    "F_SETFD": 2,
+    "F_GETFL": 3,
+    "F_SETFL": 4,
+    "F_DUPFD_CLOEXEC": 1030,
+    "CLONE_VM": 0x100,
+    "CLONE_FS": 0x200,
+    "CLONE_FILES": 0x400,
+    "CLONE_SIGHAND": 0x800,
+    "CLONE_THREAD": 0x10000,
+    "CLONE_NEWNS": 0x20000,
+    "CLONE_NEWUSER": 0x10000000,
+    "CLONE_NEWPID": 0x20000000,
+    "CLONE_NEWNET": 0x40000000,
+    "TCGETS": 0x5401,
+    "FIONREAD": 0x541b,
+}
+
+MASK_32 = 0xffffffff
+MASK_64 = 0xffffffffffffffff
+
+Comparison = Tuple[int, str, int]
+Label = str
+Operand = Union[int, Label]
+Instruction = Tuple[int, Operand, Operand, Operand]
+
+# What a syscall number leads to, a return or a jump to its argument filter
+Target = Tuple[int, Operand]
+Interval = Tuple[int, Target]
+
+
+class PolicyError(ValueError):
+
+    def __init__(self, filename: str, line: int, message: str) -> None:
+        ValueError.__init__(self, f"{filename}:{line}: {message}")
+
+
+class SyscallRule:
+
+    def __init__(self, name: str, nr: int, action: int,
+                 clauses: List[List[Comparison]], otherwise: int) -> None:
+        self.name = name
+        self.nr = nr
+
+        # The action applies when any clause has all its comparisons true,
+        # a rule without clauses always applies it
+        self.action = action
+        self.clauses = clauses
+        self.otherwise = otherwise
+
+
+def machine() -> str:
+    return os.uname().machine
+
+
+def _parse_value(value: str) -> int:
+    result = 0
+
+    for term in value.split("|"):
+        term = term.strip()
+        invert = term.startswith("~")
+        term = term.lstrip("~").strip()
+
+        if term in CONSTANTS:
+            number = CONSTANTS[term]
+        else:
+            number = int(term, 0)
+
+        result |= (~number if invert else number) & MASK_64
+
+    return result
+
+
+def _parse_comparison(text: str) -> Comparison:
+    match = re.fullmatch(r"arg([0-5])\s*(==|!=|<=|>=|<|>|&|in)\s*(.+)",
+                         text.strip())
+
+    if not match:
+        raise ValueError(f"invalid comparison '{text.strip()}'")
+
+    return int(match.group(1)), match.group(2), _parse_value(match.group(3))
+
+
+def _parse_action(text: str) -> int:
+    match = re.fullmatch(r"return\s+(\w+)", text.strip())
+
+    if not match:
+        raise ValueError(f"invalid action '{text.strip()}'")
+
+    return SECCOMP_RET_ERRNO | (int(match.group(1), 0) & 0xffff)
+
+
+def parse_policy(text: str,
+                 arch: str,
+                 filename: str = "<policy>") -> List[SyscallRule]:
+    syscalls = SYSCALLS[arch]
+    rules = {}
+
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.split("#", 1)[0].strip()
+
+        if not line:
+            continue
+
+        name, separator, body = line.partition(":")
+        name, body = name.strip(), body.strip()
+
+        try:
+            if not separator or not body:
+                raise ValueError("expected '<syscall>: <filter>'")
+            if name not in syscalls:
+                raise ValueError(f"unknown syscall '{name}' on {arch}")
+            if name in rules:
+                raise ValueError(f"duplicate rule for '{name}'")
+
+            if body.startswith("return"):
+                rules[name] = SyscallRule(name, syscalls[name],
+                                          _parse_action(body), [],
+                                          SECCOMP_RET_KILL_PROCESS)
+                continue
+
+            # A filter may be followed by the errno to fail with when it does
+            # not match, instead of killing the process
+            expression, _, otherwise = body.partition(";")
+            otherwise = _parse_action(otherwise) \
+                if otherwise.strip() else SECCOMP_RET_KILL_PROCESS
+
+            if expression.strip() == "1":
+                clauses = []
+            else:
+                clauses = [[
+                    _parse_comparison(comparison)
+                    for comparison in clause.split("&&")
+                ] for clause in expression.split("||")]
+
+            rules[name] = SyscallRule(name, syscalls[name], SECCOMP_RET_ALLOW,
+                                      clauses, otherwise)
+        except ValueError as error:
+            raise PolicyError(filename, number, str(error))
+
+    return list(rules.values())
+
+
+class Assembler:
+
+    def __init__(self) -> None:
+        self._code: List[Union[Instruction, Label]] = []
+        self._labels = 0
+
+    def label(self) -> Label:
+        self._labels += 1
+        return f"L{self._labels}"
+
+    def place(self, label: Label) -> None:
+        self._code.append(label)
+
+    def emit(self,
+             code: int,
+             k: Operand = 0,
+             jt: Operand = 0,
+             jf: Operand = 0) -> None:
+        self._code.append((code, jt, jf, k))
+
+    def load(self, offset: int) -> None:
+        self.emit(BPF_LD_W_ABS, offset)
+
+    def ret(self, action: int) -> None:
+        self.emit(BPF_RET_K, action)
+
+    def assemble(self) -> bytes:
+        positions = {}
+        position = 0
+
+        for item in self._code:
+            if isinstance(item, str):
+                positions[item] = position
+            else:
+                position += 1
+
+        program = b""
+        position = 0
+
+        for item in self._code:
+            if isinstance(item, str):
+                continue
+
+            code, jt, jf, k = item
+            position += 1
+
+            # Conditional jumps are relative to the next instruction and only
+            # 8 bit wide, ja takes a 32 bit offset in k
+            if code == BPF_JMP_JA and isinstance(k, str):
+                k = positions[k] - position
+            jt = positions[jt] - position if isinstance(jt, str) else jt
+            jf = positions[jf] - position if isinstance(jf, str) else jf
+
+            if not 0 <= jt <= 255 or not 0 <= jf <= 255:
+                raise ValueError("seccomp filter jump out of range")
+
+            program += struct.pack("=HBBI", code, jt, jf, k)
+
+        if position > 4096:
+            raise ValueError("seccomp filter exceeds 4096 instructions")
+
+        return program
+
+
+def _emit_comparison(asm: Assembler, comparison: Comparison,
+                     fail: Label) -> None:
+    arg, operator, value = comparison
+    low = SECCOMP_DATA_ARGS + 8 * arg
+    high = low + 4
+    value_low, value_high = value & MASK_32, value >> 32
+    ok = asm.label()
+
+    # Arguments are 64 bit, so every comparison checks the high half first
+    asm.load(high)
+
+    if operator == "==":
+        asm.emit(BPF_JMP_JEQ_K, value_high, 0, fail)
+        asm.load(low)
+        asm.emit(BPF_JMP_JEQ_K, value_low, 0, fail)
+    elif operator == "!=":
+        asm.emit(BPF_JMP_JEQ_K, value_high, 0, ok)
+        asm.load(low)
+        asm.emit(BPF_JMP_JEQ_K, value_low, fail, 0)
+    elif operator == "&":
+        asm.emit(BPF_JMP_JSET_K, value_high, ok, 0)
+        asm.load(low)
+        asm.emit(BPF_JMP_JSET_K, value_low, 0, fail)
+    elif operator == "in":
+        asm.emit(BPF_JMP_JSET_K, ~value_high & MASK_32, fail, 0)
+        asm.load(low)
+        asm.emit(BPF_JMP_JSET_K, ~value_low & MASK_32, fail, 0)
+    elif operator in (">", ">="):
+        asm.emit(BPF_JMP_JGT_K, value_high, ok, 0)
+        asm.emit(BPF_JMP_JEQ_K, value_high, 0, fail)
+        asm.load(low)
+        asm.emit(BPF_JMP_JGT_K if operator == ">" else BPF_JMP_JGE_K,
+                 value_low, 0, fail)
+    else:
+        asm.emit(BPF_JMP_JGT_K, value_high, fail, 0)
+        asm.emit(BPF_JMP_JEQ_K, value_high, 0, ok)
+        asm.load(low)
+        asm.emit(BPF_JMP_JGT_K if operator == "<=" else BPF_JMP_JGE_K,
+                 value_low, fail, 0)
+
+    asm.place(ok)
+
+
+def _emit_rule(asm: Assembler, rule: SyscallRule) -> None:
+    # Each clause returns by itself, so no jump has to cross another clause
+    for clause in rule.clauses:
+        fail = asm.label()
+
+        for comparison in clause:
+            _emit_comparison(asm, comparison, fail)
+
+        asm.ret(rule.action)
+        asm.place(fail)
+
+    asm.ret(rule.otherwise)
+
+
+def _tree_size(intervals: List[Interval]) -> int:
+    if len(intervals) == 1:
+        return 1
+
+    middle = len(intervals) // 2
+    left = _tree_size(intervals[:middle])
+
+    return 1 + (left > 255) + left + _tree_size(intervals[middle:])
+
+
+def _emit_tree(asm: Assembler, intervals: List[Interval]) -> None:
+    if len(intervals) == 1:
+        code, k = intervals[0][1]
+        asm.emit(code, k)
+        return
+
+    middle = len(intervals) // 2
+    right = asm.label()
+
+    # Subtrees bigger than a conditional jump can skip go through ja
+    if _tree_size(intervals[:middle]) > 255:
+        asm.emit(BPF_JMP_JGE_K, intervals[middle][0], 0, 1)
+        asm.emit(BPF_JMP_JA, right)
+    else:
+        asm.emit(BPF_JMP_JGE_K, intervals[middle][0], right, 0)
+
+    _emit_tree(asm, intervals[:middle])
+    asm.place(right)
+    _emit_tree(asm, intervals[middle:])
+
+
+def _intervals(targets: Dict[int, Target]) -> List[Interval]:
+    default = (BPF_RET_K, SECCOMP_RET_KILL_PROCESS)
+    intervals = []
+
+    def add(start: int, target: Target) -> None:
+        if intervals and intervals[-1][0] == start:
+            intervals.pop()
+        if not intervals or intervals[-1][1] != target:
+            intervals.append((start, target))
+
+    # Neighbouring syscalls with the same outcome share one range, everything
+    # between and above them, x32 syscalls included, is killed
+    add(0, default)
+    for nr in sorted(targets):
+        add(nr, targets[nr])
+        add(nr + 1, default)
+
+    return intervals
+
+
+def compile_policy(text: str,
+                   arch: Optional[str] = None,
+                   filename: str = "<policy>",
+                   layout: str = "tree") -> bytes:
+    arch = arch or machine()
+
+    if arch not in AUDIT_ARCH:
+        raise ValueError(f"seccomp policies are not supported on {arch}")
+
+    rules = parse_policy(text, arch, filename)
+    asm = Assembler()
+    targets = {}
+    blocks = []
+
+    for rule in rules:
+        if rule.clauses:
+            block = asm.label()
+            blocks.append((block, rule))
+            targets[rule.nr] = (BPF_JMP_JA, block)
+        else:
+            targets[rule.nr] = (BPF_RET_K, rule.action)
+
+    asm.load(SECCOMP_DATA_ARCH)
+    asm.emit(BPF_JMP_JEQ_K, AUDIT_ARCH[arch], 1, 0)
+    asm.ret(SECCOMP_RET_KILL_PROCESS)
+
+    asm.load(SECCOMP_DATA_NR)
+
+    if layout == "linear":
+        if arch == "x86_64":
+            asm.emit(BPF_JMP_JGE_K, X32_SYSCALL_BIT, 0, 1)
+            asm.ret(SECCOMP_RET_KILL_PROCESS)
+
+        for rule in rules:
+            asm.emit(BPF_JMP_JEQ_K, rule.nr, 0, 1)
+            asm.emit(*targets[rule.nr])
+
+        asm.ret(SECCOMP_RET_KILL_PROCESS)
+    else:
+        # The hottest syscalls are matched before the search, which then no
+        # longer has to tell them apart from their neighbours
+        for name in HOT_SYSCALLS:
+            nr = SYSCALLS[arch].get(name)
+
+            if nr in targets:
+                asm.emit(BPF_JMP_JEQ_K, nr, 0, 1)
+                asm.emit(*targets.pop(nr))
+
+        _emit_tree(asm, _intervals(targets))
+
+    # Argument filters live after the dispatch and are reached through ja
+    for block, rule in blocks:
+        asm.place(block)
+        _emit_rule(asm, rule)
+
+    return asm.assemble()
+
+
+def is_policy(filename: str) -> bool:
+    return filename.endswith(".policy")
+
+
+def compiled_filter(policy: str, arch: Optional[str] = None) -> str:
+    arch = arch or machine()
+
+    with open(policy, "rb") as fp:
+        text = fp.read()
+
+    # Keyed on what the output depends on, so touching or copying a policy
+    # does not make it stale
+    digest = hashlib.sha256(text).hexdigest()
+    filename = os.path.join(SECCOMP_CACHE_DIRECTORY,
+                            f"{digest}-{arch}-v{COMPILER_VERSION}.bpf")
+
+    if os.path.exists(filename):
+        return filename
+
+    program = compile_policy(text.decode(), arch, policy)
+
+    os.makedirs(SECCOMP_CACHE_DIRECTORY, exist_ok=True)
+    tmp = f"{filename}.{os.getpid()}.tmp"
+
+    with open(tmp, "wb") as fp:
+        fp.write(program)
+
+    os.replace(tmp, filename)
+
+    return filename
+
+
+def seccomp_filter_fd(seccomp_filter: str) -> int:
+    # Precompiled filters are handed over as they are
+    if not is_policy(seccomp_filter):
+        fd = os.open(seccomp_filter, os.O_RDONLY)
+        os.set_inheritable(fd, True)
+        return fd
+
+    with open(compiled_filter(seccomp_filter), "rb") as fp:
+        program = fp.read()
+
+    fd = os.memfd_create("seccomp", 0)
+    os.write(fd, program)
+    os.lseek(fd, 0, os.SEEK_SET)
+
+    return fd
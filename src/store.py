@@ -0,0 +1,181 @@
+import os, json, sqlite3, threading
+from typing import Any, Dict, List, Optional
+
+from . import CONFIG_DATABASE, CONFIG_DIRECTORY
+
+# Bumped with every entry appended to MIGRATIONS, stored as user_version
+SCHEMA_VERSION = 1
+
+MIGRATIONS = {
+    1: [
+        "CREATE TABLE apps (app TEXT PRIMARY KEY, data TEXT NOT NULL, "
+        "revision INTEGER NOT NULL DEFAULT 1)"
+    ],
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class ConfigStore:
+
+    def __init__(self, database: str = CONFIG_DATABASE) -> None:
+        self._database = database
+        self._connection: Optional[sqlite3.Connection] = None
+
+        # One connection is shared by the threads of a manifest run
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection:
+            return self._connection
+
+        os.makedirs(os.path.dirname(self._database), exist_ok=True)
+
+        # Transactions are started explicitly, writers wait for each other
+        # instead of failing while another sandbox-* command holds the lock
+        connection = sqlite3.connect(self._database,
+                                     timeout=30,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+
+        self._migrate(connection)
+        self._connection = connection
+
+        return connection
+
+    def _migrate(self, connection: sqlite3.Connection) -> None:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+
+        if version == SCHEMA_VERSION:
+            return
+
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"{self._database} has schema version {version}, "
+                             f"this version supports {SCHEMA_VERSION}")
+
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            # Another process may have migrated while this one waited
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+
+            for step in range(version + 1, SCHEMA_VERSION + 1):
+                for statement in MIGRATIONS[step]:
+                    connection.execute(statement)
+
+            if version == 0:
+                self._import_json(connection)
+
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        if version == 0:
+            self._retire_json()
+
+    def _import_json(self, connection: sqlite3.Connection) -> None:
+        if not os.path.isdir(CONFIG_DIRECTORY):
+            return
+
+        for app in os.listdir(CONFIG_DIRECTORY):
+            try:
+                with open(os.path.join(CONFIG_DIRECTORY, app)) as fp:
+                    data = json.load(fp)
+            except (OSError, ValueError):
+                continue
+
+            connection.execute(
+                "INSERT OR REPLACE INTO apps (app, data) VALUES (?, ?)",
+                (app, json.dumps(data)))
+
+    def _retire_json(self) -> None:
+        # Kept around instead of deleted so a downgrade can move them back
+        try:
+            os.rename(CONFIG_DIRECTORY, CONFIG_DIRECTORY + ".migrated")
+        except OSError:
+            pass
+
+    def get(self, app: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data FROM apps WHERE app = ?", (app, )).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def revision(self, app: str) -> Optional[int]:
+        # Raised by every write of the app's row
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT revision FROM apps WHERE app = ?", (app, )).fetchone()
+
+        return row[0] if row else None
+
+    def apps(self) -> List[str]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT app FROM apps ORDER BY app").fetchall()
+
+        return [row[0] for row in rows]
+
+    def items(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT app, data FROM apps ORDER BY app").fetchall()
+
+        return {app: json.loads(data) for app, data in rows}
+
+    def _write(self, statement: str, parameters: tuple) -> int:
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                changed = connection.execute(statement, parameters).rowcount
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+        return changed
+
+    def put(self, app: str, data: Dict[str, Any]) -> None:
+        self._write(
+            "INSERT INTO apps (app, data) VALUES (?, ?) ON CONFLICT (app) "
+            "DO UPDATE SET data = excluded.data, revision = revision + 1",
+            (app, json.dumps(data)))
+
+    def update(self, app: str, **values) -> None:
+        # Merged inside the write transaction, so concurrent updates of
+        # different keys do not undo each other
+        paths = ", ".join(f"'$.\"{key}\"', json(?)" for key in values)
+        parameters = tuple(json.dumps(value) for value in values.values())
+
+        if not self._write(
+                f"UPDATE apps SET data = json_set(data, {paths}), "
+                "revision = revision + 1 WHERE app = ?", parameters + (app, )):
+            raise KeyError(f"No sandboxed application '{app}'")
+
+    def delete(self, app: str) -> bool:
+        return bool(self._write("DELETE FROM apps WHERE app = ?", (app, )))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+
+def config_store() -> ConfigStore:
+    global _store
+
+    with _store_lock:
+        if not _store:
+            _store = ConfigStore()
+
+        return _store
+
@@ -0,0 +1,197 @@
+import os, json, math, time
+from typing import Any, Dict, List, Optional
+
+from . import DIRECTORY
+
+TRACE_DIRECTORY = os.path.join(DIRECTORY, "traces")
+
+# Traces kept per app, the oldest are deleted first
+MAX_TRACES = 100
+
+_trace = None
+
+
+class LaunchTrace:
+
+    def __init__(self, app: str) -> None:
+        self.app = app
+        self.started = time.time()
+        self.events: List[Dict[str, Any]] = []
+
+    def complete(self,
+                 name: str,
+                 start: int,
+                 end: int,
+                 args: Optional[Dict[str, Any]] = None) -> None:
+        # Chrome trace timestamps are microseconds, here on CLOCK_MONOTONIC
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": start / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": 0,
+            "args": args or {}
+        })
+
+    def instant(self, name: str, at: Optional[int] = None) -> None:
+        self.events.append({
+            "name": name,
+            "ph": "i",
+            "s": "p",
+            "ts": (at or time.monotonic_ns()) / 1000,
+            "pid": os.getpid(),
+            "tid": 0
+        })
+
+    def _process_start(self) -> Optional[int]:
+        # The kernel keeps the start time in clock ticks since boot, and
+        # CLOCK_MONOTONIC runs alongside boot time minus suspend
+        try:
+            with open("/proc/self/stat") as fp:
+                ticks = int(fp.read().rsplit(")", 1)[1].split()[19])
+        except (OSError, ValueError, IndexError):
+            return None
+
+        started = ticks * 1_000_000_000 // os.sysconf("SC_CLK_TCK")
+        offset = time.clock_gettime_ns(time.CLOCK_BOOTTIME) - \
+            time.monotonic_ns()
+
+        return started - offset
+
+    def startup(self) -> None:
+        start = self._process_start()
+
+        if start:
+            self.complete("interpreter", start, time.monotonic_ns())
+
+    def save(self) -> str:
+        os.makedirs(TRACE_DIRECTORY, exist_ok=True)
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        filename = os.path.join(TRACE_DIRECTORY,
+                                f"{self.app}-{stamp}-{os.getpid()}.json")
+
+        with open(filename, "w") as fp:
+            json.dump(
+                {
+                    "traceEvents": self.events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {
+                        "app": self.app,
+                        "started": self.started
+                    }
+                }, fp)
+
+        for old in trace_files(self.app)[:-MAX_TRACES]:
+            os.unlink(old)
+
+        return filename
+
+
+class _Phase:
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._start = 0
+
+    def __enter__(self) -> None:
+        self._start = time.monotonic_ns()
+
+    def __exit__(self, *exc) -> None:
+        if _trace:
+            _trace.complete(self._name, self._start, time.monotonic_ns())
+
+
+class _NoPhase:
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_no_phase = _NoPhase()
+
+
+def start_trace(app: str) -> LaunchTrace:
+    global _trace
+
+    _trace = LaunchTrace(app)
+    _trace.startup()
+
+    return _trace
+
+
+def active_trace() -> Optional[LaunchTrace]:
+    return _trace
+
+
+def phase(name: str):
+    # Costs next to nothing unless sandbox-launch --trace started a trace
+    return _Phase(name) if _trace else _no_phase
+
+
+def finish_trace() -> Optional[str]:
+    global _trace
+
+    if not _trace:
+        return None
+
+    trace, _trace = _trace, None
+    return trace.save()
+
+
+def trace_files(app: Optional[str] = None) -> List[str]:
+    try:
+        filenames = os.listdir(TRACE_DIRECTORY)
+    except FileNotFoundError:
+        return []
+
+    paths = [
+        os.path.join(TRACE_DIRECTORY, filename) for filename in filenames
+        if filename.endswith(".json") and (
+            not app or filename.rsplit("-", 3)[0] == app)
+    ]
+
+    return sorted(paths, key=os.path.getmtime)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    # Nearest rank, with few values the p95 is the largest one
+    values = sorted(values)
+
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def aggregate_traces(filenames: List[str]) -> Dict[str, Dict[str, float]]:
+    durations: Dict[str, List[float]] = {}
+    offsets: Dict[str, List[float]] = {}
+
+    for filename in filenames:
+        try:
+            with open(filename) as fp:
+                events = json.load(fp)["traceEvents"]
+        except (OSError, ValueError, KeyError):
+            continue
+
+        phases = [event for event in events if event.get("ph") == "X"]
+        origin = min((event["ts"] for event in phases), default=0)
+
+        for event in phases:
+            durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+            offsets.setdefault(event["name"], []).append(event["ts"] - origin)
+
+    # Phases in the order a launch goes through them
+    names = sorted(durations, key=lambda name: percentile(offsets[name], 0.5))
+
+    return {
+        name: {
+            "count": len(durations[name]),
+            "p50_ms": round(percentile(durations[name], 0.5), 3),
+            "p95_ms": round(percentile(durations[name], 0.95), 3),
+            "max_ms": round(max(durations[name]), 3)
+        }
+        for name in names
+    }
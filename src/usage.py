@@ -0,0 +1,212 @@
+import os, fcntl, struct, resource, subprocess
+from typing import Any, Dict, List, Optional, Self
+
+from . import DIRECTORY
+from .cgroup import SandboxCgroup
+from .trace import percentile
+
+USAGE_DIRECTORY = os.path.join(DIRECTORY, "usage")
+
+# One fixed size record per launch: start time, wall, user and system CPU
+# seconds, peak memory, bytes read and written, exit status and whether the
+# numbers came from the sandbox's cgroup or from wait4
+RECORD = struct.Struct("<dfffQQQib")
+
+# Launches kept per app, the history is cut back once it holds twice as many
+MAX_RECORDS = 5000
+
+SOURCE_RUSAGE = 0
+SOURCE_CGROUP = 1
+
+
+class LaunchUsage:
+
+    def __init__(self,
+                 started: float,
+                 wall: float,
+                 user: float,
+                 system: float,
+                 peak_memory: int,
+                 read_bytes: int,
+                 written_bytes: int,
+                 status: int,
+                 source: int = SOURCE_RUSAGE) -> None:
+        self.started = started
+        self.wall = wall
+        self.user = user
+        self.system = system
+        self.peak_memory = peak_memory
+        self.read_bytes = read_bytes
+        self.written_bytes = written_bytes
+        self.status = status
+        self.source = source
+
+    @property
+    def cpu(self) -> float:
+        return self.user + self.system
+
+    @classmethod
+    def from_rusage(cls, started: float, wall: float, status: int,
+                    rusage: resource.struct_rusage) -> Self:
+        # ru_maxrss is in KiB and only covers the largest single process,
+        # block counts are in 512 byte units
+        return cls(started=started,
+                   wall=wall,
+                   user=rusage.ru_utime,
+                   system=rusage.ru_stime,
+                   peak_memory=rusage.ru_maxrss * 1024,
+                   read_bytes=rusage.ru_inblock * 512,
+                   written_bytes=rusage.ru_oublock * 512,
+                   status=status)
+
+    def add_cgroup(self, usage: Dict[str, int]) -> None:
+        # The cgroup counts every process of the sandbox, including those
+        # that were never waited for
+        if "user_usec" in usage:
+            self.user = usage["user_usec"] / 1e6
+            self.system = usage["system_usec"] / 1e6
+        if "memory.peak" in usage:
+            self.peak_memory = usage["memory.peak"]
+            self.source = SOURCE_CGROUP
+        if "rbytes" in usage:
+            self.read_bytes = usage["rbytes"]
+            self.written_bytes = usage.get("wbytes", 0)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> Self:
+        return cls(*RECORD.unpack(data))
+
+    def pack(self) -> bytes:
+        return RECORD.pack(self.started, self.wall, self.user, self.system,
+                           self.peak_memory, self.read_bytes,
+                           self.written_bytes, self.status, self.source)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "started": round(self.started, 3),
+            "wall": round(self.wall, 3),
+            "user": round(self.user, 3),
+            "system": round(self.system, 3),
+            "peak_memory": self.peak_memory,
+            "read_bytes": self.read_bytes,
+            "written_bytes": self.written_bytes,
+            "status": self.status,
+            "source": "cgroup" if self.source == SOURCE_CGROUP else "rusage"
+        }
+
+
+def usage_filename(app: str) -> str:
+    return os.path.join(USAGE_DIRECTORY, f"{app}.usage")
+
+
+def wait_usage(
+        process: subprocess.Popen) -> Optional[resource.struct_rusage]:
+    # Popen.wait throws the rusage of the child away, wait4 returns it
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Already reaped by a poll() from another thread
+        process.wait()
+        return None
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+def record_usage(app: str, usage: LaunchUsage) -> None:
+    os.makedirs(USAGE_DIRECTORY, exist_ok=True)
+
+    filename = usage_filename(app)
+    fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    try:
+        # Launchers of the same app append at the same time, and one of them
+        # may be cutting the history back
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        # A record cut short by a crash would shift every one appended after
+        # it, it is dropped first
+        size = os.fstat(fd).st_size
+        if size % RECORD.size:
+            os.ftruncate(fd, size - size % RECORD.size)
+
+        os.write(fd, usage.pack())
+
+        if os.fstat(fd).st_size > 2 * MAX_RECORDS * RECORD.size:
+            _compact(filename)
+    finally:
+        os.close(fd)
+
+
+def _compact(filename: str) -> None:
+    # In place, the file is never replaced while others wait for its lock.
+    # pwrite ignores the offset on O_APPEND descriptors, this one is opened
+    # without.
+    fd = os.open(filename, os.O_RDWR)
+
+    try:
+        size = os.fstat(fd).st_size
+        size -= size % RECORD.size
+        keep = min(size, MAX_RECORDS * RECORD.size)
+
+        os.pwrite(fd, os.pread(fd, keep, size - keep), 0)
+        os.ftruncate(fd, keep)
+    finally:
+        os.close(fd)
+
+
+def read_usage(app: str) -> List[LaunchUsage]:
+    try:
+        with open(usage_filename(app), "rb") as fp:
+            data = fp.read()
+    except FileNotFoundError:
+        return []
+
+    # A record cut short by a crash is left out
+    return [
+        LaunchUsage.unpack(data[offset:offset + RECORD.size])
+        for offset in range(0, len(data) - RECORD.size + 1, RECORD.size)
+    ]
+
+
+def usage_apps() -> List[str]:
+    try:
+        filenames = os.listdir(USAGE_DIRECTORY)
+    except FileNotFoundError:
+        return []
+
+    return sorted(filename[:-len(".usage")] for filename in filenames
+                  if filename.endswith(".usage"))
+
+
+def summarize_usage(records: List[LaunchUsage]) -> Dict[str, Any]:
+    memory = [record.peak_memory for record in records]
+    cpu = [record.cpu for record in records]
+    wall = [record.wall for record in records]
+
+    return {
+        "launches": len(records),
+        "failed": sum(1 for record in records if record.status),
+        "last": round(max(record.started for record in records), 3),
+        "peak_memory_p50": int(percentile(memory, 0.5)),
+        "peak_memory_max": max(memory),
+        "cpu_p50": round(percentile(cpu, 0.5), 3),
+        "cpu_total": round(sum(cpu), 3),
+        "wall_p50": round(percentile(wall, 0.5), 3),
+        "read_bytes": sum(record.read_bytes for record in records),
+        "written_bytes": sum(record.written_bytes for record in records),
+    }
+
+
+def launch_usage(started: float, wall: float, status: int,
+                 rusage: resource.struct_rusage,
+                 cgroup: Optional[SandboxCgroup]) -> LaunchUsage:
+    usage = LaunchUsage.from_rusage(started=started,
+                                    wall=wall,
+                                    status=status,
+                                    rusage=rusage)
+
+    if cgroup:
+        usage.add_cgroup(cgroup.usage())
+
+    return usage
@@ -0,0 +1,85 @@
+#!/bin/python3
+
+import argparse, json, sys, time
+from src.usage import read_usage, summarize_usage, usage_apps
+
+SORT_KEYS = {
+    "memory": "peak_memory_max",
+    "cpu": "cpu_total",
+    "launches": "launches",
+}
+
+parser = argparse.ArgumentParser(
+    description='Memory, CPU time and IO of sandboxed application launches')
+
+parser.add_argument('--app', help="Only launches of this application")
+parser.add_argument('-n',
+                    '--last',
+                    type=int,
+                    default=1000,
+                    help="Number of recent launches per application")
+parser.add_argument('--sort',
+                    choices=list(SORT_KEYS),
+                    default="memory",
+                    help="Order applications by their heaviest use")
+parser.add_argument('--json', action='store_true', help="Print JSON")
+
+args = parser.parse_args()
+
+
+def size(value: int) -> str:
+    for unit in ("B", "K", "M", "G"):
+        if value < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else \
+                f"{value:.1f}{unit}"
+        value /= 1024
+
+    return f"{value:.1f}T"
+
+
+apps = [args.app] if args.app else usage_apps()
+records = {app: read_usage(app)[-args.last:] for app in apps}
+summaries = {app: summarize_usage(launches)
+             for app, launches in records.items() if launches}
+
+if not summaries:
+    sys.exit("No launches recorded yet")
+
+summaries = dict(
+    sorted(summaries.items(),
+           key=lambda item: item[1][SORT_KEYS[args.sort]],
+           reverse=True))
+
+if args.json:
+    output = {"apps": summaries}
+
+    if args.app:
+        output["launches"] = [record.as_dict() for record in records[args.app]]
+
+    print(json.dumps(output, indent=4))
+    sys.exit()
+
+print(f"{'app':20} {'runs':>5} {'failed':>6} {'mem p50':>8} {'mem max':>8} "
+      f"{'cpu p50':>8} {'cpu total':>10} {'wall p50':>9} {'read':>8} "
+      f"{'written':>8}")
+print("------------------")
+
+for app, summary in summaries.items():
+    print(f"{app:20} {summary['launches']:5} {summary['failed']:6} "
+          f"{size(summary['peak_memory_p50']):>8} "
+          f"{size(summary['peak_memory_max']):>8} "
+          f"{summary['cpu_p50']:7.2f}s {summary['cpu_total']:9.2f}s "
+          f"{summary['wall_p50']:8.2f}s {size(summary['read_bytes']):>8} "
+          f"{size(summary['written_bytes']):>8}")
+
+# A single app also gets its most recent launches one by one
+if args.app:
+    print("------------------")
+
+    for record in records[args.app][-10:]:
+        started = time.strftime("%Y-%m-%d %H:%M:%S",
+                                time.localtime(record.started))
+
+        print(f"{started}  status {record.status:4}  "
+              f"mem {size(record.peak_memory):>8}  cpu {record.cpu:7.2f}s  "
+              f"wall {record.wall:8.2f}s  ({record.as_dict()['source']})")
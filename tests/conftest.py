@@ -0,0 +1,26 @@
+import os, sys, shutil, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The sandbox paths are resolved from the environment when src is imported,
+# the tests get a $HOME and runtime directory of their own
+_directory = tempfile.mkdtemp(prefix="sandbox-manager-tests-")
+
+os.environ.update({
+    "HOME": os.path.join(_directory, "home"),
+    "USER": "test",
+    "XDG_RUNTIME_DIR": os.path.join(_directory, "run"),
+    "XDG_DATA_DIRS": os.path.join(_directory, "share"),
+})
+
+for variable in ("DISPLAY", "WAYLAND_DISPLAY", "XAUTHORITY"):
+    os.environ.pop(variable, None)
+
+for directory in ("home", "run", "share"):
+    os.makedirs(os.path.join(_directory, directory))
+
+sys.path.insert(0, ROOT)
+
+
+def pytest_unconfigure(config) -> None:
+    shutil.rmtree(_directory, ignore_errors=True)
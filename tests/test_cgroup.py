@@ -0,0 +1,110 @@
+import os, subprocess
+
+import pytest
+
+from src import cgroup
+from src.cgroup import SandboxCgroup, parse_limits, scope_properties
+
+
+@pytest.mark.parametrize("limits, parsed", [
+    ({"memory.max": "512M"}, {"memory.max": str(512 << 20)}),
+    ({"memory.high": "2GiB"}, {"memory.high": str(2 << 30)}),
+    ({"memory.max": "4096"}, {"memory.max": "4096"}),
+    ({"memory.max": "max"}, {"memory.max": "max"}),
+    ({"cpu.max": "150%"}, {"cpu.max": "150000 100000"}),
+    ({"cpu.max": "max 50000"}, {"cpu.max": "max 50000"}),
+    ({"cpu.max": "20000"}, {"cpu.max": "20000 100000"}),
+    ({"cpu.weight": " 0100 "}, {"cpu.weight": "100"}),
+    ({"io.weight": 10000}, {"io.weight": "10000"}),
+    ({"pids.max": "256"}, {"pids.max": "256"}),
+])
+def test_parse_limits(limits, parsed) -> None:
+    assert parse_limits(limits) == parsed
+
+
+@pytest.mark.parametrize("limits", [
+    {"memory.swap.max": "1G"},
+    {"memory.max": "lots"},
+    {"memory.max": "-1G"},
+    {"cpu.max": "0%"},
+    {"cpu.max": "half"},
+    {"cpu.weight": "0"},
+    {"io.weight": "10001"},
+    {"pids.max": "0"},
+    {"pids.max": "many"},
+])
+def test_parse_invalid_limits(limits) -> None:
+    with pytest.raises(ValueError):
+        parse_limits(limits)
+
+
+def test_scope_properties() -> None:
+    assert scope_properties({
+        "cpu.weight": "50",
+        "io.weight": "200",
+        "pids.max": "max",
+        "memory.high": "1073741824",
+        "memory.max": "max",
+        "cpu.max": "150000 100000",
+    }) == [
+        "CPUWeight=50", "IOWeight=200", "TasksMax=infinity",
+        "MemoryHigh=1073741824", "MemoryMax=infinity", "CPUQuota=150%",
+        "CPUQuotaPeriodSec=100000us"
+    ]
+
+
+def test_scope_properties_without_cpu_quota() -> None:
+    assert scope_properties({"cpu.max": "max 100000"}) == []
+
+
+@pytest.fixture
+def hierarchy(tmp_path, monkeypatch):
+    # Stands in for the cgroupfs, the launcher runs in session/launcher
+    root = tmp_path / "cgroup"
+    session = root / "session"
+    (session / "launcher").mkdir(parents=True)
+    (session / "cgroup.controllers").write_text("cpu io memory pids\n")
+
+    monkeypatch.setattr(cgroup, "cgroup_mount", lambda: str(root))
+    monkeypatch.setattr(
+        SandboxCgroup, "of",
+        classmethod(lambda cls, pid: cls(str(session / "launcher"))))
+
+    return session
+
+
+def test_create_next_to_launcher(hierarchy) -> None:
+    sandbox = SandboxCgroup.create("App", {"memory.max": str(512 << 20)})
+
+    assert os.path.dirname(sandbox.path) == str(hierarchy)
+    assert os.path.basename(sandbox.path).startswith(
+        f"sandbox-App-{os.getpid()}-")
+
+    with open(os.path.join(sandbox.path, "memory.max")) as fp:
+        assert fp.read() == str(512 << 20)
+
+
+def test_create_without_controller(hierarchy) -> None:
+    (hierarchy / "cgroup.controllers").write_text("memory io\n")
+
+    assert SandboxCgroup.create("App", {"pids.max": "64"}) is None
+    assert sorted(os.listdir(hierarchy)) == ["cgroup.controllers", "launcher"]
+
+
+def test_create_removes_stale_cgroups(hierarchy) -> None:
+    # A pid that is no longer in use
+    process = subprocess.Popen(["true"])
+    process.wait()
+
+    stale = hierarchy / f"sandbox-App-{process.pid}-0"
+    running = hierarchy / f"sandbox-App-{os.getpid()}-1000"
+    other = hierarchy / f"sandbox-Other-{process.pid}-0"
+
+    for path in (stale, running, other):
+        path.mkdir()
+
+    assert SandboxCgroup.create("App", {}) is not None
+
+    assert not stale.exists()
+    assert running.exists()
+    assert other.exists()
@@ -0,0 +1,140 @@
+"""
+Runs the Exec lines of a sandboxed desktop entry through sandbox-create and
+sandbox-launch, against a bwrap stand-in that records what it would run.
+
+    python3 -m pytest tests
+"""
+
+import os, sys, subprocess, tempfile, unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.desktop import split_exec
+
+# The options arrive through --args, the command follows "--"
+BWRAP_STUB = """#!/bin/sh
+while [ "$1" != "--" ]; do shift; done
+shift
+printf '%s\\n' "$@" > "$BWRAP_ARGV"
+"""
+
+DESKTOP_ENTRY = """[Desktop Entry]
+Type=Application
+Name=Browser
+Exec=/opt/browser/browser %U
+Actions=new-window;private-window;
+
+[Desktop Action new-window]
+Name=New Window
+Exec=/opt/browser/browser --new-window
+
+[Desktop Action private-window]
+Name=Private Window
+Exec=/opt/browser/browser --private-window %U
+"""
+
+
+class SandboxedEntryTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        tmp = self._tmp.name
+
+        self.env = dict(os.environ,
+                        HOME=os.path.join(tmp, "home"),
+                        USER="test",
+                        XDG_RUNTIME_DIR=os.path.join(tmp, "run"),
+                        XDG_DATA_DIRS=os.path.join(tmp, "share"),
+                        BWRAP_ARGV=os.path.join(tmp, "argv"),
+                        SANDBOX_MANAGER_BWRAP=os.path.join(tmp, "bwrap"))
+        self.env.pop("WAYLAND_DISPLAY", None)
+        self.env.pop("DISPLAY", None)
+
+        for directory in (os.path.join(self.env["HOME"], ".local", "share",
+                                       "applications"),
+                          os.path.join(self.env["XDG_DATA_DIRS"],
+                                       "applications"),
+                          self.env["XDG_RUNTIME_DIR"]):
+            os.makedirs(directory)
+
+        with open(self.env["SANDBOX_MANAGER_BWRAP"], "w") as fp:
+            fp.write(BWRAP_STUB)
+        os.chmod(self.env["SANDBOX_MANAGER_BWRAP"], 0o755)
+
+        with open(
+                os.path.join(self.env["XDG_DATA_DIRS"], "applications",
+                             "browser.desktop"), "w") as fp:
+            fp.write(DESKTOP_ENTRY)
+
+        self._run([
+            os.path.join(ROOT, "create.py"), "--app", "Browser", "--path",
+            "/opt/browser", "--entry", "browser"
+        ])
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def _run(self, argv: list) -> None:
+        subprocess.run([sys.executable] + argv,
+                       env=self.env,
+                       check=True,
+                       stdout=subprocess.DEVNULL)
+
+    def _exec_lines(self) -> dict:
+        filename = os.path.join(self.env["HOME"], ".local", "share",
+                                "applications", "Browser-sandboxed.desktop")
+        lines = {}
+        group = None
+
+        with open(filename) as fp:
+            for line in fp:
+                line = line.strip()
+
+                if line.startswith("["):
+                    group = line[1:-1]
+                elif line.startswith("Exec="):
+                    lines[group] = line[len("Exec="):]
+
+        return lines
+
+    def _launch(self, exec_line: str, *targets: str) -> list:
+        # What a desktop environment runs, with the field codes expanded
+        argv = []
+
+        for arg in split_exec(exec_line):
+            if arg == "%U":
+                argv += targets
+            else:
+                argv.append(arg)
+
+        self.assertEqual(argv[0], "sandbox-launch")
+        self._run([os.path.join(ROOT, "launch.py")] + argv[1:])
+
+        with open(self.env["BWRAP_ARGV"]) as fp:
+            return fp.read().splitlines()
+
+    def test_action_with_option(self) -> None:
+        exec_line = self._exec_lines()["Desktop Action new-window"]
+
+        self.assertEqual(self._launch(exec_line),
+                         ["/opt/browser/browser", "--new-window"])
+
+    def test_action_with_option_and_urls(self) -> None:
+        exec_line = self._exec_lines()["Desktop Action private-window"]
+
+        self.assertEqual(
+            self._launch(exec_line, "https://example.org", "-dash.html"), [
+                "/opt/browser/browser", "--private-window",
+                "https://example.org", "-dash.html"
+            ])
+
+    def test_entry_with_urls(self) -> None:
+        exec_line = self._exec_lines()["Desktop Entry"]
+
+        self.assertEqual(self._launch(exec_line, "-dash.html"),
+                         ["/opt/browser/browser", "-dash.html"])
+
+
+if __name__ == "__main__":
+    unittest.main()
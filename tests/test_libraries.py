@@ -0,0 +1,70 @@
+import os, shutil
+
+import pytest
+
+from src import launcher
+from src.launcher import SandboxLauncher
+from src.libraries import sandbox_path
+from src.permissions import PermissionBuilder
+
+# Any host program the app does not link against stands in for bwrap
+BWRAP = os.path.realpath(shutil.which("env"))
+
+
+@pytest.fixture
+def app(tmp_path) -> str:
+    # The app directory is bound as a whole, it has to be one of its own
+    binary = tmp_path / "app" / "true"
+    binary.parent.mkdir()
+    shutil.copy(shutil.which("true"), binary)
+
+    return str(binary)
+
+
+def bound(app: str,
+          single_instance: bool,
+          seccomp_filter: str = None) -> list:
+    plan = SandboxLauncher(binary_cmd=app,
+                           args=[],
+                           app="Minimal",
+                           path=os.path.dirname(app),
+                           permissions=PermissionBuilder().build(),
+                           seccomp_filter=seccomp_filter,
+                           single_instance=single_instance,
+                           minimal_root=True).build()
+
+    options = plan.options
+    return [
+        options[index + 2] for index, option in enumerate(options)
+        if option in ("--ro-bind", "--ro-bind-try")
+    ]
+
+
+@pytest.fixture(autouse=True)
+def stand_in(monkeypatch) -> None:
+    monkeypatch.setattr(launcher, "BWRAP", BWRAP)
+
+
+def test_minimal_root_binds_app_and_loader(app) -> None:
+    binds = bound(app, single_instance=False)
+
+    assert os.path.dirname(app) in binds
+    assert "/etc/ld.so.cache" in binds
+    assert sandbox_path(BWRAP) not in binds
+
+
+def test_seccomp_single_instance_binds_bwrap(app, tmp_path) -> None:
+    # Forwarded launches run a nested bwrap to install the filter
+    seccomp = tmp_path / "filter.bpf"
+    seccomp.write_bytes(b"")
+
+    assert sandbox_path(BWRAP) in bound(
+        app, single_instance=True, seccomp_filter=str(seccomp))
+
+
+def test_seccomp_without_single_instance(app, tmp_path) -> None:
+    seccomp = tmp_path / "filter.bpf"
+    seccomp.write_bytes(b"")
+
+    assert sandbox_path(BWRAP) not in bound(
+        app, single_instance=False, seccomp_filter=str(seccomp))
@@ -0,0 +1,24 @@
+import os
+
+from src.logs import RotatingLog
+
+
+def test_writers_share_rotation(tmp_path) -> None:
+    filename = str(tmp_path / "app.log")
+    first = RotatingLog(filename, max_bytes=8, backups=3)
+    second = RotatingLog(filename, max_bytes=8, backups=3)
+
+    for index in range(4):
+        (first if index % 2 else second).write(f"line {index}\n".encode())
+
+    first.close()
+    second.close()
+
+    # Each write went to the current log, which the other writer rotated
+    logs = [filename + suffix for suffix in ("", ".1", ".2", ".3")]
+
+    for log in logs:
+        assert os.path.getsize(log) == len("line 0\n")
+
+    with open(filename) as fp:
+        assert fp.read() == "line 3\n"
@@ -0,0 +1,40 @@
+from src.plan import LaunchPlan, remove_plan
+from src.store import config_store
+
+
+def saved_plan(app: str) -> LaunchPlan:
+    config_store().put(app, {"app": app, "cmd": "/bin/true"})
+
+    plan = LaunchPlan(app=app,
+                      options=["--unshare-all"],
+                      binary_cmd="/bin/true")
+    plan.save()
+
+    return plan
+
+
+def test_plan_survives_other_apps_changes() -> None:
+    saved_plan("Editor")
+    saved_plan("Browser")
+
+    config_store().update("Browser", single_instance=True)
+
+    assert LaunchPlan.load("Editor") is not None
+    assert LaunchPlan.load("Browser") is None
+
+
+def test_plan_stale_after_own_change() -> None:
+    saved_plan("Player")
+
+    assert LaunchPlan.load("Player") is not None
+
+    config_store().put("Player", {"app": "Player", "cmd": "/bin/false"})
+
+    assert LaunchPlan.load("Player") is None
+
+
+def test_removed_plan() -> None:
+    saved_plan("Viewer")
+    remove_plan("Viewer")
+
+    assert LaunchPlan.load("Viewer") is None
@@ -0,0 +1,33 @@
+import json, socket
+
+import pytest
+
+from src.pool import SandboxPool
+
+
+def handle(request: bytes) -> dict:
+    client, server = socket.socketpair()
+
+    with client, server:
+        client.sendall(request)
+        SandboxPool()._handle(server)
+
+        return json.loads(client.makefile("rb").readline())
+
+
+@pytest.mark.parametrize("request_line", [
+    b"not json\n",
+    b"[]\n",
+    b'{"app": "Browser"}\n',
+    b'{"app": 1, "args": []}\n',
+    b'{"app": "Browser", "args": [1]}\n',
+])
+def test_invalid_request_is_answered(request_line) -> None:
+    reply = handle(request_line)
+
+    assert reply["ok"] is False
+    assert reply["error"]
+
+
+def test_app_without_pool() -> None:
+    assert handle(b'{"app": "Browser", "args": []}\n') == {"ok": False}
@@ -0,0 +1,14 @@
+from src.trace import percentile
+
+
+def test_percentile_nearest_rank() -> None:
+    values = list(range(20, 0, -1))
+
+    assert percentile(values, 0.5) == 10
+    assert percentile(values, 0.95) == 19
+    assert percentile(values, 1.0) == 20
+
+
+def test_percentile_of_few_values() -> None:
+    assert percentile([3.0], 0.95) == 3.0
+    assert percentile([1.0, 2.0], 0.95) == 2.0
@@ -0,0 +1,25 @@
+from src.usage import (LaunchUsage, RECORD, read_usage, record_usage,
+                       usage_filename)
+
+
+def usage(started: float) -> LaunchUsage:
+    return LaunchUsage(started=started,
+                       wall=1.5,
+                       user=0.25,
+                       system=0.125,
+                       peak_memory=1 << 20,
+                       read_bytes=4096,
+                       written_bytes=512,
+                       status=0)
+
+
+def test_torn_record_is_dropped() -> None:
+    record_usage("Torn", usage(1.0))
+
+    # A launcher that crashed halfway through its write
+    with open(usage_filename("Torn"), "ab") as fp:
+        fp.write(usage(2.0).pack()[:RECORD.size // 2])
+
+    record_usage("Torn", usage(3.0))
+
+    assert [record.started for record in read_usage("Torn")] == [1.0, 3.0]
@@ -0,0 +1,36 @@
+#!/bin/python3
+
+import argparse, json, sys
+from src.trace import aggregate_traces, trace_files
+
+parser = argparse.ArgumentParser(
+    description='Launch time per phase from sandbox-launch --trace files')
+
+parser.add_argument('--app', help="Only traces of this application")
+parser.add_argument('-n',
+                    '--last',
+                    type=int,
+                    default=50,
+                    help="Number of recent launches to include")
+parser.add_argument('--json', action='store_true', help="Print JSON")
+
+args = parser.parse_args()
+
+filenames = trace_files(args.app)[-args.last:]
+
+if not filenames:
+    sys.exit("No traces, launch with sandbox-launch --trace first")
+
+phases = aggregate_traces(filenames)
+
+if args.json:
+    print(json.dumps({"launches": len(filenames), "phases": phases}, indent=4))
+    sys.exit()
+
+print(f"{len(filenames)} launches")
+print("------------------")
+print(f"{'phase':16} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+
+for name, stats in phases.items():
+    print(f"{name:16} {stats['count']:6} {stats['p50_ms']:10.3f} "
+          f"{stats['p95_ms']:10.3f} {stats['max_ms']:10.3f}")
@@ -6,3 +6,12 @@ rm -rf ~/.sandbox_manager
 rm /usr/bin/sandbox-create
 rm /usr/bin/sandbox-launch
 rm /usr/bin/sandbox-remove
+rm /usr/bin/sandbox-logs
+rm /usr/bin/sandbox-pool
+rm /usr/bin/sandbox-list
+rm /usr/bin/sandbox-seccomp
+rm /usr/bin/sandbox-freeze
+rm /usr/bin/sandbox-thaw
+rm /usr/bin/sandbox-trace
+rm /usr/bin/sandbox-stats
+rm /usr/bin/sandbox-diagnose